@@ -0,0 +1,190 @@
+# Benchmarks of the trading package, to catch slowdowns between commits.
+#
+# Usage:
+#     python benchmark.py                      # quick sizes, results printed as JSON
+#     python benchmark.py --full -o bench.json # every size, results written to bench.json
+#
+# Every case uses fixed seeds, so two runs on the same machine time the same work.
+# Compare the "seconds" of each case (best of --repeat runs) between two commits.
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+import trading.data as data
+import trading.indicators as indicators
+import trading.process as process
+import trading.strategy as strategy
+import trading.performance as performance
+from trading import store
+
+
+# (number of stocks, number of years) of the price data
+QUICK_SIZES = [(20, 5), (200, 5), (20, 50)]
+FULL_SIZES = [(20, 5), (200, 5), (2000, 5), (10000, 5), (20, 50), (200, 50), (2000, 50)]
+
+# number of transactions of the ledgers
+QUICK_ROWS = [10**3, 10**4, 10**5]
+FULL_ROWS = [10**3, 10**4, 10**5, 10**6]
+
+SEED = 2020
+
+
+def timed(function, repeat):
+    '''
+    Runs function repeat times, with its printing silenced.
+
+    Output:
+        best and mean time of a run (in seconds)
+    '''
+    times = []
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            started = time.perf_counter()
+            function()
+            times.append(time.perf_counter() - started)
+    return min(times), sum(times) / len(times)
+
+
+def make_prices(num_of_stock, days):
+    # same prices for the same size on every run
+    rng = np.random.default_rng([SEED, num_of_stock, days])
+    initial_price = rng.uniform(10, 500, num_of_stock).round(2)
+    volatility = rng.uniform(1, 5, num_of_stock).round(2)
+    stock_prices = data.generate_stock_prices(days, initial_price, volatility, seed=[SEED, num_of_stock, days])[:, :, 0]
+    return initial_price, volatility, stock_prices
+
+
+def make_ledger(path, num_of_record, num_of_stock=200, days=1825):
+    # random buys and sells, written with process.Ledger like the strategies do
+    rng = np.random.default_rng([SEED, num_of_record])
+    ledger = process.Ledger(path, mode='w')
+    date = np.sort(rng.integers(0, days, num_of_record))
+    stock = rng.integers(0, num_of_stock, num_of_record)
+    shares = rng.integers(1, 100, num_of_record)
+    price = rng.uniform(10, 500, num_of_record).round(2)
+    side = rng.choice(['buy', 'sell'], num_of_record)
+    for k in range(num_of_record):
+        ledger.record(side[k], int(date[k]), int(stock[k]), int(shares[k]), float(price[k]), 20)
+    ledger.flush()
+
+
+def price_cases(num_of_stock, years, workdir):
+    days = 365 * years
+    initial_price, volatility, stock_prices = make_prices(num_of_stock, days)
+    text_file = os.path.join(workdir, 'prices.txt')
+    store_file = os.path.join(workdir, 'prices.bin')
+    np.savetxt(text_file, np.vstack((volatility, stock_prices)), fmt='%.2f')
+    store.write_price_store(store_file, stock_prices, volatility, initial_price)
+    queries = list(initial_price[:min(num_of_stock, 20)])
+    ledger = os.path.join(workdir, 'ledger.txt')
+    finaldate = days - 1
+
+    # one stock with the per-day loop, all of them with the batched generator
+    yield 'data.generate_stock_price', lambda: data.generate_stock_price(days, 150, 3.0, seed=SEED)
+    yield 'data.generate_stock_prices', lambda: data.generate_stock_prices(days, initial_price, volatility, seed=SEED)
+    yield 'data.get_data(read, text)', lambda: data.get_data(method='read', initial_price=queries,
+                                                             finaldate=finaldate, data_file=text_file)
+    yield 'data.get_data(read, store)', lambda: np.array(data.get_data(method='read', initial_price=queries,
+                                                                       finaldate=finaldate, data_file=store_file))
+
+    yield 'indicators.moving_average', lambda: indicators.moving_average(stock_prices, n=200)
+    yield 'indicators.moving_average(weighted)', lambda: indicators.moving_average(stock_prices, n=50,
+                                                                                   weights=list(np.linspace(0.5, 1.5, 50)))
+    yield 'indicators.oscillator(stochastic)', lambda: indicators.oscillator(stock_prices, n=200, osc_type='stochastic')
+    yield 'indicators.oscillator(RSI)', lambda: indicators.oscillator(stock_prices, n=200, osc_type='RSI')
+    yield 'indicators.exponential_average', lambda: indicators.exponential_average(stock_prices, n=200)
+    yield 'indicators.bollinger_bands', lambda: indicators.bollinger_bands(stock_prices, n=200)
+    yield 'indicators.macd', lambda: indicators.macd(stock_prices)
+
+    # cache=None so that every run computes its indicators
+    yield 'strategy.crossing_averages', lambda: strategy.crossing_averages(stock_prices, ledger=ledger, graph=False,
+                                                                           finaldate=finaldate, cache=None)
+    yield 'strategy.momentum', lambda: strategy.momentum(stock_prices, ledger=ledger, finaldate=finaldate, cache=None)
+    yield 'strategy.bollinger', lambda: strategy.bollinger(stock_prices, ledger=ledger, finaldate=finaldate, cache=None)
+    yield 'strategy.macd', lambda: strategy.macd(stock_prices, ledger=ledger, finaldate=finaldate, cache=None)
+    yield 'strategy.random', lambda: strategy.random(stock_prices, ledger=ledger, finaldate=finaldate, seed=SEED)
+
+
+def ledger_cases(num_of_record, workdir):
+    for extension in ('.txt', store.LEDGER_EXTENSION):
+        path = os.path.join(workdir, 'ledger_bench' + extension)
+        make_ledger(path, num_of_record)
+        kind = 'text' if extension == '.txt' else 'binary'
+        yield 'performance.read_ledger({})'.format(kind), lambda path=path: performance.read_ledger(path, graph=False)
+        yield 'performance.read_profit({})'.format(kind), lambda path=path: performance.read_profit(path)
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run(sizes, rows, repeat, only=None):
+    '''
+    Runs every case and returns the results as a list of dicts.
+
+    Input:
+        sizes (list): (number of stocks, number of years) of the price data
+        rows (list): number of transactions of the ledgers
+        repeat (int): runs of each case
+        only (str, default None): only run the cases whose name contains it
+    '''
+    results = []
+    workdir = tempfile.mkdtemp(prefix='benchmark_')
+    try:
+        def record(name, params, function):
+            if only != None and only not in name:
+                return
+            best, mean = timed(function, repeat)
+            results.append({'name': name, 'params': params, 'seconds': best, 'mean_seconds': mean, 'repeat': repeat})
+            print('{:<40} {:<32} {:10.4f} s'.format(name, json.dumps(params), best), file=sys.stderr)
+
+        for num_of_stock, years in sizes:
+            for name, function in price_cases(num_of_stock, years, workdir):
+                record(name, {'stocks': num_of_stock, 'years': years}, function)
+        for num_of_record in rows:
+            for name, function in ledger_cases(num_of_record, workdir):
+                record(name, {'rows': num_of_record}, function)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks of the trading package.')
+    parser.add_argument('--full', action='store_true', help='run every size (up to 10,000 stocks, 50 years, 10^6 rows)')
+    parser.add_argument('--repeat', type=int, default=3, help='runs of each case, the best one is kept (default 3)')
+    parser.add_argument('--only', default=None, help='only run the cases whose name contains this')
+    parser.add_argument('-o', '--output', default=None, help='JSON file to write (default: print it)')
+    args = parser.parse_args()
+
+    sizes, rows = (FULL_SIZES, FULL_ROWS) if args.full else (QUICK_SIZES, QUICK_ROWS)
+    report = {'commit': git_commit(),
+              'python': platform.python_version(),
+              'numpy': np.__version__,
+              'machine': platform.platform(),
+              'processor': platform.processor(),
+              'cpus': os.cpu_count(),
+              'seed': SEED,
+              'results': run(sizes, rows, args.repeat, args.only)}
+
+    if args.output == None:
+        print(json.dumps(report, indent=2))
+    else:
+        with open(args.output, 'w') as writefile:
+            json.dump(report, writefile, indent=2)
+
+
+if __name__ == '__main__':
+    main()
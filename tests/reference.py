@@ -0,0 +1,316 @@
+# The original day-by-day loops of the package, kept as references for the
+# faster functions that replaced them. Only used by the tests.
+import numpy as np
+
+
+def log_transaction(transaction_type, date, stock, number_of_shares, price, fees, ledger_file):
+    with open(ledger_file, 'a') as filewrite:
+        if transaction_type == 'buy':
+            filewrite.write('{},{},{},{},{},{}\n'.format(transaction_type, date, stock,
+            int(number_of_shares), '%.2f'%float(price), '%.2f'%float(-1 * number_of_shares * price - fees)))
+        if transaction_type == 'sell':
+            filewrite.write('{},{},{},{},{},{}\n'.format(transaction_type, date, stock,
+            int(number_of_shares), '%.2f'%float(price), '%.2f'%float(number_of_shares * price - fees)))
+
+
+def buy(date, stock, available_capital, stock_prices, fees, portfolio, ledger_file):
+    amount_can_buy = (available_capital - fees) // stock_prices[date, stock]
+    portfolio[stock] = portfolio[stock] + amount_can_buy
+    log_transaction('buy', date, stock, amount_can_buy, stock_prices[date,stock], fees, ledger_file)
+
+
+def sell(date, stock, stock_prices, fees, portfolio, ledger_file):
+    if portfolio[stock] != 0:
+        log_transaction('sell', date, stock, portfolio[stock], stock_prices[date,stock], fees, ledger_file)
+        portfolio[stock] = 0
+
+
+def create_portfolio(available_amounts, stock_prices, fees, ledger_file):
+    num_of_stock = stock_prices.shape[1]
+    portfolio = [None] * num_of_stock
+    for i in range(num_of_stock):
+        portfolio[i] = int( (available_amounts[i] - fees) // stock_prices[0, i] )
+    for i in range(num_of_stock):
+        log_transaction('buy', 0, i, portfolio[i], stock_prices[0,i], fees, ledger_file)
+    return portfolio
+
+
+def moving_average(stock_price, n=7, weights=[]):
+    ma = []
+    for i in range(n-1, stock_price.shape[0]):
+        if np.isnan(stock_price[i,0]) == True: # cut from the first 'nan' value
+            stock_price = stock_price[:i, :]
+            break
+    days = stock_price.shape[0]
+    for i in range(n-1, days):
+        if weights == []:
+            ma.append(np.sum(stock_price[i-n+1:i+1, 0]) / n)
+        else:
+            ma.append(np.dot(np.array(weights), stock_price[i-n+1:i+1, 0]))
+    return np.array(ma)
+
+
+def crossing_averages(stock_prices, SMAperiod=200, FMAperiod=50, SMAweights=[], FMAweights=[], amount=5000, fees=20, ledger='ledger_crossing_averages.txt', finaldate=1824):
+    with open(ledger, 'w') as writefile:
+        writefile.truncate()
+
+    num_of_stock = stock_prices.shape[1]
+    portfolio = create_portfolio([amount]*num_of_stock, stock_prices, fees, ledger)
+
+    if SMAperiod < FMAperiod:
+        return 'Error with periods (SMAperiod < FMAperiod)'
+
+    for s in range(num_of_stock):
+        s_SMA = moving_average(stock_prices[:,s:s+1], n=SMAperiod, weights=SMAweights)
+        s_FMA = moving_average(stock_prices[:,s:s+1], n=FMAperiod, weights=FMAweights)[SMAperiod-FMAperiod:]
+
+        i = SMAperiod
+        sign = [] # position of SMA and FMA [>, =, <]:[-1,0,1]
+
+        while i < finaldate:
+            if np.isnan(stock_prices[i, s]) == True:
+                sell(i, s, np.zeros((finaldate+1,num_of_stock)), 0, portfolio, ledger) # throw it away
+                break
+            elif np.isnan(stock_prices[i, s]) == False:
+                if s_SMA[i-SMAperiod] < s_FMA[i-SMAperiod]:
+                    sign.append(1)
+                elif s_SMA[i-SMAperiod] > s_FMA[i-SMAperiod]:
+                    sign.append(-1)
+                else:
+                    sign.append(0)
+
+            if i > SMAperiod:
+                if sign[-1] - sign[-2] > 0:
+                    buy(i, s, amount, stock_prices, fees, portfolio, ledger)
+                elif sign[-1] - sign[-2] < 0:
+                    sell(i, s, stock_prices, fees, portfolio, ledger)
+
+            i += 1
+
+    # the sell-off looks at the last stock only, as the original did
+    for f in range(num_of_stock):
+        if np.isnan(stock_prices[finaldate, s]) == False:
+            sell(finaldate, f, stock_prices, fees, portfolio, ledger)
+
+
+def oscillator(stock_price, n=7, osc_type='stochastic'):
+    osc = []
+    for i in range(n-1, stock_price.shape[0]):
+        if np.isnan(stock_price[i,0]) == True: # cut from the first 'nan' value
+            stock_price = stock_price[:i, :]
+            break
+    days = stock_price.shape[0]
+
+    if osc_type == 'stochastic':
+        for i in range(n-1, days):
+            delta = abs(stock_price[i, 0] - min(stock_price[i+1-n:i+1, 0]))
+            delta_max = abs(max(stock_price[i+1-n:i+1, 0]) - min(stock_price[i+1-n:i+1, 0]))
+            if delta_max == 0:
+                osc.append(1)
+            else:
+                osc.append(delta / delta_max)
+
+    elif osc_type == 'RSI':
+        for i in range(n-1, days):
+            days_diff_pos = []
+            days_diff_neg = []
+            for j in range(n-1):
+                if stock_price[i-j, 0] - stock_price[i-1-j, 0] > 0:
+                    days_diff_pos.append(stock_price[i-j, 0] - stock_price[i-1-j, 0])
+                elif stock_price[i-j, 0] - stock_price[i-1-j, 0] < 0:
+                    days_diff_neg.append(stock_price[i-j, 0] - stock_price[i-1-j, 0])
+
+            if len(days_diff_neg) == 0:
+                osc.append(1)
+            elif len(days_diff_pos) == 0:
+                osc.append(0)
+            else:
+                diff_pos_aver = sum(days_diff_pos) / len(days_diff_pos)
+                diff_neg_aver = abs(sum(days_diff_neg) / len(days_diff_neg))
+                RS = diff_pos_aver / diff_neg_aver
+                osc.append(1 - (1 / (1 + RS)))
+
+    return np.array(osc)
+
+
+def momentum(stock_prices, period=200, minimum_cool_down_period=10, overvalued_threshold=[0.7, 0.8], undervalued_threshold=[0.2, 0.3], osc_method='stochastic', amount=5000, fees=20, ledger='ledger_momentum.txt', finaldate=1824):
+    with open(ledger, 'w') as writefile:
+        writefile.truncate()
+
+    num_of_stock = stock_prices.shape[1]
+    portfolio = create_portfolio([amount]*num_of_stock, stock_prices, fees, ledger)
+
+    for s in range(num_of_stock):
+        i = period
+        s_osc = oscillator(stock_prices[:, s:s+1], n = period, osc_type = osc_method)
+        while i < finaldate:
+            if np.isnan(stock_prices[i, s]) == True:
+                sell(i, s, np.zeros((finaldate+1,num_of_stock)), 0, portfolio, ledger) # throw it away
+                break
+
+            if s_osc[i-period] > overvalued_threshold[0] and s_osc[i-period] < overvalued_threshold[1]:
+                sell(i, s, stock_prices, fees, portfolio, ledger)
+                i = i + minimum_cool_down_period - 1 # skip some days if we bought or sold
+            elif s_osc[i-period] > undervalued_threshold[0] and s_osc[i-period] < undervalued_threshold[1]:
+                buy(i, s, amount, stock_prices, fees, portfolio, ledger)
+                i = i + minimum_cool_down_period - 1 # skip some days if we bought or sold
+
+            i += 1
+
+    # the sell-off looks at the last stock only, as the original did
+    for f in range(num_of_stock):
+        if np.isnan(stock_prices[finaldate, s]) == False:
+            sell(finaldate, f, stock_prices, fees, portfolio, ledger)
+
+
+def random(stock_prices, period=7, amount=5000, fees=20, ledger='ledger_random.txt', finaldate=1824, seed=None):
+    # the original loop, with a seed for the generator
+    with open(ledger, 'w') as writefile:
+        writefile.truncate()
+
+    num_of_stock = stock_prices.shape[1]
+    portfolio = create_portfolio([amount]*num_of_stock, stock_prices, fees, ledger)
+
+    rng = np.random.default_rng(seed)
+
+    for s in range(num_of_stock):
+        i = 1
+        while period*i < finaldate:
+            if np.isnan(stock_prices[period*i, s]) == True:
+                sell(period*i, s, np.zeros((finaldate+1, num_of_stock)), 0, portfolio, ledger) # throw it away
+                break
+            elif np.isnan(stock_prices[period*i, s]) == False:
+                dowhat = rng.choice(['buy','do_nothing','sell'], p = [1/3, 1/3, 1/3])
+                if dowhat == 'buy':
+                    buy(period*i, s, amount, stock_prices, fees, portfolio, ledger)
+                elif dowhat == 'sell':
+                    sell(period*i, s, stock_prices, fees, portfolio, ledger)
+            i += 1
+
+    # the sell-off looks at the last stock only, as the original did
+    for f in range(num_of_stock):
+        if np.isnan(stock_prices[finaldate, s]) == False:
+            sell(finaldate, f, stock_prices, fees, portfolio, ledger)
+
+
+# Plain day-by-day loops for the indicators and strategies that came later,
+# written the same way as the original ones.
+
+def exponential_average(stock_price, n=7):
+    for i in range(n-1, stock_price.shape[0]):
+        if np.isnan(stock_price[i,0]) == True: # cut from the first 'nan' value
+            stock_price = stock_price[:i, :]
+            break
+    alpha = 2 / (n + 1)
+    ema = []
+    for i in range(n-1, stock_price.shape[0]):
+        if i == n-1:
+            ema.append(np.sum(stock_price[:n, 0]) / n)
+        else:
+            ema.append(alpha * stock_price[i, 0] + (1 - alpha) * ema[-1])
+    return np.array(ema)
+
+
+def bollinger_bands(stock_price, n=20, k=2):
+    for i in range(n-1, stock_price.shape[0]):
+        if np.isnan(stock_price[i,0]) == True: # cut from the first 'nan' value
+            stock_price = stock_price[:i, :]
+            break
+    middle, upper, lower = [], [], []
+    for i in range(n-1, stock_price.shape[0]):
+        window = stock_price[i-n+1:i+1, 0]
+        mean = np.sum(window) / n
+        std = np.sqrt(np.sum((window - mean) ** 2) / n)
+        middle.append(mean)
+        upper.append(mean + k * std)
+        lower.append(mean - k * std)
+    return np.array(middle), np.array(upper), np.array(lower)
+
+
+def macd(stock_price, fast=12, slow=26, signal=9):
+    m = max(fast, slow) + signal - 1
+    for i in range(m-1, stock_price.shape[0]):
+        if np.isnan(stock_price[i,0]) == True: # cut from the first 'nan' value
+            stock_price = stock_price[:i, :]
+            break
+    fast_ema = exponential_average(stock_price, fast)
+    slow_ema = exponential_average(stock_price, slow)
+    line = fast_ema[max(fast, slow) - fast:] - slow_ema[max(fast, slow) - slow:]
+    signal_line = exponential_average(line.reshape(-1, 1), signal)
+    line = line[signal-1:]
+    return line, signal_line, line - signal_line
+
+
+def bollinger(stock_prices, period=20, num_std=2, amount=5000, fees=20, ledger='ledger_bollinger.txt', finaldate=1824):
+    # with the bands of trading.indicators, to check the decisions only
+    from trading import indicators as indic
+    with open(ledger, 'w') as writefile:
+        writefile.truncate()
+
+    num_of_stock = stock_prices.shape[1]
+    portfolio = create_portfolio([amount]*num_of_stock, stock_prices, fees, ledger)
+
+    for s in range(num_of_stock):
+        _, upper, lower = indic.bollinger_bands(stock_prices[:, s:s+1], n=period, k=num_std)
+        i = period
+        position = [] # price [above, inside, below] the bands:[1,0,-1], on the day before
+        while i < finaldate:
+            if np.isnan(stock_prices[i, s]) == True:
+                sell(i, s, np.zeros((finaldate+1,num_of_stock)), 0, portfolio, ledger) # throw it away
+                break
+            if stock_prices[i-1, s] > upper[i-period]:
+                position.append(1)
+            elif stock_prices[i-1, s] < lower[i-period]:
+                position.append(-1)
+            else:
+                position.append(0)
+
+            if i > period and position[-1] != position[-2]:
+                if position[-1] < 0:
+                    buy(i, s, amount, stock_prices, fees, portfolio, ledger)
+                elif position[-1] > 0:
+                    sell(i, s, stock_prices, fees, portfolio, ledger)
+            i += 1
+
+    # the sell-off looks at the last stock only, as the original loops did
+    for f in range(num_of_stock):
+        if np.isnan(stock_prices[finaldate, s]) == False:
+            sell(finaldate, f, stock_prices, fees, portfolio, ledger)
+
+
+def macd_crossing(stock_prices, fast_period=12, slow_period=26, signal_period=9, amount=5000, fees=20, ledger='ledger_macd.txt', finaldate=1824):
+    # with the MACD of trading.indicators, to check the decisions only
+    from trading import indicators as indic
+    with open(ledger, 'w') as writefile:
+        writefile.truncate()
+
+    num_of_stock = stock_prices.shape[1]
+    portfolio = create_portfolio([amount]*num_of_stock, stock_prices, fees, ledger)
+    period = max(fast_period, slow_period) + signal_period - 1
+
+    for s in range(num_of_stock):
+        line, signal_line, _ = indic.macd(stock_prices[:, s:s+1], fast=fast_period, slow=slow_period, signal=signal_period)
+        i = period
+        sign = [] # position of the signal and MACD lines [>, =, <]:[-1,0,1]
+        while i < finaldate:
+            if np.isnan(stock_prices[i, s]) == True:
+                sell(i, s, np.zeros((finaldate+1,num_of_stock)), 0, portfolio, ledger) # throw it away
+                break
+            if signal_line[i-period] < line[i-period]:
+                sign.append(1)
+            elif signal_line[i-period] > line[i-period]:
+                sign.append(-1)
+            else:
+                sign.append(0)
+
+            if i > period:
+                if sign[-1] - sign[-2] > 0:
+                    buy(i, s, amount, stock_prices, fees, portfolio, ledger)
+                elif sign[-1] - sign[-2] < 0:
+                    sell(i, s, stock_prices, fees, portfolio, ledger)
+            i += 1
+
+    # the sell-off looks at the last stock only, as the original loops did
+    for f in range(num_of_stock):
+        if np.isnan(stock_prices[finaldate, s]) == False:
+            sell(finaldate, f, stock_prices, fees, portfolio, ledger)
@@ -0,0 +1,59 @@
+# The vectorized random baseline must give, run by run, the profit and the
+# number of transactions of the original random loop with the same seed.
+import os
+import numpy as np
+import pytest
+from trading import baseline
+from trading import strategy
+from trading import performance as perf
+from tests import reference
+
+
+DATA_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'stock_data_5y.txt')
+NUM_OF_RUNS = 12
+
+
+def reference_runs(tmp_path, stock_prices, seed, **kwargs):
+    profit, trades = [], []
+    for k, child in enumerate(np.random.SeedSequence(seed).spawn(NUM_OF_RUNS)):
+        ledger = str(tmp_path / 'ledger_{}.txt'.format(k))
+        reference.random(stock_prices, ledger=ledger, seed=child, **kwargs)
+        profit.append(perf.read_profit(ledger))
+        with open(ledger) as readfile:
+            trades.append(len(readfile.readlines()))
+    return np.array(profit), np.array(trades)
+
+
+@pytest.mark.parametrize('kwargs', [{}, {'period': 30, 'fees': 5}, {'period': 3, 'finaldate': 400}])
+@pytest.mark.parametrize('delisted', [False, True])
+def test_random_baseline_matches_loop(tmp_path, delisted, kwargs):
+    stock_prices = np.loadtxt(DATA_FILE)[1:]
+    if delisted:
+        stock_prices[300:, 4] = np.nan
+        stock_prices[1500:, 11] = np.nan
+    report = baseline.random_baseline(stock_prices, NUM_OF_RUNS, seed=2020, workers=1, chunksize=5, **kwargs)
+    profit, trades = reference_runs(tmp_path, stock_prices, 2020, **kwargs)
+
+    np.testing.assert_allclose(report['profit'], profit, rtol=0, atol=1e-6)
+    np.testing.assert_array_equal(report['trades'], trades)
+
+
+def test_random_ledger_matches_loop(tmp_path):
+    stock_prices = np.loadtxt(DATA_FILE)[1:]
+    for k, child in enumerate(np.random.SeedSequence(7).spawn(3)):
+        new, old = str(tmp_path / 'new_{}.txt'.format(k)), str(tmp_path / 'old_{}.txt'.format(k))
+        strategy.random(stock_prices, ledger=new, seed=child)
+        reference.random(stock_prices, ledger=old, seed=child)
+        with open(new) as readfile_new, open(old) as readfile_old:
+            assert readfile_new.read() == readfile_old.read()
+
+
+def test_draws_match_generator_choice():
+    # random_profit() maps each uniform draw through _CDF, as Generator.choice() does
+    rng = np.random.default_rng(2020)
+    choices = [rng.choice(['buy', 'do_nothing', 'sell'], p=[1/3, 1/3, 1/3]) for _ in range(20000)]
+    draws = np.random.default_rng(2020).random(20000)
+    buy = draws < baseline._CDF[0]
+    sell = draws >= baseline._CDF[1]
+    assert np.array_equal(buy, np.array(choices) == 'buy')
+    assert np.array_equal(sell, np.array(choices) == 'sell')
@@ -0,0 +1,66 @@
+# The indicators of all the stocks at once must match plain loops over each stock (see reference.py).
+import os
+import numpy as np
+import pytest
+from trading import indicators as indic
+from tests import reference
+
+
+DATA_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'stock_data_5y.txt')
+
+
+@pytest.fixture(scope='module')
+def stock_prices():
+    prices = np.loadtxt(DATA_FILE)[1:]
+    # more missing prices, early and in the middle
+    prices[60:, 2] = np.nan
+    prices[999:, 19] = np.nan
+    return prices
+
+
+def same_columns(values, reference_values):
+    # each column up to its cut, then 'nan' padding
+    assert values.shape[0] >= reference_values.shape[0]
+    np.testing.assert_allclose(values[:reference_values.shape[0]], reference_values, rtol=1e-12, atol=1e-9)
+    assert np.all(np.isnan(values[reference_values.shape[0]:]))
+
+
+@pytest.mark.parametrize('n', [1, 2, 12, 26, 200])
+def test_exponential_average(stock_prices, n):
+    ema = indic.exponential_average(stock_prices, n=n)
+    for s in range(stock_prices.shape[1]):
+        same_columns(ema[:, s], reference.exponential_average(stock_prices[:, s:s+1], n=n))
+    # a single column is cut short
+    assert np.array_equal(indic.exponential_average(stock_prices[:, 2], n=n), ema[:, 2][~np.isnan(ema[:, 2])])
+
+
+@pytest.mark.parametrize('n, k', [(2, 2), (5, 1), (20, 2), (50, 2.5)])
+def test_bollinger_bands(stock_prices, n, k):
+    bands = indic.bollinger_bands(stock_prices, n=n, k=k)
+    for s in range(stock_prices.shape[1]):
+        for band, reference_band in zip(bands, reference.bollinger_bands(stock_prices[:, s:s+1], n=n, k=k)):
+            same_columns(band[:, s], reference_band)
+
+
+def test_bollinger_bands_high_prices():
+    # small moves on high prices: the variance must not cancel out
+    prices = 1e6 + np.random.default_rng(3).normal(0, 1e-3, size=(300, 4)).cumsum(axis=0)
+    bands = indic.bollinger_bands(prices, n=10)
+    for s in range(prices.shape[1]):
+        for band, reference_band in zip(bands, reference.bollinger_bands(prices[:, s:s+1], n=10)):
+            np.testing.assert_allclose(band[:, s], reference_band, rtol=0, atol=1e-9)
+
+
+@pytest.mark.parametrize('fast, slow, signal', [(12, 26, 9), (3, 10, 4), (26, 12, 9), (50, 100, 20)])
+def test_macd(stock_prices, fast, slow, signal):
+    lines = indic.macd(stock_prices, fast=fast, slow=slow, signal=signal)
+    for s in range(stock_prices.shape[1]):
+        for line, reference_line in zip(lines, reference.macd(stock_prices[:, s:s+1], fast=fast, slow=slow, signal=signal)):
+            same_columns(line[:, s], reference_line)
+    assert lines[0].shape[0] == stock_prices.shape[0] - indic.macd_period(fast, slow, signal) + 1
+
+
+def test_too_few_days(stock_prices):
+    assert indic.exponential_average(stock_prices[:5], n=10).shape == (0, stock_prices.shape[1])
+    assert all(band.shape == (0,) for band in indic.bollinger_bands(stock_prices[:5, 0], n=10))
+    assert all(line.shape == (0, stock_prices.shape[1]) for line in indic.macd(stock_prices[:30]))
@@ -0,0 +1,62 @@
+# The grid search must trade each combination like the original loops (see reference.py).
+import os
+import numpy as np
+import pytest
+from trading import optimize
+from trading import strategy
+from tests import reference
+
+
+DATA_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'stock_data_5y.txt')
+
+
+@pytest.fixture(scope='module')
+def stock_prices():
+    return np.loadtxt(DATA_FILE)[1:]
+
+
+def test_grid_search_rsi_ledgers(tmp_path, stock_prices):
+    # RSI values a rounding error away from the thresholds 0.3 and 0.5
+    param_grid = {'period': [3, 5, 20], 'minimum_cool_down_period': [1, 10], 'osc_method': ['RSI'],
+                  'overvalued_threshold': [[0.7, 0.8], [0.5, 1.0]]}
+    table = optimize.grid_search(stock_prices, 'momentum', param_grid, workers=1, ledger_dir=str(tmp_path))
+    combinations = optimize.parameter_combinations('momentum', param_grid)
+
+    for k, params in enumerate(combinations):
+        old = str(tmp_path / 'old.txt')
+        reference.momentum(stock_prices, ledger=old, **params)
+        with open(str(tmp_path / 'momentum_{}.txt'.format(k))) as readfile_new, open(old) as readfile_old:
+            assert readfile_new.read() == readfile_old.read()
+        assert table['profit'][k] == pytest.approx(np.loadtxt(old, delimiter=',', usecols=5).sum())
+
+
+def exact_indicators(stock_prices, keys):
+    # the indicators of the original loops, stock by stock
+    days, num_of_stock = stock_prices.shape
+    indicators = {}
+    for kind, n, option in keys:
+        columns = np.full((days, num_of_stock), np.nan)
+        for s in range(num_of_stock):
+            if kind == 'moving_average':
+                values = reference.moving_average(stock_prices[:, s:s+1], n=n, weights=list(option))
+            else:
+                values = reference.oscillator(stock_prices[:, s:s+1], n=n, osc_type=option)
+            columns[:, s] = strategy.align_indicator(values, n, days)[:, 0]
+        indicators[(kind, n, option)] = columns
+    return indicators
+
+
+@pytest.mark.parametrize('strategy_name, param_grid', [
+    ('momentum', {'period': [3, 5, 20], 'minimum_cool_down_period': [1, 3], 'osc_method': ['RSI'],
+                  'overvalued_threshold': [[0.7, 0.8], [0.5, 1.0]]}),
+    ('crossing_averages', {'SMAperiod': [20, 50], 'FMAperiod': [4, 10]}),
+])
+def test_walk_forward_settles_from_history(monkeypatch, stock_prices, strategy_name, param_grid):
+    # the folds that start after day 0 trade like with the indicators of the original loops
+    kwargs = {'train_days': 30, 'test_days': 10, 'workers': 1}
+    folds = optimize.walk_forward(stock_prices, strategy_name, param_grid, **kwargs)
+    monkeypatch.setattr(optimize, 'compute_indicators', exact_indicators)
+    exact = optimize.walk_forward(stock_prices, strategy_name, param_grid, **kwargs)
+
+    for name in ('choice', 'train_profit', 'test_profit', 'test_trades'):
+        assert np.array_equal(folds[name], exact[name], equal_nan=True)
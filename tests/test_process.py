@@ -0,0 +1,87 @@
+import os
+import numpy as np
+import pytest
+from trading import process as proc
+from trading import strategy
+from tests import reference
+
+
+DATA_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'stock_data_5y.txt')
+
+
+def test_create_portfolio_unlimited_cash(tmp_path):
+    # same shares and ledger as the original list portfolio
+    stock_prices = np.array([[100.0, 37.5, 512.25, 7.0]])
+    new, old = str(tmp_path / 'new.txt'), str(tmp_path / 'old.txt')
+    portfolio = proc.create_portfolio([1000] * 4, stock_prices, 20, new)
+    assert list(portfolio) == reference.create_portfolio([1000] * 4, stock_prices, 20, old)
+    with open(new) as readfile_new, open(old) as readfile_old:
+        assert readfile_new.read() == readfile_old.read()
+
+
+def test_create_portfolio_finite_cash():
+    stock_prices = np.full((2, 3), 100.0)
+    ledger = proc.Ledger()
+    portfolio = proc.create_portfolio([1000] * 3, stock_prices, 20, ledger, cash=2500)
+
+    # the first two stocks get their whole amount, the last one what is left
+    assert portfolio.shares.tolist() == [9, 9, 6]
+    assert portfolio.cash == 40
+    assert ledger.records['cashflow'].tolist() == [-920, -920, -620]
+
+
+def test_create_portfolio_cash_runs_out():
+    stock_prices = np.full((2, 3), 100.0)
+    ledger = proc.Ledger()
+    portfolio = proc.create_portfolio([1000] * 3, stock_prices, 20, ledger, cash=1000)
+
+    # the cash left doesn't pay for a share and the fees: not bought, no fees
+    assert portfolio.shares.tolist() == [9, 0, 0]
+    assert portfolio.cash == 80
+    assert ledger.records['stock'].tolist() == [0]
+
+
+def test_buy_many_pays_in_order():
+    stock_prices = np.full((2, 3), 100.0)
+    ledger = proc.Ledger()
+    portfolio = proc.Portfolio([0, 0, 0], cash=1500)
+    bought = portfolio.buy_many(1, [2, 0, 1], 1000, stock_prices, 20, ledger)
+
+    assert bought.tolist() == [9, 5, 0]
+    assert portfolio.cash == 60
+    assert ledger.records['stock'].tolist() == [2, 0]
+
+    portfolio.sell_many(1, [0, 1, 2], stock_prices, 20, ledger)
+    assert portfolio.cash == 60 + 500 - 20 + 900 - 20
+
+
+@pytest.mark.parametrize('cash', [np.inf, 0, 250, 3000, 12345.67])
+def test_buy_many_same_as_buy(cash):
+    # the same shares, cash and ledger as buying the stocks one at a time
+    rng = np.random.default_rng(7)
+    stock_prices = rng.uniform(5, 400, size=(2, 12))
+    stocks = rng.permutation(12)
+    amounts = rng.uniform(100, 2000, size=12)
+    many, one = proc.Ledger(), proc.Ledger()
+    portfolio_many = proc.Portfolio(np.zeros(12), cash=cash)
+    portfolio_one = proc.Portfolio(np.zeros(12), cash=cash)
+
+    portfolio_many.buy_many(1, stocks, amounts, stock_prices, 20, many)
+    for s, amount in zip(stocks, amounts):
+        portfolio_one.buy(1, s, amount, stock_prices, 20, one)
+
+    assert portfolio_many.shares.tolist() == portfolio_one.shares.tolist()
+    assert portfolio_many.cash == pytest.approx(portfolio_one.cash)
+    assert many.lines() == one.lines()
+
+
+def test_strategy_spends_only_its_cash():
+    stock_prices = np.loadtxt(DATA_FILE)[1:]
+    ledger = proc.Ledger()
+    strategy.momentum(stock_prices, period=20, minimum_cool_down_period=3, ledger=ledger, cache=None, cash=30000)
+
+    # trades in date order, and the cash never goes below 0
+    records = ledger.records
+    assert np.all(np.diff(records['date']) >= 0)
+    assert np.all(30000 + np.cumsum(records['cashflow']) >= -1e-6)
+    assert np.any(records['side'] == proc.BUY) and np.any(records['date'][records['side'] == proc.BUY] > 0)
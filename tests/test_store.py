@@ -0,0 +1,30 @@
+import os
+import numpy as np
+from trading import strategy
+from trading import store
+from trading import performance as perf
+
+
+DATA_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'stock_data_5y.txt')
+
+
+def test_binary_ledger_smaller_and_same(tmp_path):
+    stock_prices = np.loadtxt(DATA_FILE)[1:]
+    for kwargs in ({}, {'period': 20, 'osc_method': 'RSI'}):
+        text, binary = str(tmp_path / 'ledger.txt'), str(tmp_path / ('ledger' + store.LEDGER_EXTENSION))
+        strategy.momentum(stock_prices, ledger=text, cache=None, **kwargs)
+        strategy.momentum(stock_prices, ledger=binary, cache=None, **kwargs)
+
+        assert os.path.getsize(binary) < os.path.getsize(text)
+        # the same transactions, amounts rounded to cents as in the text
+        text_records, binary_records = perf.load_ledger(text), perf.load_ledger(binary)
+        for name in text_records.dtype.names:
+            assert np.array_equal(text_records[name], binary_records[name], equal_nan=True)
+
+
+def test_cents_round_like_text():
+    amounts = np.array([0.005, 0.015, 1.005, 2.675, -1050.005, 148.02, -4904.66, 1e6 + 0.125, np.nan])
+    cents = store.to_cents(amounts)
+    assert [float('%.2f' % x) for x in amounts[:-1]] == [c / 100 for c in cents[:-1]]
+    assert cents[-1] == store.NAN_CENTS
+    assert np.isnan(store.from_cents(cents)[-1])
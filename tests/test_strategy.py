@@ -0,0 +1,136 @@
+# The strategies must write the same ledgers as the original loops (see reference.py).
+import os
+import numpy as np
+import pytest
+from trading import process as proc
+from trading import strategy
+from tests import reference
+
+
+DATA_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'stock_data_5y.txt')
+
+
+@pytest.fixture(scope='module')
+def stock_prices():
+    return np.loadtxt(DATA_FILE)[1:]
+
+
+@pytest.fixture(scope='module')
+def delisted(stock_prices):
+    # more missing prices: early, in the middle, and just before the final day
+    prices = stock_prices.copy()
+    prices[200:, 1] = np.nan
+    prices[60:, 2] = np.nan
+    prices[999:, 19] = np.nan
+    return prices
+
+
+def same_ledgers(tmp_path, run, run_reference):
+    new, old = str(tmp_path / 'new.txt'), str(tmp_path / 'old.txt')
+    assert run(new) == run_reference(old)
+    with open(new) as readfile_new, open(old) as readfile_old:
+        assert readfile_new.read() == readfile_old.read()
+
+
+CROSSING_CASES = [
+    {},
+    {'SMAperiod': 50, 'FMAperiod': 50},
+    {'SMAperiod': 20, 'FMAperiod': 4},
+    {'SMAperiod': 30, 'FMAperiod': 10, 'SMAweights': list(np.linspace(0.5, 1.5, 30) / 30),
+     'FMAweights': list(np.linspace(1.5, 0.5, 10) / 10)},
+    {'SMAperiod': 300, 'FMAperiod': 5, 'finaldate': 301},
+    {'SMAperiod': 300, 'FMAperiod': 5, 'finaldate': 250},
+    {'SMAperiod': 60, 'FMAperiod': 20, 'finaldate': 999},
+    {'SMAperiod': 20, 'FMAperiod': 60},
+]
+
+
+@pytest.mark.parametrize('kwargs', CROSSING_CASES)
+@pytest.mark.parametrize('data', ['stock_prices', 'delisted'])
+def test_crossing_averages_ledger(tmp_path, request, data, kwargs):
+    prices = request.getfixturevalue(data)
+    same_ledgers(tmp_path,
+                 lambda ledger: strategy.crossing_averages(prices, ledger=ledger, graph=False, cache=None, **kwargs),
+                 lambda ledger: reference.crossing_averages(prices, ledger=ledger, **kwargs))
+
+
+def test_crossing_averages_single_stock(tmp_path, stock_prices):
+    prices = stock_prices[:, 3:4]
+    same_ledgers(tmp_path,
+                 lambda ledger: strategy.crossing_averages(prices, SMAperiod=20, FMAperiod=5, ledger=ledger, graph=False),
+                 lambda ledger: reference.crossing_averages(prices, SMAperiod=20, FMAperiod=5, ledger=ledger))
+
+
+MOMENTUM_CASES = [
+    {},
+    {'period': 50, 'osc_method': 'RSI'},
+    {'period': 60, 'minimum_cool_down_period': 5, 'finaldate': 999},
+    {'period': 20, 'minimum_cool_down_period': 30},
+    {'period': 10, 'minimum_cool_down_period': 2, 'osc_method': 'RSI'},
+    {'period': 14, 'minimum_cool_down_period': 1, 'osc_method': 'RSI'},
+    # RSI values a rounding error away from the thresholds 0.3 and 0.5
+    {'period': 3, 'minimum_cool_down_period': 1, 'osc_method': 'RSI'},
+    {'period': 5, 'minimum_cool_down_period': 10, 'osc_method': 'RSI'},
+    {'period': 20, 'minimum_cool_down_period': 3, 'osc_method': 'RSI'},
+    {'period': 20, 'osc_method': 'RSI'},
+    {'period': 5, 'minimum_cool_down_period': 1, 'osc_method': 'RSI', 'overvalued_threshold': [0.5, 1.0],
+     'undervalued_threshold': [0.0, 0.5]},
+    {'period': 300, 'finaldate': 301},
+    {'period': 150, 'minimum_cool_down_period': 7, 'overvalued_threshold': [0.5, 1.0],
+     'undervalued_threshold': [0.0, 0.5]},
+]
+
+
+@pytest.mark.parametrize('kwargs', MOMENTUM_CASES)
+@pytest.mark.parametrize('data', ['stock_prices', 'delisted'])
+def test_momentum_ledger(tmp_path, request, data, kwargs):
+    prices = request.getfixturevalue(data)
+    same_ledgers(tmp_path,
+                 lambda ledger: strategy.momentum(prices, ledger=ledger, cache=None, **kwargs),
+                 lambda ledger: reference.momentum(prices, ledger=ledger, **kwargs))
+
+
+@pytest.mark.parametrize('periods', [(26, 12), (12, 12)])
+def test_macd_invalid_periods(tmp_path, stock_prices, periods):
+    # checked before anything is bought: no transactions, no ledger file
+    ledger = tmp_path / 'ledger.txt'
+    book = proc.Ledger()
+    for target in (str(ledger), book):
+        error = strategy.macd(stock_prices, fast_period=periods[0], slow_period=periods[1], ledger=target, cache=None)
+        assert error == 'Error with periods (slow_period <= fast_period)'
+    assert not ledger.exists()
+    assert len(book) == 0
+
+
+BOLLINGER_CASES = [
+    {},
+    {'period': 5, 'num_std': 1},
+    {'period': 50, 'num_std': 2.5, 'finaldate': 999},
+    {'period': 300, 'finaldate': 301},
+]
+
+
+@pytest.mark.parametrize('kwargs', BOLLINGER_CASES)
+@pytest.mark.parametrize('data', ['stock_prices', 'delisted'])
+def test_bollinger_ledger(tmp_path, request, data, kwargs):
+    prices = request.getfixturevalue(data)
+    same_ledgers(tmp_path,
+                 lambda ledger: strategy.bollinger(prices, ledger=ledger, cache=None, **kwargs),
+                 lambda ledger: reference.bollinger(prices, ledger=ledger, **kwargs))
+
+
+MACD_CASES = [
+    {},
+    {'fast_period': 3, 'slow_period': 10, 'signal_period': 4},
+    {'fast_period': 50, 'slow_period': 100, 'signal_period': 20, 'finaldate': 999},
+    {'fast_period': 12, 'slow_period': 260, 'signal_period': 42, 'finaldate': 301},
+]
+
+
+@pytest.mark.parametrize('kwargs', MACD_CASES)
+@pytest.mark.parametrize('data', ['stock_prices', 'delisted'])
+def test_macd_ledger(tmp_path, request, data, kwargs):
+    prices = request.getfixturevalue(data)
+    same_ledgers(tmp_path,
+                 lambda ledger: strategy.macd(prices, ledger=ledger, cache=None, **kwargs),
+                 lambda ledger: reference.macd_crossing(prices, ledger=ledger, **kwargs))
@@ -0,0 +1,40 @@
+# Process pools whose workers get the data shared by all the tasks once, when they start.
+from concurrent.futures import ProcessPoolExecutor
+
+
+# data shared by all the tasks of a worker process, set once by init_worker()
+shared = {}
+
+
+def init_worker(values):
+    '''
+    Sets the shared data of a worker process: a dict of name: value.
+    '''
+    shared.clear()
+    shared.update(values)
+
+
+def run_tasks(function, tasks, values, workers, chunksize=1):
+    '''
+    Runs function on each task in a pool of worker processes, with values as
+    the shared data (see init_worker()). function must be defined at the top of
+    a module, so that the workers can find it, and reads the data from shared.
+
+    Input:
+        function (callable): called with one task, returns its result
+        tasks (list): the tasks
+        values (dict): data shared by all the tasks, sent once to each worker
+        workers (int): number of worker processes, 1 to run the tasks in this process
+        chunksize (int, default 1): tasks sent to a worker at a time
+
+    Output:
+        results (list): the result of each task, in the order of tasks
+    '''
+    if workers == 1:
+        init_worker(values)
+        try:
+            return [function(task) for task in tasks]
+        finally:
+            shared.clear()
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(values,)) as executor:
+        return list(executor.map(function, tasks, chunksize=chunksize))
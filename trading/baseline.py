@@ -0,0 +1,162 @@
+# Profit distribution of the random strategy, over many runs at once.
+import os
+import numpy as np
+from trading import _pool
+
+
+# cumulative probabilities of 'buy', 'do_nothing', 'sell', computed like Generator.choice() does
+_CDF = np.array([1/3, 1/3, 1/3]).cumsum()
+_CDF /= _CDF[-1]
+
+
+def random_plan(stock_prices, period=7, amount=5000, fees=20, finaldate=1824):
+    '''
+    Everything about a random run that doesn't depend on the random draws:
+    the decision days, the prices and shares bought on them, and the delisting
+    and final-day rules of strategy.random().
+
+    Output:
+        plan (dict) for random_profit()
+    '''
+    num_of_stock = stock_prices.shape[1]
+    days = period * np.arange(1, max((finaldate - 1) // period, 0) + 1) # period*i < finaldate
+    price = stock_prices[days, :].T # (stocks, periods)
+
+    # decisions stop at the first day without a price, where the shares are thrown away
+    is_nan = np.isnan(price)
+    delisted = is_nan.any(axis=1)
+    decisions = np.where(delisted, np.argmax(is_nan, axis=1), days.shape[0])
+    valid = np.arange(days.shape[0])[None, :] < decisions[:, None]
+
+    initial_shares = (amount - fees) // stock_prices[0, :]
+    return {'price': np.where(valid, price, 0.0),
+            'bought': np.where(valid, (amount - fees) // np.where(valid, price, 1.0), 0.0),
+            'valid': valid,
+            'draws': int(decisions.sum()),
+            'decisions': decisions,
+            'delisted': delisted,
+            'initial_shares': initial_shares,
+            'initial_cashflow': np.round(-1 * initial_shares * stock_prices[0, :] - fees, 2),
+            'final_price': stock_prices[finaldate, :],
+            # as in strategy.random(), the final sell-off only happens if the last stock has a price
+            'sell_off': num_of_stock > 0 and not np.isnan(stock_prices[finaldate, -1]),
+            'fees': fees}
+
+
+def random_profit(plan, seeds):
+    '''
+    Final profit of random runs, one per seed, settled with array arithmetic
+    over the whole (runs, stocks, periods) decision tensor.
+
+    Run k draws its decisions from default_rng(seeds[k]) in the same order as
+    strategy.random(..., seed=seeds[k]), so it gets the same transactions and
+    the same profit as read_profit() of that run's ledger.
+
+    Output:
+        profit (1darray), trades (1darray): one entry per seed
+    '''
+    valid = plan['valid']
+    num_of_stock, num_of_period = valid.shape
+    num_of_run = len(seeds)
+    fees = plan['fees']
+
+    # no decision where there is no draw: in the middle of the 'do_nothing' range
+    draws = np.full((num_of_run, num_of_stock, num_of_period), 0.5)
+    for k, seed in enumerate(seeds):
+        draws[k][valid] = np.random.default_rng(seed).random(plan['draws'])
+    buy = draws < _CDF[0]
+    sell = (draws >= _CDF[1]) & valid
+
+    # shares held after each decision: the shares held at the last sale (0, or the
+    # initial shares if none yet) plus the ones bought since, with a segmented cumsum
+    bought = np.where(buy, plan['bought'], 0.0)
+    total_bought = np.cumsum(bought, axis=2)
+    period_index = np.arange(num_of_period)
+    last_sell = np.maximum.accumulate(np.where(sell, period_index, -1), axis=2)
+    bought_before_sell = np.take_along_axis(total_bought, np.maximum(last_sell, 0), axis=2)
+    held_after = (np.where(last_sell < 0, plan['initial_shares'][None, :, None], 0.0)
+                  + total_bought - np.where(last_sell < 0, 0.0, bought_before_sell))
+    held_before = np.concatenate((np.broadcast_to(plan['initial_shares'][None, :, None], (num_of_run, num_of_stock, 1)),
+                                  held_after[:, :, :-1]), axis=2)
+
+    # we only sell what we hold
+    sell &= held_before != 0
+    cashflow = (np.where(buy, np.round(-1 * bought * plan['price'] - fees, 2), 0.0)
+                + np.where(sell, np.round(held_before * plan['price'] - fees, 2), 0.0))
+    profit = cashflow.sum(axis=(1, 2)) + plan['initial_cashflow'].sum()
+    trades = np.count_nonzero(buy, axis=(1, 2)) + np.count_nonzero(sell, axis=(1, 2)) + num_of_stock
+
+    # shares left at the end of the decisions
+    last = np.maximum(plan['decisions'] - 1, 0)
+    held = np.where(plan['decisions'] > 0, held_after[:, np.arange(num_of_stock), last],
+                    plan['initial_shares'][None, :])
+    # delisted stocks are thrown away (for a price of 0 and no fees), the others sold on the final day
+    trades += np.count_nonzero((held != 0) & plan['delisted'], axis=1)
+    if plan['sell_off']:
+        selling = (held != 0) & ~plan['delisted']
+        profit += np.where(selling, np.round(held * plan['final_price'] - fees, 2), 0.0).sum(axis=1)
+        trades += np.count_nonzero(selling, axis=1)
+    return profit, trades
+
+
+def _run_chunk(seeds):
+    # settles a chunk of runs in a worker process (see trading._pool)
+    return random_profit(_pool.shared['plan'], seeds)
+
+
+def random_baseline(stock_prices, num_of_runs=1000, period=7, amount=5000, fees=20, finaldate=1824, seed=None,
+                    percentiles=(5, 25, 50, 75, 95), workers=None, chunksize=None):
+    '''
+    Distribution of the final profit of strategy.random() over many runs, to
+    judge the other strategies against. No ledger is written: the decisions of
+    a chunk of runs are drawn at once and settled with array arithmetic.
+
+    Input:
+        stock_prices (ndarray): the stock price data
+        num_of_runs (int, default 1000): number of random runs
+        period, amount, fees, finaldate: as in strategy.random()
+        seed (int or SeedSequence, default None): root seed; run k uses child k of
+            SeedSequence(seed).spawn(), so its profit is the one of
+            strategy.random(stock_prices, seed=child k)
+        percentiles (tuple, default (5, 25, 50, 75, 95)): percentiles of the profit to report
+        workers (int, default None): number of worker processes (default: all cores),
+            1 to run everything in this process
+        chunksize (int, default None): runs settled at once, which sets the memory
+            used (default: about 2 million decisions per chunk)
+
+    Output:
+        report (dict):
+            'profit' (1darray): final profit of each run ('nan' if a stock we hold
+                has no price on the final day, as in its ledger)
+            'trades' (1darray): number of transactions of each run
+            'percentiles' (dict): {percentile: profit}
+            'mean', 'std' (float): mean and standard deviation of the profit
+
+    Example:
+        >>> report = random_baseline(stock_prices, 10000, seed=42)
+        >>> profit = read_profit('ledger_momentum.txt')
+        >>> np.mean(report['profit'] < profit) # share of random runs that do worse
+    '''
+    plan = random_plan(stock_prices, period, amount, fees, finaldate)
+    if not isinstance(seed, np.random.SeedSequence):
+        seed = np.random.SeedSequence(seed)
+    seeds = seed.spawn(num_of_runs)
+
+    if chunksize == None:
+        chunksize = max(1, 2 * 10**6 // max(plan['valid'].size, 1))
+    chunks = [seeds[k:k+chunksize] for k in range(0, num_of_runs, chunksize)]
+    if workers == None:
+        workers = os.cpu_count() or 1
+
+    if len(chunks) <= 1:
+        workers = 1
+    results = _pool.run_tasks(_run_chunk, chunks, {'plan': plan}, workers)
+
+    profit = np.concatenate([result[0] for result in results]) if results else np.zeros(0)
+    trades = np.concatenate([result[1] for result in results]) if results else np.zeros(0, dtype=int)
+    values = np.nanpercentile(profit, percentiles) if profit.shape[0] else np.full(len(percentiles), np.nan)
+    return {'profit': profit,
+            'trades': trades,
+            'percentiles': dict(zip(percentiles, values.tolist())),
+            'mean': float(np.nanmean(profit)) if profit.shape[0] else np.nan,
+            'std': float(np.nanstd(profit)) if profit.shape[0] else np.nan}
@@ -0,0 +1,159 @@
+# Disk cache of generated market data, keyed by the content of the request.
+import hashlib
+import json
+import os
+import struct
+import tempfile
+import numpy as np
+from trading import data
+from trading import store
+
+
+def cache_key(days, initial_price, volatility, Loc=0.0, seed=None, paths=1, version=None):
+    '''
+    Hash of everything that decides a generated universe: its size, initial prices,
+    volatilities, Loc, seed and the version of the generator.
+
+    Input:
+        seed (int, list of int or SeedSequence): only reproducible seeds have a key
+        version (int, default None): generator version, default data.GENERATOR_VERSION
+
+    Output:
+        key (str): sha256 hex digest, or None if the seed isn't reproducible
+            (None, a Generator or a BitGenerator)
+    '''
+    if seed is None or isinstance(seed, (np.random.Generator, np.random.BitGenerator)):
+        return None
+    # an int or list seed gives the same stream as SeedSequence(seed), so they share a key
+    if not isinstance(seed, np.random.SeedSequence):
+        seed = np.random.SeedSequence(seed)
+    if version is None:
+        version = data.GENERATOR_VERSION
+
+    description = {'days': int(days), 'paths': int(paths), 'Loc': float(Loc), 'version': int(version),
+                   'entropy': seed.entropy, 'spawn_key': list(seed.spawn_key), 'pool_size': seed.pool_size}
+    digest = hashlib.sha256(json.dumps(description, sort_keys=True).encode())
+    digest.update(np.ascontiguousarray(initial_price, dtype='<f8').tobytes())
+    digest.update(np.ascontiguousarray(volatility, dtype='<f8').tobytes())
+    return digest.hexdigest()
+
+
+class MarketCache:
+    '''
+    Folder of generated universes, one binary price store per universe
+    (see trading.store), named after its cache_key(). Hits are memory-mapped,
+    so loading costs about the same for any size.
+
+    The folder is kept under max_bytes by deleting the least recently used
+    universes (a hit counts as a use). Files are written to a temporary name
+    and renamed, so several processes can share a folder.
+
+    Input:
+        cache_dir (str): folder of the cache (created if needed)
+        max_bytes (int, default 1 GiB): size cap of the folder
+
+    Example:
+        >>> market = MarketCache('market_cache')
+        >>> stock_prices = market.generate(1825, [150, 200], [3.0, 4.0], seed=42)[:, :, 0]
+        >>> market.hits, market.misses
+        (0, 1)
+    '''
+
+    def __init__(self, cache_dir, max_bytes=2**30):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, key + '.bin')
+
+    def get(self, key, shape):
+        '''
+        Maps a cached universe into memory.
+
+        Input:
+            key (str): its cache_key()
+            shape (tuple): its (days, stocks, paths) shape
+
+        Output:
+            stock_prices (memmap): read-only (days, stocks, paths) prices, or None if it isn't cached
+        '''
+        path = self.path(key)
+        try:
+            _, _, stock_prices = store.open_price_store(path)
+        except (FileNotFoundError, ValueError, struct.error):
+            return None
+        days, num_of_stock, paths = shape
+        if stock_prices.shape != (days, num_of_stock * paths):
+            return None
+        os.utime(path) # most recently used
+        # columns are stock by stock, then path by path
+        return stock_prices.reshape(shape)
+
+    def put(self, key, stock_prices, volatility):
+        '''
+        Stores a (days, stocks, paths) universe, then evicts old ones if the cache is too big.
+        '''
+        days, num_of_stock, paths = stock_prices.shape
+        handle, temporary = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        os.close(handle)
+        try:
+            store.write_price_store(temporary, stock_prices.reshape(days, num_of_stock * paths),
+                                    np.repeat(np.asarray(volatility, dtype=float), paths),
+                                    stock_prices[0].reshape(-1))
+            os.replace(temporary, self.path(key))
+        except BaseException:
+            os.remove(temporary)
+            raise
+        self.evict(keep=key)
+
+    def evict(self, keep=None):
+        '''
+        Deletes the least recently used universes until the folder fits in max_bytes.
+        The universe keep (the one just stored) is never deleted.
+        '''
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith('.bin'):
+                try:
+                    stat = os.stat(os.path.join(self.cache_dir, name))
+                except FileNotFoundError: # deleted by another process
+                    continue
+                entries.append((stat.st_mtime_ns, name, stat.st_size))
+        total = sum(size for _, _, size in entries)
+        for _, name, size in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if keep is not None and name == keep + '.bin':
+                continue
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def generate(self, days, initial_price, volatility, paths=1, Loc=0.0, seed=None):
+        '''
+        Same as data.generate_stock_prices(), through the cache: a universe
+        already generated with the same inputs and seed is loaded instead.
+        Without a reproducible seed, it is generated and not cached.
+
+        Output:
+            stock_prices (ndarray): (days, stocks, paths) prices (a read-only memmap if cached)
+        '''
+        key = cache_key(days, initial_price, volatility, Loc, seed, paths)
+        if key is None:
+            return data.generate_stock_prices(days, initial_price, volatility, paths=paths, Loc=Loc, seed=seed)
+
+        shape = (days, len(initial_price), paths)
+        stock_prices = self.get(key, shape)
+        if stock_prices is not None:
+            self.hits += 1
+            return stock_prices
+        self.misses += 1
+        stock_prices = data.generate_stock_prices(days, initial_price, volatility, paths=paths, Loc=Loc, seed=seed)
+        self.put(key, stock_prices, volatility)
+        cached = self.get(key, shape)
+        return stock_prices if cached is None else cached
@@ -0,0 +1,178 @@
+# Nearest-series lookup in a catalog of simulated stocks.
+import os
+import numpy as np
+
+
+LEAF_SIZE = 16
+
+
+class SeriesIndex:
+    '''
+    Index over the header rows (initial price and volatility) of a price catalog,
+    to find the stock closest to a requested initial price, volatility, or both.
+
+    Single-key queries use a sorted copy of the key and np.searchsorted.
+    Pair queries use a KD-tree over both keys, each divided by its standard
+    deviation over the catalog so that prices and volatilities weigh the same.
+    A batch of q queries over n stocks costs O(q log n).
+    Ties go to the smallest column index, like the old linear scan.
+
+    Example:
+        >>> index = SeriesIndex(price_row, volatility_row)
+        >>> columns = index.nearest(initial_price=[150, 200], volatility=[3.0, 4.2])
+    '''
+
+    def __init__(self, initial_price, volatility):
+        self.initial_price = np.asarray(initial_price, dtype=float)
+        self.volatility = np.asarray(volatility, dtype=float)
+
+        # stable sort keeps equal keys in column order, for the tie rule
+        self._price_order = np.argsort(self.initial_price, kind='stable')
+        self._price_sorted = self.initial_price[self._price_order]
+        self._volatility_order = np.argsort(self.volatility, kind='stable')
+        self._volatility_sorted = self.volatility[self._volatility_order]
+
+        # the KD-tree is only built the first time a pair is queried
+        self._tree = None
+
+    def nearest(self, initial_price=None, volatility=None):
+        '''
+        Finds the closest stock for each query.
+
+        Input:
+            initial_price (list, default None): requested initial prices
+            volatility (list, default None): requested volatilities. If both are
+                given, they are matched as (initial_price, volatility) pairs.
+
+        Output:
+            columns (1darray): column index of the closest stock for each query
+        '''
+        if initial_price is not None and volatility is not None:
+            return self._nearest_pair(np.asarray(initial_price, dtype=float),
+                                      np.asarray(volatility, dtype=float))
+        elif initial_price is not None:
+            return _nearest_sorted(self._price_sorted, self._price_order, initial_price)
+        elif volatility is not None:
+            return _nearest_sorted(self._volatility_sorted, self._volatility_order, volatility)
+        return np.zeros(0, dtype=int)
+
+    def _nearest_pair(self, initial_price, volatility):
+        if self._tree is None:
+            self._scale = np.array([_scale(self.initial_price), _scale(self.volatility)])
+            self._points = np.column_stack((self.initial_price, self.volatility)) / self._scale
+            self._tree = _build_tree(self._points)
+
+        queries = np.column_stack((initial_price, volatility)) / self._scale
+        columns = np.zeros(queries.shape[0], dtype=int)
+        for i in range(queries.shape[0]):
+            columns[i] = _query_tree(self._tree, self._points, queries[i])
+        return columns
+
+
+def _scale(values):
+    scale = np.std(values)
+    return scale if scale > 0 else 1.0
+
+
+def _nearest_sorted(sorted_values, order, queries):
+    '''
+    Vectorized nearest-value search in a sorted array, returning original indices.
+    '''
+    queries = np.asarray(queries, dtype=float)
+    n = sorted_values.shape[0]
+    right = np.clip(np.searchsorted(sorted_values, queries, side='left'), 0, n - 1)
+    left = np.clip(right - 1, 0, n - 1)
+    # first position of the left neighbour's value, so equal keys pick the lowest column
+    left = np.searchsorted(sorted_values, sorted_values[left], side='left')
+
+    dist_left = np.abs(queries - sorted_values[left])
+    dist_right = np.abs(queries - sorted_values[right])
+    take_right = (dist_right < dist_left) | ((dist_right == dist_left) & (order[right] < order[left]))
+    return np.where(take_right, order[right], order[left])
+
+
+def _build_tree(points):
+    '''
+    Builds a KD-tree as flat lists of nodes. Each node covers perm[lo:hi];
+    inner nodes split at the median of the wider coordinate, leaves hold
+    at most LEAF_SIZE points.
+    '''
+    perm = np.arange(points.shape[0])
+    node_lo, node_hi, node_dim, node_split, node_left, node_right = [], [], [], [], [], []
+
+    def build(lo, hi):
+        node = len(node_lo)
+        node_lo.append(lo)
+        node_hi.append(hi)
+        node_dim.append(-1)
+        node_split.append(0.0)
+        node_left.append(-1)
+        node_right.append(-1)
+        if hi - lo <= LEAF_SIZE:
+            return node
+
+        block = points[perm[lo:hi]]
+        dim = int(np.argmax(block.max(axis=0) - block.min(axis=0)))
+        mid = (hi - lo) // 2
+        perm[lo:hi] = perm[lo:hi][np.argpartition(block[:, dim], mid)]
+        node_dim[node] = dim
+        node_split[node] = points[perm[lo + mid], dim]
+        node_left[node] = build(lo, lo + mid)
+        node_right[node] = build(lo + mid, hi)
+        return node
+
+    build(0, points.shape[0])
+    return perm, node_lo, node_hi, node_dim, node_split, node_left, node_right
+
+
+def _query_tree(tree, points, query):
+    '''
+    Finds the index of the point closest to query, the smallest index on ties.
+    '''
+    perm, node_lo, node_hi, node_dim, node_split, node_left, node_right = tree
+    best_dist = np.inf
+    best_index = -1
+    stack = [(0, 0.0)]
+    while stack:
+        node, bound = stack.pop()
+        # points on the far side of a split are at least bound away
+        if bound > best_dist:
+            continue
+        dim = node_dim[node]
+        if dim == -1:
+            candidates = perm[node_lo[node]:node_hi[node]]
+            dist = np.sum((points[candidates] - query) ** 2, axis=1)
+            k = np.argmin(dist)
+            closest = candidates[dist == dist[k]].min()
+            if dist[k] < best_dist or (dist[k] == best_dist and closest < best_index):
+                best_dist = dist[k]
+                best_index = closest
+        else:
+            diff = query[dim] - node_split[node]
+            if diff < 0:
+                near, far = node_left[node], node_right[node]
+            else:
+                near, far = node_right[node], node_left[node]
+            stack.append((far, diff ** 2))
+            stack.append((near, bound))
+    return int(best_index)
+
+
+_INDEX_CACHE = {}
+
+
+def catalog_index(data_file, initial_price, volatility):
+    '''
+    Returns the SeriesIndex of a price file, reusing the one built on a previous
+    call as long as the file hasn't changed.
+
+    Input:
+        data_file (str): path to the price file
+        initial_price (1darray), volatility (1darray): its header rows
+    '''
+    stat = os.stat(data_file)
+    key = (os.path.abspath(data_file), stat.st_mtime_ns, stat.st_size)
+    if key not in _INDEX_CACHE:
+        _INDEX_CACHE.clear()
+        _INDEX_CACHE[key] = SeriesIndex(initial_price, volatility)
+    return _INDEX_CACHE[key]
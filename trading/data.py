@@ -1,16 +1,22 @@
-def generate_stock_price(days, initial_price, volatility, Loc=0.0):
+# version of the simulation model of generate_stock_prices(), part of the key of
+# cached universes (see trading.cache): change it when the model changes
+GENERATOR_VERSION = 1
+
+
+def generate_stock_price(days, initial_price, volatility, Loc=0.0, seed=None):
     import numpy as np
     '''
     Generates daily closing share prices for a company,
     for a given number of days.
     Loc (float default=0): mean of normal distribution
+    seed (int, SeedSequence or Generator, default None): seed for default_rng
     '''
     # Initialize stock_prices, initial_price, totalDrift
     stock_prices = np.zeros(days)
     stock_prices[0] = initial_price
     totalDrift = np.zeros(days)
     # Set up the default_rng from Numpy
-    rng = np.random.default_rng()
+    rng = np.random.default_rng(seed)
     # Loop over a range(1, days)
     for day in range(1, days):
         inc = rng.normal(loc = Loc)
@@ -61,37 +67,105 @@ def generate_stock_price(days, initial_price, volatility, Loc=0.0):
     return np.round(stock_prices, 2)
 
 
+def generate_stock_prices(days, initial_price, volatility, paths=1, Loc=0.0, seed=None):
+    '''
+    Generates daily closing share prices for several companies and several
+    simulated paths at once. Same model as generate_stock_price(), but every
+    random draw is made up front as an array instead of day by day.
+
+    Input:
+        days (int): number of days to simulate (day 0 is the initial price)
+        initial_price (list or ndarray): initial share price of each stock
+        volatility (list or ndarray): volatility of each stock
+        paths (int, default 1): number of independent paths per stock
+        Loc (float default=0): mean of normal distribution
+        seed (int, SeedSequence or Generator, default None): seed for default_rng
+
+    Output:
+        stock_prices (ndarray): (days, stocks, paths) array of prices, set to NaN
+            from the first non-positive price onwards
+    '''
+    import numpy as np
+
+    initial_price = np.asarray(initial_price, dtype=float)
+    volatility = np.asarray(volatility, dtype=float)
+    num_of_stock = initial_price.shape[0]
+    shape = (days, num_of_stock, paths)
+    rng = np.random.default_rng(seed)
+
+    # Gaussian increments for days 1..days-1, day 0 holds the initial price
+    stock_prices = rng.normal(loc=Loc, size=shape)
+    stock_prices[0] = initial_price[:, None]
+
+    # News arrives on a day with 10% chance and lasts 3 to 14 days,
+    # drawn only for the days that actually have news
+    day, stock, path = np.nonzero(rng.random((days - 1, num_of_stock, paths)) < 0.1)
+    day += 1
+    duration = rng.integers(3, 15, size=day.shape[0])
+    drift = rng.normal(0, 2, size=day.shape[0]) * volatility[stock]
+
+    # Interval adds: +drift on the first day, -drift the day after the last one,
+    # then a cumulative sum gives the total drift of every day
+    totalDrift = np.zeros((days + 1, num_of_stock, paths))
+    np.add.at(totalDrift, (day, stock, path), drift)
+    np.add.at(totalDrift, (np.minimum(day + duration, days), stock, path), -drift)
+    np.cumsum(totalDrift, axis=0, out=totalDrift)
+
+    # Price of each day is the initial price plus all increments and drifts so far
+    stock_prices += totalDrift[:days]
+    np.cumsum(stock_prices, axis=0, out=stock_prices)
 
+    # Once a price is non-positive, the company is bankrupt: NaN from that day on
+    bankrupt = np.logical_or.accumulate(stock_prices <= 0, axis=0)
+    stock_prices = np.round(stock_prices, 2)
+    stock_prices[bankrupt] = np.nan
+    return stock_prices
 
 
-def get_data(method='read', initial_price=None, volatility=None, finaldate=1824, Loc=0.0):
+
+
+
+def get_data(method='read', initial_price=None, volatility=None, finaldate=1824, Loc=0.0, paths=None,
+             data_file='stock_data_5y.txt', seed=None, cache_dir=None):
 
     '''
     Generates or reads simulation data for one or more stocks over 5 years,
     given their initial share price and volatility.
     finaldate (int, default 1824): the last day of sotck prices (from 0)
     Loc (float default=0): mean of normal distribution
+    paths (int, default None): with method 'generate', number of simulated paths
+        per stock. If given, return a (days, stocks, paths) array instead of (days, stocks).
+    seed (int, SeedSequence or Generator, default None): with method 'generate', seed for default_rng
+    cache_dir (str or MarketCache, default None): with method 'generate' and a seed, folder
+        of a trading.cache.MarketCache: the same universe is generated once, then loaded
+        (memory-mapped) from there
+    data_file (str, default 'stock_data_5y.txt'): with method 'read', the price file to read,
+        either a text file or a binary price store (see trading.store), with any number
+        of stocks and days
+    With method 'read', initial_price and/or volatility select the closest stocks in the file:
+        if both are given they are matched as (initial_price, volatility) pairs.
     '''
 
     import numpy as np
-
-    #initialize a (1826, 20) size array and a specific size array if initial_price or volatility exist
-    whole_sim_data = np.zeros((finaldate+2, 20))
-    if initial_price != None:
-        num_of_stock = len(initial_price)
-        sim_data = np.zeros((finaldate+1, num_of_stock))
-    elif volatility != None:
-        num_of_stock = len(volatility)
-        sim_data = np.zeros((finaldate+1, num_of_stock))
-
+    from trading import store
+    from trading import catalog
 
     #generate data with given initial_price and volatility
     if method == 'generate':
         if initial_price != None and volatility != None:
-            for i in range(num_of_stock):
-                #Assume 5 years = 5*365 = 1825 days
-                sim_data[:,i] = generate_stock_price(finaldate+1, initial_price[i], volatility[i], Loc=Loc)
-            return sim_data
+            #Assume 5 years = 5*365 = 1825 days
+            if cache_dir != None:
+                from trading import cache
+                if not isinstance(cache_dir, cache.MarketCache):
+                    cache_dir = cache.MarketCache(cache_dir)
+                stock_prices = cache_dir.generate(finaldate+1, initial_price, volatility,
+                                                  paths=1 if paths == None else paths, Loc=Loc, seed=seed)
+            else:
+                stock_prices = generate_stock_prices(finaldate+1, initial_price, volatility,
+                                                     paths=1 if paths == None else paths, Loc=Loc, seed=seed)
+            if paths == None:
+                return stock_prices[:, :, 0]
+            return stock_prices
 
         #lack argument
         elif initial_price == None and volatility == None:
@@ -103,67 +177,23 @@ def get_data(method='read', initial_price=None, volatility=None, finaldate=1824,
 
     #read data with given initial_price and volatility if they are given
     if method == 'read' :
-        #read the whole simulation data
-        with open('stock_data_5y.txt', 'r') as readfile:
-            lines = readfile.readline()
-            i = 0
-            while lines:
-                num = np.array([float(x) for x in lines.split()])
-                whole_sim_data[i, :] = num
-                lines = readfile.readline()
-                i = i+1
+        #open the whole simulation data: memory-mapped if it's a binary price store,
+        #parsed if it's a text file
+        if store.is_price_store(data_file):
+            volatility_row, price_row, whole_sim_data = store.open_price_store(data_file)
+        else:
+            volatility_row, price_row, whole_sim_data = store.read_price_text(data_file)
 
         #situations with different givern argument
         #find whole stock price
         if initial_price == None and volatility == None:
-            whole_sim_data = whole_sim_data[1:, :]
-            return whole_sim_data
-
-        #find stock price base on initial_price
-        elif initial_price != None:
-            if volatility != None:
-                print('volatility will be ignored')
-
-            price_find = np.zeros(len(initial_price))
-            volatility_find = np.zeros(len(initial_price))
-            sim_data_g_price = np.zeros([finaldate+2, len(initial_price)])
-            #loop for find cloest values
-            for i in range(len(initial_price)):
-                price_find[i] = whole_sim_data[1, 0]
-                volatility_find[i] = whole_sim_data[0, 0]
-                sim_data_g_price[:, i] = whole_sim_data[:, 0]
-
-                for j in range(1, 20):
-                    if abs(initial_price[i] - price_find[i]) >  abs(initial_price[i] - whole_sim_data[1, j]):
-                        price_find[i] = whole_sim_data[1, j]
-                        volatility_find[i] = whole_sim_data[0, j]
-                        sim_data_g_price[:, i] = whole_sim_data[:, j]
-
-            print('Found data with initial prices', price_find[:], 'and volatilities', volatility_find[:])
-            #delete the "volatility" row
-            sim_data_g_price = sim_data_g_price[1:, :]
-            return sim_data_g_price
-
-        #find stock price base on volatility
-        elif initial_price == None and volatility != None:
-
-            price_find = np.zeros(len(initial_price))
-            volatility_find = np.zeros(len(initial_price))
-            sim_data_g_price = np.zeros([finaldate+2,len(initial_price)])
-
-            #loop for find cloest values
-            for i in range(len(volatility)):
-                price_find[i] = whole_sim_data[1, 0]
-                volatility_find[i] = whole_sim_data[0, 0]
-                sim_data_g_price[:, i] = whole_sim_data[:, 0]
-
-                for j in range(1, 20):
-                    if abs(volatility[i] - volatility_find[i]) >  abs(volatility[i] - whole_sim_data[0, j]):
-                        price_find[i] = whole_sim_data[1, j]
-                        volatility_find[i] = whole_sim_data[0, j]
-                        sim_data_g_price[:, i] = whole_sim_data[:, j]
-
-            print('Found data with initial prices', price_find[:], 'and volatilities', volatility_find[:])
-            #delete the "volatility" row
-            sim_data_g_price = sim_data_g_price[1:, :]
-            return sim_data_g_price
+            return whole_sim_data[:finaldate+1, :]
+
+        #find the closest stocks with the index over the header rows,
+        #by (initial_price, volatility) pairs or by either one alone
+        index = catalog.catalog_index(data_file, price_row, volatility_row)
+        column_find = index.nearest(initial_price=initial_price, volatility=volatility)
+
+        print('Found data with initial prices', price_row[column_find], 'and volatilities', volatility_row[column_find])
+        #only read the columns we found, in one go
+        return whole_sim_data[:finaldate+1, column_find]
@@ -0,0 +1,107 @@
+# Monte Carlo runs of the strategies over many simulated markets.
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from trading import data
+from trading import strategy
+from trading import process as proc
+
+
+STRATEGIES = ('crossing_averages', 'momentum', 'random')
+
+
+def _run_universe(task):
+    '''
+    Simulates one universe and runs every requested strategy on it.
+    Runs in a worker process, so it only takes and returns picklable values.
+
+    Input:
+        task (tuple): (seed_sequence, initial_price, volatility, days, Loc,
+            strategies, strategy_kwargs)
+
+    Output:
+        profit (1darray), trades (1darray): one entry per strategy
+    '''
+    seed_sequence, initial_price, volatility, days, Loc, strategies, strategy_kwargs = task
+
+    # one child seed per stock, and one for the random strategy
+    children = seed_sequence.spawn(len(initial_price) + 1)
+    stock_prices = np.zeros((days, len(initial_price)))
+    for s in range(len(initial_price)):
+        stock_prices[:, s] = data.generate_stock_price(days, initial_price[s], volatility[s], Loc=Loc, seed=children[s])
+
+    profit = np.zeros(len(strategies))
+    trades = np.zeros(len(strategies), dtype=int)
+    for k, name in enumerate(strategies):
+        # the transactions stay in memory, no ledger file is written
+        ledger = proc.Ledger()
+        kwargs = dict(strategy_kwargs.get(name, {}))
+        kwargs['ledger'] = ledger
+        kwargs.setdefault('finaldate', days - 1)
+        if name == 'random':
+            kwargs.setdefault('seed', children[-1])
+        else:
+            # every universe is new data, the indicator cache would never hit
+            kwargs.setdefault('cache', None)
+        getattr(strategy, name)(stock_prices, **kwargs)
+
+        # cashflows rounded to cents, as read_profit() gets them from a ledger file
+        profit[k] = np.sum(np.round(ledger.records['cashflow'], 2))
+        trades[k] = len(ledger)
+
+    return profit, trades
+
+
+def run_ensemble(num_of_universe, initial_price, volatility, strategies=STRATEGIES, days=1825, Loc=0.0,
+                 seed=None, workers=None, chunksize=None, strategy_kwargs=None):
+    '''
+    Runs the strategies on many independently simulated markets, in parallel,
+    and returns the distribution of their results.
+
+    Input:
+        num_of_universe (int): number of simulated markets
+        initial_price (list): initial price of each stock
+        volatility (list): volatility of each stock
+        strategies (tuple, default all three): names of functions in trading.strategy
+        days (int, default 1825): number of simulated days
+        Loc (float default=0): mean of normal distribution
+        seed (int or SeedSequence, default None): root seed; universe k always
+            gets child k of SeedSequence(seed).spawn(), so runs are reproducible
+        workers (int, default None): number of worker processes (default: all cores)
+        chunksize (int, default None): universes sent to a worker at a time
+            (default: enough chunks for about 4 per worker)
+        strategy_kwargs (dict, default None): extra arguments for each strategy,
+            keyed by strategy name, e.g. {'momentum': {'osc_method': 'RSI'}}
+
+    Output:
+        profit (ndarray): (num_of_universe, len(strategies)) final profit of each run
+        trades (ndarray): (num_of_universe, len(strategies)) number of transactions of each run
+
+    Example:
+        >>> profit, trades = run_ensemble(1000, [150, 200], [3.0, 4.0], seed=42)
+        >>> np.percentile(profit, [5, 50, 95], axis=0)
+    '''
+    if workers == None:
+        workers = os.cpu_count() or 1
+    if chunksize == None:
+        chunksize = max(1, num_of_universe // (4 * workers))
+    if strategy_kwargs == None:
+        strategy_kwargs = {}
+    strategies = tuple(strategies)
+    for name in strategies:
+        if name not in STRATEGIES:
+            return 'Unknown strategy {}, choose from {}.'.format(name, STRATEGIES)
+
+    if not isinstance(seed, np.random.SeedSequence):
+        seed = np.random.SeedSequence(seed)
+    tasks = [(child, list(initial_price), list(volatility), days, Loc, strategies, strategy_kwargs)
+             for child in seed.spawn(num_of_universe)]
+
+    profit = np.zeros((num_of_universe, len(strategies)))
+    trades = np.zeros((num_of_universe, len(strategies)), dtype=int)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for k, (p, t) in enumerate(executor.map(_run_universe, tasks, chunksize=chunksize)):
+            profit[k] = p
+            trades[k] = t
+
+    return profit, trades
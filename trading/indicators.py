@@ -1,101 +1,463 @@
+import hashlib
+from collections import OrderedDict
 import numpy as np
+from trading import profiling
 
+def _nan_cutoff(stock_price, n):
+    '''
+    For each column, the index of the first 'nan' value from day n-1 on
+    (or the number of days if there is none). The indicators are only
+    computed up to that day.
+    '''
+    days = stock_price.shape[0]
+    is_nan = np.isnan(stock_price[n-1:, :])
+    has_nan = is_nan.any(axis=0)
+    return np.where(has_nan, np.argmax(is_nan, axis=0) + n - 1, days)
+
+
+def _as_columns(stock_price):
+    '''
+    Returns stock_price as a 2D float array of columns, and whether it was a single column.
+    '''
+    stock_price = np.asarray(stock_price, dtype=float)
+    if stock_price.ndim == 1:
+        stock_price = stock_price.reshape(-1, 1)
+    return stock_price, stock_price.shape[1] == 1
+
+
+def _truncate(indic, cut, n, single):
+    '''
+    Applies the 'nan' cutoff to an indicator whose row k is the value for day k+n-1:
+    a single column is cut short, several columns are padded with 'nan' instead.
+    '''
+    if single:
+        return indic[:max(cut[0] - n + 1, 0), 0]
+    indic[np.arange(indic.shape[0])[:, None] > cut - n] = np.nan
+    return indic
+
+
+@profiling.timed('indicators.moving_average')
 def moving_average(stock_price, n=7, weights=[]):
     '''
     Calculates the n-day (possibly weighted) moving average for a given stock over time.
 
     Input:
         stock_price (ndarray): single column with the share prices over time for one stock,
-            up to the current day.
+            up to the current day. It can also be a (days, stocks) array, to get the
+            moving averages of all the stocks in one call.
         n (int, default 7): period of the moving average (in days).
         weights (list, default []): must be of length n if specified. Indicates the weights
             to use for the weighted average. If empty, return a non-weighted average.
 
     Output:
-        ma: (1darray)
+        ma: (1darray) for a single column. For several columns, a (days-n+1, stocks) array
+            with one moving average per column, padded with 'nan' after the first 'nan' price.
     '''
-    #initialization
-    ma = []
+    stock_price, single = _as_columns(stock_price)
+    days, num_of_stock = stock_price.shape
+    if days < n:
+        return _truncate(np.zeros((0, num_of_stock)), np.zeros(num_of_stock, dtype=int), n, single)
 
-    # clean 'nan' value part
-    for i in range(n-1, stock_price.shape[0]):
-        if np.isnan(stock_price[i,0]) == True: # when we find 'nan' value, we delete 'nan' value and the after
-            # print('!!!In ma() find nan value at [{}], day {}.'.format(i,i+1))
-            stock_price = stock_price[:i, :]
-            # print(stock_price)
-            break
-    days = stock_price.shape[0] # find value of no 'nan' days
-    # print('This ma indicator return array from indice {} to {}, i.e. day {} to {}'.format(n-1, days - 1, n, days))
+    # find the 'nan' value of each column, the average is cut from there
+    cut = _nan_cutoff(stock_price, n)
 
-    for i in range(n-1, days): # every loop we add result to the list
-        if weights == []:
-            ma.append(np.sum(stock_price[i-n+1:i+1, 0]) / n)
-        else:
-            ma.append(np.dot(np.array(weights), stock_price[i-n+1:i+1, 0]))
+    if len(weights) == 0:
+        # difference of cumulative sums gives every n-day sum at once,
+        # (prices minus the first one, to keep the sums small and precise)
+        base = _first_price(stock_price)
+        ma = _nan_rolling_sum(stock_price - base, n) / n + base
+    else:
+        # weighted average: convolution with the reversed weights, column by column
+        reversed_weights = np.array(weights, dtype=float)[::-1]
+        ma = np.zeros((days - n + 1, num_of_stock))
+        for s in range(num_of_stock):
+            ma[:, s] = np.convolve(stock_price[:, s], reversed_weights, mode='valid')
 
-    return np.array(ma)
+    return _truncate(ma, cut, n, single)
 
 
 
+def _rolling_extreme(stock_price, n, extreme):
+    '''
+    Rolling minimum or maximum over n days, in O(days) whatever n is
+    (van Herk/Gil-Werman): cut the days in blocks of n, take the running
+    extreme forwards and backwards inside each block, then every window is
+    a block suffix joined with the next block prefix.
+
+    Input:
+        stock_price (ndarray): (days, stocks) prices
+        n (int): window length
+        extreme (ufunc): np.minimum or np.maximum
+
+    Output: (days-n+1, stocks) array, row k is the extreme of days k to k+n-1.
+    '''
+    days, num_of_stock = stock_price.shape
+    num_of_block = -(-days // n)
+    # pad up to whole blocks, the padding never ends up in a window
+    padded = np.concatenate((stock_price, np.repeat(stock_price[-1:, :], num_of_block * n - days, axis=0)))
+    blocks = padded.reshape(num_of_block, n, num_of_stock)
+    prefix = extreme.accumulate(blocks, axis=1).reshape(-1, num_of_stock)
+    suffix = extreme.accumulate(blocks[:, ::-1, :], axis=1)[:, ::-1, :].reshape(-1, num_of_stock)
+    return extreme(suffix[:days-n+1, :], prefix[n-1:days, :])
+
+
+def _rolling_sum(values, m):
+    '''
+    Sums of m consecutive rows, from the difference of cumulative sums.
+    Row k of the output is the sum of rows k to k+m-1.
+    '''
+    cumulative = np.zeros((values.shape[0] + 1, values.shape[1]))
+    np.cumsum(values, axis=0, out=cumulative[1:, :])
+    return cumulative[m:, :] - cumulative[:values.shape[0]-m+1, :]
+
+
+def _nan_rolling_sum(values, m):
+    '''
+    Same as _rolling_sum(), but a 'nan' only gives 'nan' to the sums of the
+    windows that contain it, as summing each window would (the cumulative
+    sum would carry it to every later window).
+    '''
+    is_nan = np.isnan(values)
+    if not is_nan.any():
+        return _rolling_sum(values, m)
+    sums = _rolling_sum(np.where(is_nan, 0, values), m)
+    sums[_rolling_sum(is_nan.astype(float), m) > 0] = np.nan
+    return sums
+
+
+def _first_price(stock_price):
+    '''
+    First price of each column that is not 'nan' (0 if there is none),
+    to shift the prices by before summing them.
+    '''
+    first = np.argmax(~np.isnan(stock_price), axis=0)
+    return np.nan_to_num(stock_price[first, np.arange(stock_price.shape[1])])
+
+
+@profiling.timed('indicators.oscillator')
 def oscillator(stock_price, n=7, osc_type='stochastic'):
     '''
     Calculates the level of the stochastic or RSI oscillator with a period of n days.
 
     Input:
         stock_price (ndarray): single column with the share prices over time for one stock,
-            up to the current day.
+            up to the current day. It can also be a (days, stocks) array, to get the
+            oscillators of all the stocks in one call.
         n (int, default 7): period of the moving average (in days).
         osc_type (str, default 'stochastic'): either 'stochastic' or 'RSI' to choose an oscillator.
 
     Output:
-        osc (1darray)
+        osc (1darray) for a single column. For several columns, a (days-n+1, stocks) array
+            with one oscillator per column, padded with 'nan' after the first 'nan' price.
     '''
-    #initialization
-    osc = []
-
-
-    # clean 'nan' value part
-    for i in range(n-1, stock_price.shape[0]):
-        if np.isnan(stock_price[i,0]) == True: # when we find 'nan' value, we delete 'nan' value and the after
-            # print('!!!In osc() find nan value at [{}], day {}.'.format(i,i+1))
-            stock_price = stock_price[:i, :]
-            # print(stock_price)
-            break
-    days = stock_price.shape[0] # find value of no 'nan' days
+    stock_price, single = _as_columns(stock_price)
+    days, num_of_stock = stock_price.shape
+    if days < n or osc_type not in ('stochastic', 'RSI'):
+        return _truncate(np.zeros((0, num_of_stock)), np.zeros(num_of_stock, dtype=int), n, single)
 
-    # print('This ma indicator return array from indice {} to {}, i.e. day {} to {}'.format(n-1, days - 1, n, days))
+    # find the 'nan' value of each column, the oscillator is cut from there
+    cut = _nan_cutoff(stock_price, n)
 
     # caculate osc with 'stochastic'
     if osc_type == 'stochastic':
-        for i in range(n-1, days): # every loop we add result to the list
-            delta = abs(stock_price[i, 0] - min(stock_price[i+1-n:i+1, 0]))
-            delta_max = abs(max(stock_price[i+1-n:i+1, 0]) - min(stock_price[i+1-n:i+1, 0]))
-            if delta_max == 0:
-                osc.append(1)
-            else:
-                osc.append(delta / delta_max)
+        lowest = _rolling_extreme(stock_price, n, np.minimum)
+        highest = _rolling_extreme(stock_price, n, np.maximum)
+        delta = np.abs(stock_price[n-1:, :] - lowest)
+        delta_max = np.abs(highest - lowest)
+        # a flat window gives 1 (by limitation)
+        osc = np.ones_like(delta)
+        np.divide(delta, delta_max, out=osc, where=delta_max != 0)
 
     # caculate osc with 'RSI'
     elif osc_type == 'RSI':
-        for i in range(n-1, days): # every loop we add result to the list
-            days_diff_pos = [] # initialize
-            days_diff_neg = []
-
-            # Loop for get lists for postive and neg trend
-            for j in range(n-1):
-                if stock_price[i-j, 0] - stock_price[i-1-j, 0] > 0:
-                    days_diff_pos.append(stock_price[i-j, 0] - stock_price[i-1-j, 0])
-                elif stock_price[i-j, 0] - stock_price[i-1-j, 0] < 0:
-                    days_diff_neg.append(stock_price[i-j, 0] - stock_price[i-1-j, 0])
-
-            if len(days_diff_neg) == 0: # if the list is empty, return 1 (by limitation)
-                osc.append(1)
-            elif len(days_diff_pos) == 0: # if the list is empty, return 0 (by limitation)
-                osc.append(0)
-            else: # caculate osc by using RS
-                diff_pos_aver = sum(days_diff_pos) / len(days_diff_pos)
-                diff_neg_aver = abs(sum(days_diff_neg) / len(days_diff_neg))
-                RS = diff_pos_aver / diff_neg_aver
-                osc.append(1 - (1 / (1 + RS)))
-
-    return np.array(osc)
+        # the window of day i holds the n-1 daily differences up to day i
+        days_diff = np.diff(stock_price, axis=0)
+        pos_sum = _rolling_sum(np.where(days_diff > 0, days_diff, 0), n-1)
+        neg_sum = _rolling_sum(np.where(days_diff < 0, days_diff, 0), n-1)
+        pos_count = _rolling_sum((days_diff > 0).astype(float), n-1)
+        neg_count = _rolling_sum((days_diff < 0).astype(float), n-1)
+
+        # caculate osc by using RS, where there are both gains and losses
+        both = (pos_count > 0) & (neg_count > 0)
+        RS = np.ones_like(pos_sum)
+        np.divide(pos_sum / np.where(both, pos_count, 1), np.abs(neg_sum / np.where(both, neg_count, 1)),
+                  out=RS, where=both)
+        osc = 1 - (1 / (1 + RS))
+
+        # no losses gives 1, no gains gives 0 (by limitation)
+        osc[neg_count == 0] = 1
+        osc[(neg_count > 0) & (pos_count == 0)] = 0
+
+    return _truncate(osc, cut, n, single)
+
+
+
+def _exponential_filter(stock_price, n):
+    '''
+    n-day exponential moving average of every column, with the recursive filter
+    ema[i] = alpha*price[i] + (1-alpha)*ema[i-1], alpha = 2/(n+1), started from
+    the simple average of the first n days. O(days) whatever n is.
+
+    Output: (days, stocks) array, row i is the average up to day i ('nan' before day n-1).
+    '''
+    days, num_of_stock = stock_price.shape
+    ema = np.full((days, num_of_stock), np.nan)
+    if days < n:
+        return ema
+    alpha = 2 / (n + 1)
+    ema[n-1, :] = np.mean(stock_price[:n, :], axis=0)
+    weighted = alpha * stock_price
+    for i in range(n, days):
+        np.multiply(ema[i-1, :], 1 - alpha, out=ema[i, :])
+        ema[i, :] += weighted[i, :]
+    return ema
+
+
+@profiling.timed('indicators.exponential_average')
+def exponential_average(stock_price, n=7):
+    '''
+    Calculates the n-day exponential moving average (EMA) for a given stock over time,
+    with smoothing factor 2/(n+1), started from the simple average of the first n days.
+
+    Input:
+        stock_price (ndarray): single column with the share prices over time for one stock,
+            up to the current day. It can also be a (days, stocks) array, to get the
+            averages of all the stocks in one call.
+        n (int, default 7): period of the average (in days).
+
+    Output:
+        ema: (1darray) for a single column. For several columns, a (days-n+1, stocks) array
+            with one average per column, padded with 'nan' after the first 'nan' price.
+    '''
+    stock_price, single = _as_columns(stock_price)
+    days, num_of_stock = stock_price.shape
+    if days < n:
+        return _truncate(np.zeros((0, num_of_stock)), np.zeros(num_of_stock, dtype=int), n, single)
+
+    cut = _nan_cutoff(stock_price, n)
+    return _truncate(_exponential_filter(stock_price, n)[n-1:, :], cut, n, single)
+
+
+@profiling.timed('indicators.bollinger_bands')
+def bollinger_bands(stock_price, n=20, k=2):
+    '''
+    Calculates the n-day Bollinger bands for a given stock over time:
+    the n-day moving average, plus and minus k times the n-day standard deviation.
+
+    Input:
+        stock_price (ndarray): single column with the share prices over time for one stock,
+            up to the current day. It can also be a (days, stocks) array.
+        n (int, default 20): period of the bands (in days).
+        k (float, default 2): width of the bands, in standard deviations.
+
+    Output:
+        middle, upper, lower: the moving average and the two bands, each as
+            moving_average() returns it.
+    '''
+    stock_price, single = _as_columns(stock_price)
+    days, num_of_stock = stock_price.shape
+    if days < n:
+        empty = _truncate(np.zeros((0, num_of_stock)), np.zeros(num_of_stock, dtype=int), n, single)
+        return empty, empty.copy(), empty.copy()
+
+    cut = _nan_cutoff(stock_price, n)
+
+    # mean and standard deviation of every window, in two passes over the window so
+    # that the variance doesn't cancel out, a block of columns at a time so that the
+    # temporary (windows, stocks, n) arrays stay around 2**22 values
+    windows = np.lib.stride_tricks.sliding_window_view(stock_price, n, axis=0)
+    middle = np.zeros((days - n + 1, num_of_stock))
+    width = np.zeros((days - n + 1, num_of_stock))
+    block = max(1, 2**22 // ((days - n + 1) * n))
+    for first in range(0, num_of_stock, block):
+        window = windows[:, first:first+block, :]
+        middle[:, first:first+block] = window.mean(axis=-1)
+        width[:, first:first+block] = k * window.std(axis=-1)
+
+    return (_truncate(middle, cut, n, single), _truncate(middle + width, cut, n, single),
+            _truncate(middle - width, cut, n, single))
+
+
+@profiling.timed('indicators.macd')
+def macd(stock_price, fast=12, slow=26, signal=9):
+    '''
+    Calculates the MACD of a given stock over time: the fast EMA minus the slow EMA
+    (MACD line), its signal-day EMA (signal line), and their difference (histogram).
+
+    Input:
+        stock_price (ndarray): single column with the share prices over time for one stock,
+            up to the current day. It can also be a (days, stocks) array.
+        fast (int, default 12), slow (int, default 26): periods of the two EMAs (in days).
+        signal (int, default 9): period of the EMA of the MACD line (in days).
+
+    Output:
+        line, signal_line, histogram: row k is the value for day k+m-1, where
+            m = max(fast, slow) + signal - 1 is the number of days they need
+            (macd_period()). Cut or padded with 'nan' as moving_average() does.
+    '''
+    stock_price, single = _as_columns(stock_price)
+    days, num_of_stock = stock_price.shape
+    m = macd_period(fast, slow, signal)
+    if days < m:
+        empty = _truncate(np.zeros((0, num_of_stock)), np.zeros(num_of_stock, dtype=int), m, single)
+        return empty, empty.copy(), empty.copy()
+
+    cut = _nan_cutoff(stock_price, m)
+    start = max(fast, slow) - 1 # first day with both EMAs
+    line = (_exponential_filter(stock_price, fast) - _exponential_filter(stock_price, slow))[start:, :]
+    signal_line = _exponential_filter(line, signal)[signal-1:, :]
+    line = line[signal-1:, :]
+
+    return (_truncate(line, cut, m, single), _truncate(signal_line, cut, m, single),
+            _truncate(line - signal_line, cut, m, single))
+
+
+def macd_period(fast=12, slow=26, signal=9):
+    '''
+    Number of days of prices the first MACD value needs (its "n").
+    '''
+    return max(fast, slow) + signal - 1
+
+
+
+def chunked(function, blocks, **kwargs):
+    '''
+    Computes an indicator block by block of stocks, e.g. from
+    store.iter_column_blocks(), so that only one block is in memory at once.
+    The indicators treat each stock on its own, so the blocks together give
+    the same values as one call on all the stocks.
+
+    Input:
+        function: moving_average or oscillator (or the same method of an IndicatorCache)
+        blocks: iterable of (first_stock, block) pairs, block being (days, stocks) prices
+        kwargs: other arguments of function (n, weights, osc_type)
+
+    Output:
+        generator of (first_stock, values): the indicator of each block
+
+    Example:
+        >>> blocks = store.iter_column_blocks('prices.bin', 1000)
+        >>> for first_stock, osc in chunked(oscillator, blocks, n=200, osc_type='RSI'):
+        ...     np.save('rsi_{}.npy'.format(first_stock), osc)
+    '''
+    for first_stock, block in blocks:
+        yield first_stock, function(block, **kwargs)
+
+
+class IndicatorCache:
+    '''
+    Remembers the results of moving_average() and oscillator(), so that parameter
+    sweeps over the same prices don't compute the same series again.
+
+    Results are keyed by a fingerprint of the prices (a hash of their bytes and
+    shape) and the indicator parameters. When the cached results take more than
+    max_bytes, the least recently used ones are dropped. Cached arrays are
+    read-only, since they are shared between callers.
+
+    Input:
+        max_bytes (int, default 256 MB): memory budget for the cached results
+        enabled (bool, default True): if False, every call is computed directly
+
+    Example:
+        >>> cache = IndicatorCache(max_bytes=64 * 2**20)
+        >>> for n in [20, 50, 100]:
+        ...     strategy.crossing_averages(stock_prices, SMAperiod=200, FMAperiod=n, cache=cache)
+        >>> cache.hits, cache.misses
+    '''
+
+    def __init__(self, max_bytes=256 * 2**20, enabled=True):
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    @profiling.timed('indicators.cache')
+    def moving_average(self, stock_price, n=7, weights=[]):
+        '''
+        Same as indicators.moving_average(), through the cache.
+        '''
+        key = ('moving_average', _fingerprint(stock_price), n, tuple(float(w) for w in weights))
+        return self._get(key, moving_average, stock_price, n=n, weights=weights)
+
+    @profiling.timed('indicators.cache')
+    def oscillator(self, stock_price, n=7, osc_type='stochastic'):
+        '''
+        Same as indicators.oscillator(), through the cache.
+        '''
+        key = ('oscillator', _fingerprint(stock_price), n, osc_type)
+        return self._get(key, oscillator, stock_price, n=n, osc_type=osc_type)
+
+    @profiling.timed('indicators.cache')
+    def exponential_average(self, stock_price, n=7):
+        '''
+        Same as indicators.exponential_average(), through the cache.
+        '''
+        key = ('exponential_average', _fingerprint(stock_price), n)
+        return self._get(key, exponential_average, stock_price, n=n)
+
+    @profiling.timed('indicators.cache')
+    def bollinger_bands(self, stock_price, n=20, k=2):
+        '''
+        Same as indicators.bollinger_bands(), through the cache.
+        '''
+        key = ('bollinger_bands', _fingerprint(stock_price), n, float(k))
+        return self._get(key, bollinger_bands, stock_price, n=n, k=k)
+
+    @profiling.timed('indicators.cache')
+    def macd(self, stock_price, fast=12, slow=26, signal=9):
+        '''
+        Same as indicators.macd(), through the cache.
+        '''
+        key = ('macd', _fingerprint(stock_price), fast, slow, signal)
+        return self._get(key, macd, stock_price, fast=fast, slow=slow, signal=signal)
+
+    def clear(self):
+        '''
+        Drops every cached result and resets the counters.
+        '''
+        self._entries.clear()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _get(self, key, function, stock_price, **kwargs):
+        if not self.enabled:
+            return function(stock_price, **kwargs)
+
+        if key in self._entries:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return self._entries[key][0]
+
+        self.misses += 1
+        result = function(stock_price, **kwargs)
+        # some indicators are several arrays (bands, MACD lines)
+        arrays = result if isinstance(result, tuple) else (result,)
+        for array in arrays:
+            array.setflags(write=False)
+        nbytes = sum(array.nbytes for array in arrays)
+        if nbytes <= self.max_bytes:
+            self._entries[key] = (result, nbytes)
+            self.nbytes += nbytes
+            # evict the least recently used results until we are within budget
+            while self.nbytes > self.max_bytes:
+                _, (_, dropped) = self._entries.popitem(last=False)
+                self.nbytes -= dropped
+        return result
+
+
+def _fingerprint(stock_price):
+    '''
+    Cheap fingerprint of a price array: its shape and a hash of its bytes.
+    '''
+    stock_price = np.ascontiguousarray(stock_price, dtype=float)
+    return stock_price.shape, hashlib.blake2b(stock_price.tobytes(), digest_size=16).hexdigest()
+
+
+# cache used by the strategies unless told otherwise
+default_cache = IndicatorCache()
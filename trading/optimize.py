@@ -0,0 +1,365 @@
+# Parameter search for the trading strategies.
+import inspect
+import itertools
+import os
+import time
+import numpy as np
+from trading import process as proc
+from trading import indicators as indic
+from trading import strategy
+from trading import _pool
+
+
+# the parameters each strategy can be searched over
+GRID_PARAMETERS = {
+    'crossing_averages': ('SMAperiod', 'FMAperiod', 'SMAweights', 'FMAweights'),
+    'momentum': ('period', 'minimum_cool_down_period', 'overvalued_threshold',
+                 'undervalued_threshold', 'osc_method'),
+}
+
+
+def parameter_combinations(strategy_name, param_grid):
+    '''
+    Lists every combination of a parameter grid, with the strategy's
+    default value for the parameters that are not in the grid.
+
+    Input:
+        strategy_name (str): 'crossing_averages' or 'momentum'
+        param_grid (dict): list of values to try for each parameter
+
+    Output:
+        combinations (list of dict): one dict of parameters per combination
+    '''
+    signature = inspect.signature(getattr(strategy, strategy_name)).parameters
+    defaults = {name: signature[name].default for name in GRID_PARAMETERS[strategy_name]}
+    names = list(param_grid)
+    combinations = []
+    for values in itertools.product(*[param_grid[name] for name in names]):
+        params = dict(defaults)
+        params.update(zip(names, values))
+        combinations.append(params)
+    return combinations
+
+
+def indicator_keys(strategy_name, params):
+    '''
+    The indicators a combination needs, as keys of the shared indicator dict.
+    '''
+    if strategy_name == 'crossing_averages':
+        return [('moving_average', params['SMAperiod'], tuple(params['SMAweights'])),
+                ('moving_average', params['FMAperiod'], tuple(params['FMAweights']))]
+    return [('oscillator', params['period'], params['osc_method'])]
+
+
+def compute_indicators(stock_prices, keys):
+    '''
+    Computes each distinct indicator once, for all the stocks, lined up with
+    strategy.align_indicator().
+
+    Output:
+        indicators (dict): aligned (days, stocks) array for each key
+    '''
+    days = stock_prices.shape[0]
+    indicators = {}
+    for key in keys:
+        if key in indicators:
+            continue
+        kind, n, option = key
+        if kind == 'moving_average':
+            values = indic.moving_average(stock_prices, n=n, weights=list(option))
+        else:
+            values = indic.oscillator(stock_prices, n=n, osc_type=option)
+        indicators[key] = strategy.align_indicator(values, n, days)
+    return indicators
+
+
+def valid_combination(strategy_name, params):
+    '''
+    Whether the strategy accepts a combination (crossing_averages needs SMAperiod >= FMAperiod).
+    '''
+    return strategy_name != 'crossing_averages' or params['SMAperiod'] >= params['FMAperiod']
+
+
+def run_combination(strategy_name, stock_prices, indicators, params, amount, fees, finaldate, ledger, first_day=0,
+                    history=None):
+    '''
+    Runs a strategy with one combination of parameters and precomputed indicators,
+    recording the transactions in ledger (a process.Ledger).
+
+    Input:
+        stock_prices (ndarray): the stock price data, from first_day on
+        indicators (dict): the aligned indicators, from first_day on
+        first_day (int, default 0): day of the full history that stock_prices starts on.
+            After a warm-up, the indicators are known from the first day of the
+            window, so trading can start right away.
+        history (ndarray, default None): the price data of the same stocks from day 0,
+            to recompute the indicators that are nearly tied (default stock_prices)
+
+    Output:
+        False if the combination is not valid (SMAperiod < FMAperiod), else True
+    '''
+    # check first, an invalid combination doesn't buy anything
+    if not valid_combination(strategy_name, params):
+        return False
+    num_of_stock = stock_prices.shape[1]
+    portfolio = proc.create_portfolio([amount]*num_of_stock, stock_prices, fees, ledger)
+    if history is None:
+        history = stock_prices
+
+    if strategy_name == 'crossing_averages':
+        SMA_key, FMA_key = indicator_keys(strategy_name, params)
+        start = max(params['SMAperiod'] - first_day, 0)
+        strategy.settle_ties(history, indicators[SMA_key], indicators[FMA_key], params['SMAperiod'],
+                             params['FMAperiod'], params['SMAweights'], params['FMAweights'], start, finaldate,
+                             first_day=first_day)
+        events = strategy.crossing_events(stock_prices, indicators[SMA_key], indicators[FMA_key], start, finaldate)
+    else:
+        osc_key, = indicator_keys(strategy_name, params)
+        start = max(params['period'] - first_day, 0)
+        if params['osc_method'] == 'RSI':
+            strategy.settle_rsi(history, indicators[osc_key], params['period'],
+                                [*params['overvalued_threshold'], *params['undervalued_threshold']], start, finaldate,
+                                first_day=first_day)
+        events = strategy.momentum_events(stock_prices, indicators[osc_key], start, finaldate,
+                                          params['minimum_cool_down_period'], params['overvalued_threshold'],
+                                          params['undervalued_threshold'])
+
+    strategy.replay_events(stock_prices, *events, amount, fees, portfolio, ledger)
+    strategy.sell_all(stock_prices, finaldate, fees, portfolio, ledger)
+    return True
+
+
+def ledger_profit(ledger):
+    '''
+    Final profit of a ledger, with amounts rounded to cents as in the ledger file.
+    '''
+    return float(np.sum(np.round(ledger.records['cashflow'], 2)))
+
+
+def _evaluate(task):
+    '''
+    Evaluates one combination in a worker process (see trading._pool).
+
+    Output:
+        profit (float, 'nan' if the combination is not valid), trades (int), runtime (float)
+    '''
+    index, params = task
+    strategy_name, amount, fees, finaldate, ledger_dir = _pool.shared['settings']
+    started = time.perf_counter()
+    if not valid_combination(strategy_name, params):
+        # no trades and no ledger file
+        return np.nan, 0, time.perf_counter() - started
+
+    ledger_file = None
+    if ledger_dir != None:
+        ledger_file = os.path.join(ledger_dir, '{}_{}.txt'.format(strategy_name, index))
+    ledger = proc.Ledger(ledger_file, mode='w')
+    run_combination(strategy_name, _pool.shared['stock_prices'], _pool.shared['indicators'], params,
+                    amount, fees, finaldate, ledger)
+    ledger.flush()
+
+    return ledger_profit(ledger), len(ledger), time.perf_counter() - started
+
+
+def parameter_fields(combinations, names):
+    '''
+    Structured array fields for the parameters of a list of combinations.
+    Numeric parameters get numeric columns, the others (lists, strings) object columns.
+    '''
+    fields = []
+    for name in names:
+        values = [params[name] for params in combinations]
+        if all(isinstance(v, (int, np.integer)) and not isinstance(v, bool) for v in values):
+            fields.append((name, 'i8'))
+        elif all(isinstance(v, (int, float, np.number)) and not isinstance(v, bool) for v in values):
+            fields.append((name, 'f8'))
+        else:
+            fields.append((name, object))
+    return fields
+
+
+def results_table(combinations, names, results):
+    '''
+    Puts the parameters and results of each combination in a structured array.
+    '''
+    fields = parameter_fields(combinations, names) + [('profit', 'f8'), ('trades', 'i8'), ('runtime', 'f8')]
+    table = np.zeros(len(combinations), dtype=fields)
+    for k, params in enumerate(combinations):
+        for name in names:
+            table[name][k] = params[name]
+    if len(results):
+        table['profit'], table['trades'], table['runtime'] = zip(*results)
+    return table
+
+
+def grid_search(stock_prices, strategy_name='crossing_averages', param_grid={}, amount=5000, fees=20,
+                finaldate=1824, workers=None, chunksize=None, ledger_dir=None):
+    '''
+    Runs a strategy for every combination of a parameter grid, in parallel.
+    Each distinct indicator (moving average or oscillator window) is computed once
+    and shared by all the combinations that use it, and transactions are kept in
+    memory: no ledger file is written unless ledger_dir is given.
+
+    Input:
+        stock_prices (ndarray): the stock price data
+        strategy_name (str, default 'crossing_averages'): 'crossing_averages' or 'momentum'
+        param_grid (dict): list of values to try for each parameter, see GRID_PARAMETERS.
+            Parameters not in the grid take the strategy's default value.
+        amount (float, default 5000): how much we spend on each purchase
+        fees (float, default 20): transaction fees
+        finaldate (int, default 1824): the last day of sotck prices (from 0)
+        workers (int, default None): number of worker processes (default: all cores),
+            1 to run everything in this process
+        chunksize (int, default None): combinations sent to a worker at a time
+        ledger_dir (str, default None): if given, write the ledger of combination k
+            to ledger_dir/<strategy_name>_<k>.txt
+
+    Output:
+        table (ndarray): structured array with one row per combination: a column per
+            grid parameter, then 'profit' (final profit, 'nan' if the combination is
+            not valid), 'trades' (number of transactions, 0 if not valid) and
+            'runtime' (seconds). An invalid combination writes no ledger file.
+
+    Example:
+        >>> table = grid_search(stock_prices, 'crossing_averages',
+        ...                     {'SMAperiod': [100, 200], 'FMAperiod': [10, 20, 50]})
+        >>> table[np.argmax(table['profit'])]
+    '''
+    if strategy_name not in GRID_PARAMETERS:
+        return 'Unknown strategy {}, choose from {}.'.format(strategy_name, tuple(GRID_PARAMETERS))
+    for name in param_grid:
+        if name not in GRID_PARAMETERS[strategy_name]:
+            return 'Unknown parameter {} for {}.'.format(name, strategy_name)
+
+    combinations = parameter_combinations(strategy_name, param_grid)
+    keys = [key for params in combinations for key in indicator_keys(strategy_name, params)]
+    indicators = compute_indicators(stock_prices, keys)
+    settings = (strategy_name, amount, fees, finaldate, ledger_dir)
+    tasks = list(enumerate(combinations))
+
+    if workers == None:
+        workers = os.cpu_count() or 1
+    if chunksize == None:
+        chunksize = max(1, len(tasks) // (4 * workers))
+    results = _pool.run_tasks(_evaluate, tasks, {'stock_prices': stock_prices, 'indicators': indicators,
+                                                 'settings': settings}, workers, chunksize)
+
+    return results_table(combinations, list(param_grid), results)
+
+
+def run_window(strategy_name, params, first_day, last_day, amount, fees):
+    '''
+    Runs a strategy from first_day to last_day of the shared price data, on the
+    stocks that still have a price on first_day, slicing the shared indicators
+    instead of computing them again.
+
+    Output:
+        profit (float, 'nan' if the combination is not valid), trades (int)
+    '''
+    stock_prices = _pool.shared['stock_prices']
+    alive = np.flatnonzero(~np.isnan(stock_prices[first_day, :]))
+    if alive.shape[0] == 0:
+        return 0.0, 0
+
+    window = {key: _pool.shared['indicators'][key][first_day:last_day+1, alive]
+              for key in indicator_keys(strategy_name, params)}
+    ledger = proc.Ledger()
+    history = stock_prices[:last_day+1, alive]
+    valid = run_combination(strategy_name, history[first_day:], window, params,
+                            amount, fees, last_day - first_day, ledger, first_day=first_day, history=history)
+    return (ledger_profit(ledger) if valid else np.nan), len(ledger)
+
+
+def _evaluate_fold(task):
+    '''
+    Evaluates one walk-forward fold in a worker process: picks the combination
+    with the best in-sample profit, then runs it out of sample.
+
+    Output:
+        choice (int), train_profit (float), test_profit (float), test_trades (int)
+    '''
+    train_start, test_start, test_end = task
+    strategy_name, amount, fees, combinations = _pool.shared['settings']
+
+    train_profit = np.array([run_window(strategy_name, params, train_start, test_start - 1, amount, fees)[0]
+                             for params in combinations])
+    if np.all(np.isnan(train_profit)):
+        return -1, np.nan, np.nan, 0
+    choice = int(np.nanargmax(train_profit))
+    test_profit, test_trades = run_window(strategy_name, combinations[choice], test_start, test_end, amount, fees)
+    return choice, train_profit[choice], test_profit, test_trades
+
+
+def walk_forward(stock_prices, strategy_name='crossing_averages', param_grid={}, train_days=730, test_days=365,
+                 step_days=None, amount=5000, fees=20, workers=None):
+    '''
+    Walk-forward optimisation: on each fold, pick the parameters with the best profit
+    on train_days of history (in sample), then trade them on the next test_days
+    (out of sample). Folds move forward by step_days.
+
+    Each distinct indicator is computed once over the whole history and every fold
+    carries on from there, rather than computing its history again; this is the same
+    as extending the indicator state fold after fold, since the indicators only look
+    back in time. Independent folds run at the same time in a process pool.
+
+    Input:
+        stock_prices (ndarray): the stock price data
+        strategy_name (str, default 'crossing_averages'): 'crossing_averages' or 'momentum'
+        param_grid (dict): list of values to try for each parameter, as in grid_search()
+        train_days (int, default 730): length of the in-sample window (in days)
+        test_days (int, default 365): length of the out-of-sample window (in days)
+        step_days (int, default None): days between two folds (default test_days)
+        amount (float, default 5000): how much we spend on each purchase
+        fees (float, default 20): transaction fees
+        workers (int, default None): number of worker processes (default: all cores),
+            1 to run everything in this process
+
+    Output:
+        folds (ndarray): structured array with one row per fold: 'train_start',
+            'test_start', 'test_end' (days), 'choice' (index of the chosen combination),
+            a column per grid parameter with the chosen value, 'train_profit',
+            'test_profit' and 'test_trades'
+
+    Example:
+        >>> folds = walk_forward(stock_prices, 'momentum', {'period': [14, 50, 100]},
+        ...                      train_days=365, test_days=90)
+        >>> folds['test_profit'].sum()
+    '''
+    if strategy_name not in GRID_PARAMETERS:
+        return 'Unknown strategy {}, choose from {}.'.format(strategy_name, tuple(GRID_PARAMETERS))
+    for name in param_grid:
+        if name not in GRID_PARAMETERS[strategy_name]:
+            return 'Unknown parameter {} for {}.'.format(name, strategy_name)
+    if step_days == None:
+        step_days = test_days
+
+    combinations = parameter_combinations(strategy_name, param_grid)
+    keys = [key for params in combinations for key in indicator_keys(strategy_name, params)]
+    indicators = compute_indicators(stock_prices, keys)
+    settings = (strategy_name, amount, fees, combinations)
+
+    days = stock_prices.shape[0]
+    tasks = [(start, start + train_days, start + train_days + test_days - 1)
+             for start in range(0, days - train_days - test_days + 1, step_days)]
+
+    if workers == None:
+        workers = os.cpu_count() or 1
+    results = _pool.run_tasks(_evaluate_fold, tasks, {'stock_prices': stock_prices, 'indicators': indicators,
+                                                      'settings': settings}, workers)
+
+    names = list(param_grid)
+    fields = ([('train_start', 'i8'), ('test_start', 'i8'), ('test_end', 'i8'), ('choice', 'i8')]
+              + parameter_fields(combinations, names)
+              + [('train_profit', 'f8'), ('test_profit', 'f8'), ('test_trades', 'i8')])
+    folds = np.zeros(len(tasks), dtype=fields)
+    for k, (task, result) in enumerate(zip(tasks, results)):
+        choice, train_profit, test_profit, test_trades = result
+        folds['train_start'][k], folds['test_start'][k], folds['test_end'][k] = task
+        folds['choice'][k] = choice
+        if choice >= 0:
+            for name in names:
+                folds[name][k] = combinations[choice][name]
+        folds['train_profit'][k] = train_profit
+        folds['test_profit'][k] = test_profit
+        folds['test_trades'][k] = test_trades
+    return folds
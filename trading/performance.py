@@ -1,166 +1,278 @@
 # Evaluate performance.
+import os
 import numpy as np
-import matplotlib.pyplot as plt
+from trading import process as proc
+from trading import store
 
 
-def read_ledger(ledger_file, graph = True):
+# in headless mode, plots are queued by plot_profit() instead of shown,
+# and drawn to image files by render_plots(). matplotlib is only imported
+# when something is actually drawn. Set TRADING_HEADLESS=1 to start headless.
+headless = os.environ.get('TRADING_HEADLESS', '') not in ('', '0')
+_queued_plots = []
+
+
+def set_headless(enabled=True):
     '''
-    Reads and reports useful information from ledger_file.
+    Turns headless mode on or off. In headless mode the reports still return
+    their series, but plots never open a window or block: they are queued
+    and only drawn when render_plots() is called.
+
+    Example:
+        >>> set_headless()
+        >>> report = read_ledger('ledger_momentum.txt')
+        >>> render_plots('plots')
+        ['plots/plot_000.png']
+    '''
+    global headless
+    headless = enabled
+
+
+# columns of a text ledger line, as read by np.loadtxt
+_TEXT_DTYPE = np.dtype([('side', 'U4'), ('date', 'i8'), ('stock', 'i8'),
+                        ('shares', 'i8'), ('price', 'f8'), ('cashflow', 'f8')])
+
+
+def load_ledger(ledger_file):
+    '''
+    Reads ledger_file in a single pass. Binary ledgers (see trading.store)
+    are memory-mapped and decoded instead of parsed.
+
+    Input:
+        ledger_file (str): path to the ledger file, text or binary
+
+    Output:
+        records (ndarray): structured array with one transaction per element
+            and the fields of process.LEDGER_DTYPE (side, date, stock, shares,
+            price, cashflow), side being process.BUY or process.SELL
     '''
-    infor_list = []
+    if store.is_binary_ledger(ledger_file):
+        return store.read_ledger(ledger_file)
+
     with open(ledger_file, 'r') as readfile:
-        lines = readfile.readline()
-        i = 0
-        while lines:
-            list = [x for x in lines.split(',')]
-            infor_list.append(list)
-            lines = readfile.readline()
-            i += 1
-
-            if not lines:
-                break
-
-    # split first column with element "buy" and "sell" for  counting
-    buy_sell_list = []
-    for i in infor_list:
-        buy_sell_list.append(i[0])
-        del i[0]
-
-    infor_array = txt_trans_array(ledger_file)
-
-    num_of_tran = infor_array.shape[0]
-
-    #initialization for ploting graph
-    t_linespace = []
-    profit_loss = []
-
-    # loop for caculate day-porfit(loss)
-    profit_loss_upto_day_t = 0
-    for t in range(1825):
-        profit_in_day_t = 0
-        for i in range(num_of_tran):
-            if infor_array[i, 0] == t:
-                profit_in_day_t += infor_array[i, -1]
-        if profit_in_day_t != 0:
-            t_linespace.append(t)
-            profit_loss_upto_day_t += profit_in_day_t
-            profit_loss.append(profit_loss_upto_day_t)
+        text = np.loadtxt(readfile, delimiter=',', dtype=_TEXT_DTYPE, ndmin=1)
+
+    records = np.zeros(text.shape[0], dtype=proc.LEDGER_DTYPE)
+    records['side'] = np.where(text['side'] == 'buy', proc.BUY, proc.SELL)
+    for name in ('date', 'stock', 'shares', 'price', 'cashflow'):
+        records[name] = text[name]
+    return records
+
+
+def ledger_report(records, horizon=None):
+    '''
+    Computes the overall information of a ledger, without printing anything.
+
+    Input:
+        records (ndarray): transactions, as returned by load_ledger()
+        horizon (int, default None): number of days to report on.
+            If None, up to the last day with a transaction.
+
+    Output:
+        report (dict):
+            'buy', 'sell' (int): number of "buy" and "sell" transactions
+            'spent', 'earned' (float): total amount spent and earned
+            'profit' (float): overall profit(loss) at the final day
+            'daily' (1darray): profit(loss) of each day
+            'cumulative' (1darray): profit(loss) up to each day
+            'days' (1darray): days with a non-zero profit(loss)
+            'profit_loss' (1darray): profit(loss) up to each of those days
+    '''
+    if horizon == None:
+        horizon = int(records['date'].max()) + 1 if records.shape[0] else 0
+    cashflow = records['cashflow']
+    in_horizon = records['date'] < horizon
+
+    # profit(loss) of every day at once
+    daily = np.bincount(records['date'][in_horizon], weights=cashflow[in_horizon], minlength=horizon)
+    cumulative = np.cumsum(daily)
+    days = np.flatnonzero(daily)
+
+    spent = abs(np.sum(np.minimum(cashflow, 0)))
+    earned = np.sum(np.maximum(cashflow, 0))
+    return {'buy': int(np.count_nonzero(records['side'] == proc.BUY)),
+            'sell': int(np.count_nonzero(records['side'] == proc.SELL)),
+            'spent': round(float(spent), 2),
+            'earned': round(float(earned), 2),
+            'profit': round(float(earned - spent), 2),
+            'daily': daily,
+            'cumulative': cumulative,
+            'days': days,
+            'profit_loss': cumulative[days]}
+
+
+def equity_curve(ledger, stock_prices, capital=None, periods_per_year=365, risk_free=0.0):
+    '''
+    Marks a ledger to market every day: cash plus the value of the shares held.
+
+    The shares held by day and stock come from a scatter-add of the transactions
+    and a cumsum over days, so the whole curve costs a few array operations over
+    (days, stocks). Shares still held after a delisting ('nan' price) are worth 0.
+
+    Input:
+        ledger (str, process.Ledger or ndarray): path to a ledger file, a Ledger,
+            or its records as returned by load_ledger()
+        stock_prices (ndarray): the (days, stocks) prices the ledger was run on
+        capital (float, default None): money put in at the start, used to turn
+            profit(loss) into returns. If None, what was spent on the first day.
+        periods_per_year (int, default 365): days in a year, to annualize
+        risk_free (float, default 0): annual risk-free rate for the Sharpe ratio
+
+    Output:
+        report (dict):
+            'equity' (1darray): capital plus profit(loss) marked to market, each day
+            'positions' (ndarray): (days, stocks) number of shares held at the end of each day
+            'returns' (1darray): daily returns of the equity
+            'drawdown' (1darray): fall from the highest equity so far, as a fraction, each day
+            'max_drawdown' (float): largest drawdown
+            'volatility' (float): annualized standard deviation of the daily returns
+            'sharpe' (float): annualized Sharpe ratio of the daily returns
+
+    Example:
+        >>> report = equity_curve('ledger_momentum.txt', stock_prices)
+        >>> report['max_drawdown'], report['sharpe']
+    '''
+    if isinstance(ledger, str):
+        records = load_ledger(ledger)
+    elif isinstance(ledger, proc.Ledger):
+        records = ledger.records
+    else:
+        records = ledger
+    days, num_of_stock = stock_prices.shape
+    in_horizon = records['date'] < days
+    date = records['date'][in_horizon].astype(int)
+    stock = records['stock'][in_horizon].astype(int)
+    cashflow = records['cashflow'][in_horizon]
+
+    # share changes of each day and stock, then running holdings
+    positions = np.zeros((days, num_of_stock))
+    np.add.at(positions, (date, stock), records['side'][in_horizon] * records['shares'][in_horizon])
+    np.cumsum(positions, axis=0, out=positions)
+
+    cash = np.cumsum(np.bincount(date, weights=cashflow, minlength=days))
+    holdings = np.where(positions != 0, positions * np.nan_to_num(stock_prices, nan=0.0), 0).sum(axis=1)
+
+    if capital == None:
+        capital = -np.sum(np.minimum(cashflow[date == 0], 0))
+    equity = capital + cash + holdings
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        returns = np.diff(equity) / equity[:-1]
+        peak = np.maximum.accumulate(equity)
+        drawdown = np.where(peak > 0, (peak - equity) / peak, 0.0)
+    returns = returns[np.isfinite(returns)]
+
+    volatility = np.nan
+    sharpe = np.nan
+    if returns.shape[0] > 1:
+        std = np.std(returns, ddof=1)
+        volatility = float(std * np.sqrt(periods_per_year))
+        if std > 0:
+            excess = np.mean(returns) - risk_free / periods_per_year
+            sharpe = float(excess / std * np.sqrt(periods_per_year))
+
+    return {'equity': equity,
+            'positions': positions,
+            'returns': returns,
+            'drawdown': drawdown,
+            'max_drawdown': float(drawdown.max()) if days else 0.0,
+            'volatility': volatility,
+            'sharpe': sharpe}
+
+
+def read_ledger(ledger_file, graph = True):
+    '''
+    Reads and reports useful information from ledger_file.
 
+    Output:
+        report (dict): the information that is printed, see ledger_report()
+    '''
+    report = ledger_report(load_ledger(ledger_file))
 
     # print some relevant overall information
     print('Using strategy {}'.format(ledger_file[7: -4]))
     print('-' * 20)
 
-    print('The total number of "buy" and "sell" transaction are {} and {}.'.format(buy_sell_list.count('buy')
-            , buy_sell_list.count('sell')))
-    print('The total amount spent and earned over 5 years is {} and {}.'.format(
-            round(abs(sum(min(infor_array[i, -1], 0) for i in range(num_of_tran))), 2),
-            round(sum(max(infor_array[i, -1], 0) for i in range(num_of_tran)), 2)))
-    print('The overall profit(loss) at the final day is {}.'.format(round(
-            sum(max(infor_array[i, -1], 0) for i in range(num_of_tran)) +
-            sum(min(infor_array[i, -1], 0) for i in range(num_of_tran)), 2))
-            )
+    print('The total number of "buy" and "sell" transaction are {} and {}.'.format(report['buy'], report['sell']))
+    print('The total amount spent and earned over 5 years is {} and {}.'.format(report['spent'], report['earned']))
+    print('The overall profit(loss) at the final day is {}.'.format(report['profit']))
 
     # if statment to control whether show the graph
     if graph == True:
-        plt.title('Overall profit or loss over 5 years by using {} method.'.format(ledger_file[7: -4]))
-        fig1 = plt.plot(t_linespace,profit_loss, label = 'profit or loss')
-        plt.legend()
-        plt.show()
+        plot_profit(report, 'Overall profit or loss over 5 years by using {} method.'.format(ledger_file[7: -4]))
 
     print('-' * 20)
     print('\n')
+    return report
 
 
+def plot_profit(report, title):
+    '''
+    Plots the overall profit(loss) over time of a ledger_report().
+    In headless mode, the plot is queued for render_plots() instead.
+    '''
+    if headless:
+        _queued_plots.append((np.array(report['days']), np.array(report['profit_loss']), title))
+        return
 
+    import matplotlib.pyplot as plt
+    plt.title(title)
+    plt.plot(report['days'], report['profit_loss'], label = 'profit or loss')
+    plt.legend()
+    plt.show()
 
 
+def render_plots(output_dir='plots', file_format='png', dpi=100):
+    '''
+    Draws every queued plot to an image file, in one go, and empties the queue.
+    Uses matplotlib without pyplot, so no display is needed.
 
+    Input:
+        output_dir (str, default 'plots'): folder for the images (created if needed)
+        file_format (str, default 'png'): image format, any that matplotlib can write
+        dpi (int, default 100): resolution of the images
 
-def txt_trans_array(ledger_file):
-    # read from ledger_file and put the number in to an array
-    # initialization and read file
-    infor_list = []
-    onedlist = []
-    with open(ledger_file, 'r') as readfile:
-        lines = readfile.readline()
-        i = 0
-        while lines:
-            list = [x for x in lines.split(',')]
-            infor_list.append(list)
-            lines = readfile.readline()
-            i += 1
-
-            if not lines:
-                break
-
-    # split first column with element "buy" and "sell" for  counting
-    buy_sell_list = []
-    for i in infor_list:
-        buy_sell_list.append(i[0])
-        del i[0]
-
-    # transform the remaining number readable and put them in an array
-    for i in infor_list:
-        for j in i:
-            onedlist.append(round(float(j.strip('\n')), 2))
-
-    infor_array = np.array(onedlist)
-    infor_array = infor_array.reshape((int(len(infor_array) / 5), 5)) # got the data of 2d array
-
-    return infor_array
-
+    Output:
+        paths (list): path of each image, in the order the plots were queued
+    '''
+    if len(_queued_plots) == 0:
+        return []
+    from matplotlib.figure import Figure
+
+    os.makedirs(output_dir, exist_ok=True)
+    paths = []
+    for k, (days, profit_loss, title) in enumerate(_queued_plots):
+        figure = Figure()
+        axes = figure.subplots()
+        axes.set_title(title)
+        axes.plot(days, profit_loss, label = 'profit or loss')
+        axes.legend()
+        path = os.path.join(output_dir, 'plot_{:03d}.{}'.format(k, file_format))
+        figure.savefig(path, format=file_format, dpi=dpi)
+        paths.append(path)
+    _queued_plots.clear()
+    return paths
 
 
+def txt_trans_array(ledger_file):
+    # read from ledger_file and put the number in to an array
+    # columns: date, stock, number of shares, price, amount
+    records = load_ledger(ledger_file)
+    return np.column_stack([records[name].astype(float) for name in ('date', 'stock', 'shares', 'price', 'cashflow')])
 
 
 def txt_trans_buysell(ledger_file):
     # read from ledger_file and return two 2darray buy_array and sell_array with date in first row, price in second row
-    # initialization and read file
-    infor_list = []
-    with open(ledger_file, 'r') as readfile:
-        lines = readfile.readline()
-        i = 0
-        while lines:
-            list = [x for x in lines.split(',')]
-            infor_list.append(list)
-            lines = readfile.readline()
-            i += 1
-
-            if not lines:
-                break
-
-    # split first column with element "buy" and "sell" for  counting
-    buy_sell_list = []
-    for i in infor_list:
-        buy_sell_list.append(i[0])
-
-    infor_array = txt_trans_array(ledger_file)
-    date_array = infor_array[:,0]
-    price_array = infor_array[:,-2]
-
-    # sperate 'buy' and 'sell'
-    buy_array = np.zeros((2,buy_sell_list.count('buy')))
-    sell_array = np.zeros((2,buy_sell_list.count('sell')))
-    j = 0
-    k = 0
-    for i in range(len(buy_sell_list)):
-
-        if buy_sell_list[i] == 'buy':
-            buy_array[0, j] = date_array[i]
-            buy_array[1, j] = price_array[i]
-            j += 1
-        elif buy_sell_list[i] == 'sell':
-            sell_array[0, k] = date_array[i]
-            sell_array[1, k] = price_array[i]
-            k += 1
-
+    records = load_ledger(ledger_file)
+    buy = records[records['side'] == proc.BUY]
+    sell = records[records['side'] == proc.SELL]
+    buy_array = np.vstack((buy['date'], buy['price'])).astype(float)
+    sell_array = np.vstack((sell['date'], sell['price'])).astype(float)
     return buy_array, sell_array
 
 
-
 def read_profit(ledger_file):
 
-    infor_array = txt_trans_array(ledger_file)
+    records = load_ledger(ledger_file)
 
-    return float(sum(infor_array[:, -1]))
+    return float(np.sum(records['cashflow']))
@@ -1,5 +1,298 @@
 # Functions to process transactions.
 import numpy as np
+from trading import store
+from trading import profiling
+
+
+# one transaction per record: side is BUY or SELL, cashflow is the amount
+# earned (positive) or spent (negative), including fees
+LEDGER_DTYPE = np.dtype([('side', 'i1'), ('date', 'i8'), ('stock', 'i8'),
+                         ('shares', 'i8'), ('price', 'f8'), ('cashflow', 'f8')])
+BUY = 1
+SELL = -1
+SIDE_NAMES = {BUY: 'buy', SELL: 'sell'}
+
+
+class Ledger:
+    '''
+    Ledger kept in memory, in a growable structured array (see LEDGER_DTYPE),
+    and written to ledger_file in bulk by flush() or at the end of a with block.
+    The file gets exactly the same lines as log_transaction() would write.
+
+    Input:
+        ledger_file (str, default None): path to the ledger file. If None,
+            the transactions are only kept in memory. Paths ending in '.ledger'
+            (or existing binary ledgers) are written in the binary format of
+            trading.store instead of text.
+        mode (str, default 'a'): 'a' to append to the file, 'w' to replace it
+            on the first flush.
+
+    Example:
+        >>> with Ledger('ledger.txt', mode='w') as ledger:
+        ...     portfolio = create_portfolio([1000] * N, sim_data, 40, ledger)
+        ...     buy(21, 7, 1000, sim_data, 30, portfolio, ledger)
+    '''
+
+    def __init__(self, ledger_file=None, mode='a', capacity=1024):
+        self.ledger_file = ledger_file
+        self.mode = mode
+        self._records = np.zeros(capacity, dtype=LEDGER_DTYPE)
+        self._size = 0
+        self._flushed = 0 # records before this one are already in the file
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def records(self):
+        '''
+        Structured array of the transactions recorded so far (a view, not a copy).
+        '''
+        return self._records[:self._size]
+
+    def record(self, transaction_type, date, stock, number_of_shares, price, fees):
+        '''
+        Records a transaction, with the same inputs as log_transaction().
+        '''
+        if self._size == self._records.shape[0]:
+            # full: double the capacity
+            grown = np.zeros(2 * self._records.shape[0], dtype=LEDGER_DTYPE)
+            grown[:self._size] = self._records
+            self._records = grown
+
+        if transaction_type == 'buy':
+            side, cashflow = BUY, -1 * number_of_shares * price - fees
+        elif transaction_type == 'sell':
+            side, cashflow = SELL, number_of_shares * price - fees
+        else:
+            return
+        self._records[self._size] = (side, date, stock, int(number_of_shares), float(price), float(cashflow))
+        self._size += 1
+        if profiling.active is not None:
+            profiling.active.add_trade(stock)
+
+    def extend(self, records):
+        '''
+        Records a batch of transactions at once.
+
+        Input:
+            records (ndarray): structured array with the fields of LEDGER_DTYPE,
+                e.g. the records of another Ledger
+        '''
+        size = self._size + records.shape[0]
+        if size > self._records.shape[0]:
+            grown = np.zeros(max(size, 2 * self._records.shape[0]), dtype=LEDGER_DTYPE)
+            grown[:self._size] = self._records[:self._size]
+            self._records = grown
+        for name in LEDGER_DTYPE.names:
+            self._records[name][self._size:size] = records[name]
+        self._size = size
+        if profiling.active is not None:
+            for stock in records['stock'].tolist():
+                profiling.active.add_trade(stock)
+
+    def lines(self, start=0, stop=None):
+        '''
+        Formats records start to stop as ledger file lines.
+        '''
+        records = self._records[start:self._size if stop is None else stop]
+        return ['{},{},{},{},{},{}\n'.format(SIDE_NAMES[side], date, stock, shares, '%.2f'%price, '%.2f'%cashflow)
+                for side, date, stock, shares, price, cashflow in records.tolist()]
+
+    def flush(self):
+        '''
+        Writes the records that are not in the file yet, in one go.
+        '''
+        if self.ledger_file is None:
+            return
+        stats = profiling.active
+        with profiling.stage('process.flush'):
+            records = self._records[self._flushed:self._size]
+            if store.is_binary_ledger(self.ledger_file):
+                written = store.append_ledger(self.ledger_file, records, self.mode)
+                record_bytes = np.full(records.shape[0], store.LEDGER_RECORD.itemsize)
+            else:
+                lines = self.lines(self._flushed)
+                with open(self.ledger_file, self.mode) as filewrite:
+                    start = filewrite.tell()
+                    filewrite.writelines(lines)
+                    written = filewrite.tell() - start
+                if stats is not None:
+                    record_bytes = np.array([len(line) for line in lines])
+            if stats is not None:
+                stats.add_bytes(written)
+                # bytes of each stock's records
+                stock_bytes = np.bincount(records['stock'], weights=record_bytes)
+                for stock in np.flatnonzero(stock_bytes):
+                    stats.add_stock_bytes(stock, int(stock_bytes[stock]))
+        self._flushed = self._size
+        self.mode = 'a'
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.flush()
+
+
+class Portfolio:
+    '''
+    Shares held in each stock, as a numpy array, and the cash we have left.
+
+    It can be used like the old list of shares (portfolio[stock], len(portfolio)),
+    and buy_many()/sell_many() trade many stocks on one day in a few array
+    operations, recording the transactions in one batch.
+
+    All the stocks share the same cash. Buying spends it and selling puts the
+    proceeds back; a buy spends at most the cash left, and isn't made if that
+    doesn't pay for a share and the fees. Cash defaults to 'inf', which means
+    unlimited: then buys are exactly those of process.buy() on a list.
+
+    Input:
+        shares (list or 1darray): number of shares of each stock
+        cash (float, default inf): the cash we have
+
+    Example:
+        >>> portfolio = create_portfolio([1000] * N, sim_data, 40, 'ledger.txt', cash=1000 * N)
+        >>> portfolio.buy_many(21, [3, 7, 9], 1000, sim_data, 30, 'ledger.txt')
+        >>> portfolio.shares, portfolio.cash
+    '''
+    __slots__ = ('shares', 'cash')
+
+    def __init__(self, shares, cash=np.inf):
+        self.shares = np.array(shares, dtype=float)
+        self.cash = float(cash)
+
+    def __len__(self):
+        return self.shares.shape[0]
+
+    def __getitem__(self, stock):
+        return self.shares[stock]
+
+    def __setitem__(self, stock, number_of_shares):
+        self.shares[stock] = number_of_shares
+
+    def __repr__(self):
+        return 'Portfolio(shares={}, cash={})'.format(self.shares.tolist(), self.cash)
+
+    def buy(self, date, stock, available_capital, stock_prices, fees, ledger_file):
+        '''
+        Same as process.buy() on this portfolio, for one stock.
+        '''
+        price = stock_prices[date, stock]
+        if self.cash < available_capital:
+            # not enough cash left: spend what there is, if it buys a share
+            available_capital = self.cash
+            if (available_capital - fees) // price <= 0:
+                return
+        amount_can_buy = (available_capital - fees) // price
+        self.shares[stock] = self.shares[stock] + amount_can_buy
+        self.cash -= amount_can_buy * price + fees
+        log_transaction('buy', date, stock, amount_can_buy, price, fees, ledger_file)
+
+    def sell(self, date, stock, stock_prices, fees, ledger_file):
+        '''
+        Same as process.sell() on this portfolio, for one stock.
+        '''
+        if self.shares[stock] != 0:
+            price = stock_prices[date, stock]
+            log_transaction('sell', date, stock, self.shares[stock], price, fees, ledger_file)
+            self.cash += self.shares[stock] * price - fees
+            self.shares[stock] = 0
+
+    def buy_many(self, date, stocks, available_capital, stock_prices, fees, ledger_file):
+        '''
+        Buys shares of several stocks on the same day, with at most available_capital
+        for each one, fees included. The purchases are paid in the order of stocks,
+        each with what is left of the cash.
+
+        Input:
+            date (int): the date of the transactions (nb of days since day 0)
+            stocks (list or 1darray): the stocks we want to buy, each at most once
+            available_capital (float or 1darray): the maximum amount to spend on each stock
+            stock_prices (ndarray): the stock price data
+            fees (float): transaction fees (fixed amount per transaction)
+            ledger_file (str or Ledger): path to the ledger file, or a Ledger to record into
+
+        Output:
+            bought (1darray): the number of shares bought of each stock (0 if not bought)
+        '''
+        stocks = np.asarray(stocks, dtype=int)
+        price = stock_prices[date, stocks]
+        bought, made = self._pay(price, available_capital, fees)
+
+        stocks, price, number_of_shares = stocks[made], price[made], bought[made]
+        self.shares[stocks] += number_of_shares
+        log_transactions(_batch(BUY, date, stocks, number_of_shares, price, -1 * number_of_shares * price - fees),
+                         ledger_file)
+        return bought
+
+    def sell_many(self, date, stocks, stock_prices, fees, ledger_file):
+        '''
+        Sells all the shares of several stocks on the same day (those we hold).
+
+        Input:
+            date (int), stocks (list or 1darray), stock_prices (ndarray), fees (float),
+            ledger_file (str or Ledger): as in buy_many()
+
+        Output:
+            sold (1darray): the number of shares sold of each stock (0 if we held none)
+        '''
+        stocks = np.asarray(stocks, dtype=int)
+        sold = self.shares[stocks]
+        made = sold != 0
+
+        stocks, number_of_shares = stocks[made], sold[made]
+        price = stock_prices[date, stocks]
+        self.cash += np.sum(number_of_shares * price - fees)
+        self.shares[stocks] = 0
+        log_transactions(_batch(SELL, date, stocks, number_of_shares, price, number_of_shares * price - fees),
+                         ledger_file)
+        return sold
+
+    def _pay(self, price, available_capital, fees):
+        '''
+        Pays for purchases at price, in order, with at most available_capital for
+        each one and what is left of the cash.
+
+        Output:
+            bought (1darray): the number of shares bought at each price (0 if not made)
+            made (1darray): whether each purchase is made
+        '''
+        available_capital = np.broadcast_to(np.asarray(available_capital, dtype=float), price.shape)
+        bought = (available_capital - fees) // price
+        if self.cash == np.inf:
+            return bought, np.ones(price.shape, dtype=bool)
+
+        # the purchases made with their whole budget, until the cash runs short
+        cost = bought * price + fees
+        cash_before = self.cash - (np.cumsum(cost) - cost)
+        made = np.logical_and.accumulate(cash_before >= available_capital)
+        paid = int(np.sum(made))
+        self.cash -= np.sum(cost[:paid])
+
+        # then each one spends what is left, if it pays for a share and the fees
+        for k in range(paid, price.shape[0]):
+            bought[k] = (min(available_capital[k], self.cash) - fees) // price[k]
+            made[k] = self.cash >= available_capital[k] or bought[k] > 0
+            if made[k]:
+                self.cash -= bought[k] * price[k] + fees
+            else:
+                bought[k] = 0
+        return bought, made
+
+
+def _batch(side, date, stocks, number_of_shares, price, cashflow):
+    # transactions of one side and one day, as records of LEDGER_DTYPE
+    records = np.zeros(stocks.shape[0], dtype=LEDGER_DTYPE)
+    records['side'] = side
+    records['date'] = date
+    records['stock'] = stocks
+    records['shares'] = number_of_shares
+    records['price'] = price
+    records['cashflow'] = cashflow
+    return records
+
 
 def log_transaction(transaction_type, date, stock, number_of_shares, price, fees, ledger_file):
     '''
@@ -12,7 +305,8 @@ def log_transaction(transaction_type, date, stock, number_of_shares, price, fees
         number_of_shares (int): the number of shares bought or sold
         price (float): the price of a share at the time of the transaction
         fees (float): transaction fees (fixed amount per transaction, independent of the number of shares)
-        ledger_file (str): path to the ledger file
+        ledger_file (str or Ledger): path to the ledger file, or a Ledger to record into.
+            Paths ending in '.ledger' are binary ledgers (see trading.store).
 
     Output: returns None.
         Writes one line in the ledger file to record a transaction with the input information.
@@ -26,14 +320,48 @@ def log_transaction(transaction_type, date, stock, number_of_shares, price, fees
         buy,5,2,10,100.00,-1050.00
             >>> log_transaction('buy', 5, 2, 10, 100, 50, 'ledger.txt')
     '''
+    if isinstance(ledger_file, Ledger):
+        ledger_file.record(transaction_type, date, stock, number_of_shares, price, fees)
+        return
+    # by extension only: opening the file to read its magic number would double
+    # the file operations of every transaction
+    if str(ledger_file).endswith(store.LEDGER_EXTENSION):
+        with Ledger(ledger_file, capacity=1) as ledger:
+            ledger.record(transaction_type, date, stock, number_of_shares, price, fees)
+        return
 
-    with open(ledger_file, 'a') as filewrite:
+    with profiling.stage('process.log_transaction'), open(ledger_file, 'a') as filewrite:
+        start = filewrite.tell()
         if transaction_type == 'buy':
             filewrite.write('{},{},{},{},{},{}\n'.format(transaction_type, date, stock,
             int(number_of_shares), '%.2f'%float(price), '%.2f'%float(-1 * number_of_shares * price - fees)))
         if transaction_type == 'sell':
             filewrite.write('{},{},{},{},{},{}\n'.format(transaction_type, date, stock,
             int(number_of_shares), '%.2f'%float(price), '%.2f'%float(number_of_shares * price - fees)))
+        if profiling.active is not None and filewrite.tell() > start:
+            profiling.active.add_trade(stock)
+            profiling.active.add_bytes(filewrite.tell() - start)
+            profiling.active.add_stock_bytes(stock, filewrite.tell() - start)
+
+def log_transactions(records, ledger_file):
+    '''
+    Records a batch of transactions in ledger_file, in one write.
+
+    Input:
+        records (ndarray): structured array with the fields of LEDGER_DTYPE
+        ledger_file (str or Ledger): path to the ledger file (appended to),
+            or a Ledger to record into
+
+    Output: None
+    '''
+    if records.shape[0] == 0:
+        return
+    if isinstance(ledger_file, Ledger):
+        ledger_file.extend(records)
+        return
+    with Ledger(ledger_file, capacity=records.shape[0]) as ledger:
+        ledger.extend(records)
+
 
 def buy(date, stock, available_capital, stock_prices, fees, portfolio, ledger_file):
     '''
@@ -47,8 +375,8 @@ def buy(date, stock, available_capital, stock_prices, fees, portfolio, ledger_fi
             this must also cover fees
         stock_prices (ndarray): the stock price data
         fees (float): total transaction fees (fixed amount per transaction)
-        portfolio (list): our current portfolio
-        ledger_file (str): path to the ledger file
+        portfolio (list or Portfolio): our current portfolio
+        ledger_file (str or Ledger): path to the ledger file, or a Ledger to record into
 
     Output: None
 
@@ -56,6 +384,9 @@ def buy(date, stock, available_capital, stock_prices, fees, portfolio, ledger_fi
         Spend at most 1000 to buy shares of stock 7 on day 21, with fees 30:
             >>> buy(21, 7, 1000, sim_data, 30, portfolio)
     '''
+    if isinstance(portfolio, Portfolio):
+        portfolio.buy(date, stock, available_capital, stock_prices, fees, ledger_file)
+        return
     amount_can_buy = (available_capital - fees) // stock_prices[date, stock]
     portfolio[stock] = portfolio[stock] + amount_can_buy
     log_transaction('buy', date, stock, amount_can_buy, stock_prices[date,stock], fees, ledger_file)
@@ -71,8 +402,8 @@ def sell(date, stock, stock_prices, fees, portfolio, ledger_file):
         stock (int): the stock we want to sell
         stock_prices (ndarray): the stock price data
         fees (float): transaction fees (fixed amount per transaction)
-        portfolio (list): our current portfolio
-        ledger_file (str): path to the ledger file
+        portfolio (list or Portfolio): our current portfolio
+        ledger_file (str or Ledger): path to the ledger file, or a Ledger to record into
 
     Output: None
 
@@ -80,6 +411,9 @@ def sell(date, stock, stock_prices, fees, portfolio, ledger_file):
         To sell all our shares of stock 1 on day 8, with fees 20:
             >>> sell(8, 1, sim_data, 20, portfolio)
     '''
+    if isinstance(portfolio, Portfolio):
+        portfolio.sell(date, stock, stock_prices, fees, ledger_file)
+        return
     # if we don't holding share we can't sell
     if portfolio[stock] != 0:
         log_transaction('sell', date, stock, portfolio[stock], stock_prices[date,stock], fees, ledger_file)
@@ -87,7 +421,7 @@ def sell(date, stock, stock_prices, fees, portfolio, ledger_file):
 
 
 
-def create_portfolio(available_amounts, stock_prices, fees, ledger_file):
+def create_portfolio(available_amounts, stock_prices, fees, ledger_file, cash=np.inf):
     '''
     Create a portfolio by buying a given number of shares of each stock.
 
@@ -96,26 +430,35 @@ def create_portfolio(available_amounts, stock_prices, fees, ledger_file):
             purchase for each stock (this should cover fees)
         stock_prices (ndarray): the stock price data
         fees (float): transaction fees (fixed amount per transaction)
-        ledger_file (str): path to the ledger file
+        ledger_file (str or Ledger): path to the ledger file (it is replaced),
+            or a Ledger to record into
+        cash (float, default inf): the money we have, which pays for the initial
+            purchases, stock by stock, and what comes after. 'inf' for unlimited.
+            A stock that the cash left doesn't pay a share and the fees for isn't bought.
 
     Output:
-        portfolio (list): our initial portfolio
+        portfolio (Portfolio): our initial portfolio
 
     Example:
         Spend 1000 for each stock (including 40 fees for each purchase):
         >>> N = sim_data.shape[1]
         >>> portfolio = create_portfolio([1000] * N, sim_data, 40, 'ledger.txt')
     '''
-    # initialization
+    # initialization, all the stocks at once
     num_of_stock = stock_prices.shape[1]
-    portfolio = [None] * num_of_stock
-
-    # Loop for get day0 portfolio
-    for i in range(num_of_stock):
-        portfolio[i] = int( (available_amounts[i] - fees) // stock_prices[0, i] )
+    portfolio = Portfolio(np.zeros(num_of_stock), cash)
+    price = stock_prices[0, :]
+    # as in buy_many(), a stock that the cash left doesn't pay a share and the
+    # fees for isn't bought: no transaction, no fees, 0 shares
+    bought, made = portfolio._pay(price, available_amounts, fees)
+    stocks, price, bought = np.flatnonzero(made), price[made], bought[made]
+    portfolio.shares[stocks] = bought
 
-    # write it in ledger file
-    with open("ledger.txt",'w') as writefile:
-        for i in range(num_of_stock):
-            log_transaction('buy', 0, i, portfolio[i], stock_prices[0,i], fees, ledger_file)
+    # write it in ledger file, all at once
+    records = _batch(BUY, 0, stocks, bought, price, -1 * bought * price - fees)
+    if isinstance(ledger_file, Ledger):
+        ledger_file.extend(records)
+    else:
+        with Ledger(ledger_file, mode='w', capacity=max(num_of_stock, 1)) as ledger:
+            ledger.extend(records)
     return portfolio
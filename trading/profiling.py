@@ -0,0 +1,198 @@
+# Opt-in timing and counting of the stages of a strategy run.
+import functools
+import time
+
+
+# the RunStats being recorded into, None when profiling is off.
+# The hooks in the other modules only check this, so they cost next to nothing when it is off.
+active = None
+
+
+class RunStats:
+    '''
+    Statistics of one strategy run: wall time, calls and bytes written of each
+    stage, trades, time and bytes written of each stock, and their totals.
+
+    Attributes:
+        name (str): name of the run (the strategy)
+        stages (dict): {stage: {'calls': int, 'seconds': float, 'bytes': int}}, bytes
+            being those written to ledger files while the stage was open
+            (stages inside another one count for both, like their seconds)
+        stocks (dict): {stock: {'trades': int, 'seconds': float, 'bytes': int}}, seconds
+            being the time spent deciding and trading on that stock, and bytes the
+            size of its ledger records (file headers only count in the totals)
+        trades (int): number of transactions recorded
+        bytes_written (int): bytes written to ledger files
+
+    Example:
+        >>> result, stats = strategy.momentum(stock_prices, profile=True)
+        >>> print(stats.summary())
+        >>> stats.stages['indicators.oscillator']['seconds']
+    '''
+
+    def __init__(self, name=None):
+        self.name = name
+        self.stages = {}
+        self.stocks = {}
+        self.trades = 0
+        self.bytes_written = 0
+        self._open = [] # stages open right now, innermost last
+
+    def _stage_entry(self, stage):
+        return self.stages.setdefault(stage, {'calls': 0, 'seconds': 0.0, 'bytes': 0})
+
+    def _stock_entry(self, stock):
+        return self.stocks.setdefault(int(stock), {'trades': 0, 'seconds': 0.0, 'bytes': 0})
+
+    def add_time(self, stage, seconds, calls=1):
+        entry = self._stage_entry(stage)
+        entry['calls'] += calls
+        entry['seconds'] += seconds
+
+    def add_stock_time(self, stock, seconds):
+        self._stock_entry(stock)['seconds'] += seconds
+
+    def add_trade(self, stock):
+        self._stock_entry(stock)['trades'] += 1
+        self.trades += 1
+
+    def add_bytes(self, number_of_bytes):
+        '''
+        Counts bytes written, in the total and in every open stage.
+        '''
+        self.bytes_written += number_of_bytes
+        for stage in set(self._open):
+            self._stage_entry(stage)['bytes'] += number_of_bytes
+
+    def add_stock_bytes(self, stock, number_of_bytes):
+        self._stock_entry(stock)['bytes'] += number_of_bytes
+
+    def stage(self, name):
+        '''
+        Context manager that times a block as the stage name.
+        '''
+        return _Stage(self, name)
+
+    def as_dict(self):
+        '''
+        The statistics as plain dicts and numbers (e.g. to dump as JSON).
+        '''
+        return {'name': self.name,
+                'stages': {name: dict(entry) for name, entry in self.stages.items()},
+                'stocks': {stock: dict(entry) for stock, entry in self.stocks.items()},
+                'trades': self.trades,
+                'bytes_written': self.bytes_written}
+
+    def summary(self):
+        '''
+        The statistics as a printable table, slowest stage first.
+        '''
+        lines = ['{} ({} trades, {} bytes written)'.format(self.name, self.trades, self.bytes_written),
+                 '{:<28} {:>8} {:>12} {:>12}'.format('stage', 'calls', 'seconds', 'bytes')]
+        for name, entry in sorted(self.stages.items(), key=lambda item: -item[1]['seconds']):
+            lines.append('{:<28} {:>8} {:>12.6f} {:>12}'.format(name, entry['calls'], entry['seconds'], entry['bytes']))
+        return '\n'.join(lines)
+
+    def __repr__(self):
+        return 'RunStats({!r}, {} stages, {} stocks, {} trades)'.format(self.name, len(self.stages),
+                                                                     len(self.stocks), self.trades)
+
+
+class _Stage:
+    __slots__ = ('stats', 'name', 'started')
+
+    def __init__(self, stats, name):
+        self.stats = stats
+        self.name = name
+
+    def __enter__(self):
+        self.stats._open.append(self.name)
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stats.add_time(self.name, time.perf_counter() - self.started)
+        self.stats._open.pop()
+
+
+class _NoStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+
+_NO_STAGE = _NoStage()
+
+
+def stage(name):
+    '''
+    Times a block as the stage name of the active RunStats, if any.
+
+    Example:
+        >>> with profiling.stage('strategy.sell_all'):
+        ...     sell_all(stock_prices, finaldate, fees, portfolio, book)
+    '''
+    if active is None:
+        return _NO_STAGE
+    return _Stage(active, name)
+
+
+class recording:
+    '''
+    Makes stats the active RunStats inside a with block.
+    '''
+
+    def __init__(self, stats):
+        self.stats = stats
+
+    def __enter__(self):
+        global active
+        self.previous = active
+        active = self.stats
+        return self.stats
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        global active
+        active = self.previous
+
+
+def timed(name):
+    '''
+    Decorator that times every call of a function as the stage name.
+    '''
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if active is None:
+                return function(*args, **kwargs)
+            with _Stage(active, name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def profiled(function):
+    '''
+    Decorator that gives a strategy a profile keyword argument:
+        profile=None (default): no profiling, the strategy returns as usual
+        profile=True: the strategy returns (what it returns as usual, its RunStats),
+            so that an error message isn't lost
+        profile=callable: the strategy returns as usual, and the callable is
+            called with its RunStats at the end of the run
+    '''
+    @functools.wraps(function)
+    def wrapper(*args, profile=None, **kwargs):
+        if profile is None or profile is False:
+            return function(*args, **kwargs)
+        stats = RunStats(function.__name__)
+        with recording(stats), _Stage(stats, 'strategy.' + function.__name__):
+            result = function(*args, **kwargs)
+        if callable(profile):
+            profile(stats)
+            return result
+        return result, stats
+    return wrapper
@@ -0,0 +1,444 @@
+# Bar by bar replay of price data to several strategies at once, with asyncio.
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from trading import process as proc
+from trading import store
+from trading import streaming
+
+
+async def file_bars(data_file, block_days=256, finaldate=None, interval=0):
+    '''
+    Replays a price file (text or binary store) one day at a time.
+    Blocks of days are read in a worker thread, so reading never blocks the event loop.
+
+    Input:
+        data_file (str): path to the price file
+        block_days (int, default 256): days read from the file at a time
+        finaldate (int, default None): the last day to replay (from 0), default all
+        interval (float, default 0): seconds to wait between two bars
+
+    Output:
+        async generator of (day, prices): prices is a 1darray with one price per stock
+    '''
+    loop = asyncio.get_running_loop()
+    blocks = store.iter_day_blocks(data_file, block_days, finaldate)
+    while True:
+        block = await loop.run_in_executor(None, next, blocks, None)
+        if block is None:
+            return
+        first_day, prices = block
+        for k in range(prices.shape[0]):
+            yield first_day + k, prices[k, :]
+            await asyncio.sleep(interval)
+
+
+async def socket_bars(host='127.0.0.1', port=None, path=None):
+    '''
+    Reads bars from a local socket: one line per day, with the prices of the
+    stocks separated by commas or spaces ('nan' once delisted), until the
+    connection is closed.
+
+    Input:
+        host (str, default '127.0.0.1'), port (int): TCP address to connect to
+        path (str, default None): path of a unix socket, instead of host and port
+
+    Output:
+        async generator of (day, prices), as file_bars()
+    '''
+    if path != None:
+        reader, writer = await asyncio.open_unix_connection(path)
+    else:
+        reader, writer = await asyncio.open_connection(host, port)
+    day = 0
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                return
+            line = line.decode().replace(',', ' ').split()
+            if len(line) == 0:
+                continue
+            yield day, np.array(line, dtype=float)
+            day += 1
+    finally:
+        writer.close()
+
+
+class Subscription:
+    '''
+    One subscriber of a Feed: a bounded queue of bars, and the statistics of
+    how the subscriber keeps up with them.
+
+    Attributes:
+        received (int): bars taken from the queue
+        dropped (int): bars thrown away because the queue was full
+        latency (list): seconds from the bar being published to being processed,
+            one entry per bar passed to done()
+        closed (bool): whether the subscriber stopped taking bars, see close()
+    '''
+
+    def __init__(self, maxsize, policy):
+        self.queue = asyncio.Queue(maxsize)
+        self.policy = policy
+        self.received = 0
+        self.dropped = 0
+        self.latency = []
+        self.closed = False
+
+    async def put(self, bar):
+        if self.closed:
+            return
+        if self.policy == 'block':
+            await self.queue.put(bar)
+            return
+        # drop the oldest bar to make room, so a slow subscriber never holds up the feed
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(bar)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        bar = await self.queue.get()
+        if bar is None:
+            raise StopAsyncIteration
+        self.received += 1
+        return bar
+
+    def close(self):
+        '''
+        Stops taking bars: the ones waiting are thrown away and the next ones
+        are not queued, so a subscriber that quits early never holds up the
+        feed, even with policy 'block'.
+        '''
+        self.closed = True
+        while not self.queue.empty():
+            self.queue.get_nowait()
+
+    def done(self, bar):
+        '''
+        Marks a bar as processed, to measure its latency.
+        '''
+        self.latency.append(time.perf_counter() - bar[2])
+
+    def latency_report(self):
+        '''
+        Summary of the per-bar latency (in seconds).
+
+        Output:
+            report (dict): 'bars', 'dropped', 'mean', 'p50', 'p95', 'p99', 'max'
+        '''
+        latency = np.array(self.latency)
+        report = {'bars': self.received, 'dropped': self.dropped}
+        if latency.shape[0] == 0:
+            report.update(mean=np.nan, p50=np.nan, p95=np.nan, p99=np.nan, max=np.nan)
+            return report
+        p50, p95, p99 = np.percentile(latency, [50, 95, 99])
+        report.update(mean=float(latency.mean()), p50=float(p50), p95=float(p95), p99=float(p99),
+                      max=float(latency.max()))
+        return report
+
+
+class Feed:
+    '''
+    Fans each bar of a source out to every subscriber.
+
+    Each subscriber has its own bounded queue. With policy 'drop_oldest' (default),
+    a subscriber whose queue is full loses its oldest bar, and the others carry on.
+    With 'block', the feed waits for it, so no bar is ever lost but every
+    subscriber goes at the pace of the slowest one. The streaming strategies
+    carry on from the next bar they get, as if the dropped days didn't exist.
+
+    Example:
+        >>> feed = Feed()
+        >>> fast, slow = feed.subscribe(), feed.subscribe(maxsize=16)
+        >>> await asyncio.gather(feed.run(file_bars('stock_data_5y.txt')), consume(fast), consume(slow))
+    '''
+
+    def __init__(self):
+        self.subscriptions = []
+
+    def subscribe(self, maxsize=1024, policy='drop_oldest'):
+        '''
+        Adds a subscriber, and returns its Subscription to iterate over with async for.
+        '''
+        subscription = Subscription(maxsize, policy)
+        self.subscriptions.append(subscription)
+        return subscription
+
+    async def run(self, source):
+        '''
+        Publishes every bar of source, then tells the subscribers it's over.
+        Bars are (day, prices, published_at) tuples, published_at being time.perf_counter().
+        '''
+        async for day, prices in source:
+            bar = (day, prices, time.perf_counter())
+            for subscription in self.subscriptions:
+                await subscription.put(bar)
+            # let the subscribers work on it
+            await asyncio.sleep(0)
+        for subscription in self.subscriptions:
+            if subscription.closed:
+                continue
+            if subscription.policy == 'block':
+                await subscription.queue.put(None)
+            else:
+                while subscription.queue.full():
+                    subscription.queue.get_nowait()
+                    subscription.dropped += 1
+                subscription.queue.put_nowait(None)
+
+
+class LedgerSink:
+    '''
+    Ledger that never makes its writer wait for the disk: transactions are kept
+    in memory, and every batch_size of them are handed to a background thread
+    that writes them (in order) while recording goes on.
+
+    Input:
+        ledger_file (str): path to the ledger file (replaced), text or binary
+            as for process.Ledger
+        batch_size (int, default 256): transactions per write
+    '''
+
+    def __init__(self, ledger_file, batch_size=256):
+        self.ledger_file = ledger_file
+        self.batch_size = batch_size
+        self._writer = ThreadPoolExecutor(max_workers=1) # one thread keeps the batches in order
+        self._pending = []
+        self._batch = proc.Ledger(ledger_file, mode='w', capacity=batch_size)
+
+    def record(self, transaction_type, date, stock, number_of_shares, price, fees):
+        '''
+        Records a transaction, with the same inputs as process.log_transaction().
+        '''
+        self._batch.record(transaction_type, date, stock, number_of_shares, price, fees)
+        if len(self._batch) >= self.batch_size:
+            self._hand_off()
+
+    def _hand_off(self):
+        self._pending = [future for future in self._pending if not future.done()]
+        self._pending.append(self._writer.submit(self._batch.flush))
+        self._batch = proc.Ledger(self.ledger_file, mode='a', capacity=self.batch_size)
+
+    async def close(self):
+        '''
+        Writes what is left and waits for every write to finish.
+        '''
+        self._hand_off()
+        for future in self._pending:
+            await asyncio.wrap_future(future)
+        self._writer.shutdown()
+
+
+class _Book:
+    '''
+    Portfolio of a streaming strategy, trading at the price of the current bar
+    the same way process.buy() and process.sell() do.
+    '''
+
+    def __init__(self, prices, amount, fees, sink):
+        self.amount = amount
+        self.fees = fees
+        self.sink = sink
+        self.shares = [int((amount - fees) // price) for price in prices.tolist()]
+        for stock, price in enumerate(prices.tolist()):
+            sink.record('buy', 0, stock, self.shares[stock], price, fees)
+
+    def buy(self, day, stock, price):
+        number_of_shares = (self.amount - self.fees) // price
+        self.shares[stock] = self.shares[stock] + number_of_shares
+        self.sink.record('buy', day, stock, number_of_shares, price, self.fees)
+
+    def sell(self, day, stock, price, fees=None):
+        if self.shares[stock] != 0:
+            self.sink.record('sell', day, stock, self.shares[stock], price, self.fees if fees is None else fees)
+            self.shares[stock] = 0
+
+    def sell_all(self, day, prices):
+        # as strategy.sell_all(), skipped when the last stock has no price
+        if np.isnan(prices[-1]) == False:
+            for stock, price in enumerate(prices.tolist()):
+                self.sell(day, stock, price)
+
+
+async def crossing_averages(subscription, SMAperiod=200, FMAperiod=50, SMAweights=[], FMAweights=[], amount=5000,
+                            fees=20, ledger='ledger_crossing_averages.txt', finaldate=1824):
+    '''
+    strategy.crossing_averages() bar by bar: buy when the FMA goes above the SMA,
+    sell when it goes below, with moving averages kept up to date one bar at a time
+    (trading.streaming). On the same bars, the ledger has the same transactions
+    as strategy.crossing_averages(), in day order (the averages can differ in the
+    last digits, so an exact tie between them may go the other way).
+
+    Input:
+        subscription (Subscription): where the bars come from
+        SMAperiod, FMAperiod, SMAweights, FMAweights, amount, fees, ledger: as in strategy.crossing_averages()
+        finaldate (int, default 1824): the day we sell everything (or the last bar, if the feed ends before)
+
+    Output:
+        report (dict): latency of the bars, see Subscription.latency_report()
+    '''
+    if SMAperiod < FMAperiod:
+        return 'Error with periods (SMAperiod < FMAperiod)'
+    sink = LedgerSink(ledger)
+    book = None
+    last = None
+    async for bar in subscription:
+        day, prices = bar[0], bar[1]
+        if book is None:
+            num_of_stock = prices.shape[0]
+            book = _Book(prices, amount, fees, sink)
+            SMA = streaming.MovingAverage(num_of_stock, SMAperiod, SMAweights)
+            FMA = streaming.MovingAverage(num_of_stock, FMAperiod, FMAweights)
+            slow = np.full(num_of_stock, np.nan) # averages up to yesterday, the ones we decide with today
+            fast = np.full(num_of_stock, np.nan)
+            sign = np.zeros(num_of_stock, dtype=np.int8)
+            delisted = np.zeros(num_of_stock, dtype=bool)
+
+        if day == finaldate:
+            book.sell_all(day, prices)
+        elif SMAperiod <= day < finaldate:
+            # throw away the stocks without a price, for a price of 0 and no fees
+            for stock in np.flatnonzero(np.isnan(prices) & ~delisted).tolist():
+                book.sell(day, stock, 0, fees=0)
+            delisted |= np.isnan(prices)
+
+            # position of SMA and FMA [>, =, <]:[-1,0,1], trade when it changes
+            today = (slow < fast).astype(np.int8) - (slow > fast).astype(np.int8)
+            if day > SMAperiod:
+                change = today - sign
+                for stock in np.flatnonzero((change != 0) & ~delisted).tolist():
+                    if change[stock] > 0:
+                        book.buy(day, stock, prices[stock])
+                    else:
+                        book.sell(day, stock, prices[stock])
+            sign = today
+
+        slow = SMA.update(prices)
+        fast = FMA.update(prices)
+        last = bar
+        subscription.done(bar)
+
+    if last is not None and last[0] < finaldate:
+        book.sell_all(last[0], last[1])
+    await sink.close()
+    return subscription.latency_report()
+
+
+async def momentum(subscription, period=200, minimum_cool_down_period=10, overvalued_threshold=[0.7, 0.8],
+                   undervalued_threshold=[0.2, 0.3], osc_method='stochastic', amount=5000, fees=20,
+                   ledger='ledger_momentum.txt', finaldate=1824):
+    '''
+    strategy.momentum() bar by bar, with the oscillator kept up to date one bar at a
+    time (trading.streaming). On the same bars, the ledger has the same transactions
+    as strategy.momentum(), in day order (up to an oscillator landing exactly on a threshold).
+
+    Input:
+        subscription (Subscription): where the bars come from
+        period, minimum_cool_down_period, overvalued_threshold, undervalued_threshold,
+        osc_method, amount, fees, ledger: as in strategy.momentum()
+        finaldate (int, default 1824): the day we sell everything (or the last bar, if the feed ends before)
+
+    Output:
+        report (dict): latency of the bars, see Subscription.latency_report()
+    '''
+    sink = LedgerSink(ledger)
+    step = max(minimum_cool_down_period, 1)
+    book = None
+    last = None
+    async for bar in subscription:
+        day, prices = bar[0], bar[1]
+        if book is None:
+            num_of_stock = prices.shape[0]
+            book = _Book(prices, amount, fees, sink)
+            oscillator = (streaming.Stochastic if osc_method == 'stochastic' else streaming.RSI)(num_of_stock, period)
+            osc = np.full(num_of_stock, np.nan) # oscillator up to yesterday, the one we decide with today
+            next_day = np.full(num_of_stock, period) # next day we look at each stock
+            delisted = np.zeros(num_of_stock, dtype=bool)
+
+        if day == finaldate:
+            book.sell_all(day, prices)
+        elif period <= day < finaldate:
+            looking = ~delisted & (next_day <= day)
+            # throw away the stocks without a price, for a price of 0 and no fees
+            for stock in np.flatnonzero(looking & np.isnan(prices)).tolist():
+                book.sell(day, stock, 0, fees=0)
+                delisted[stock] = True
+            looking &= ~delisted
+
+            sell_hit = (osc > overvalued_threshold[0]) & (osc < overvalued_threshold[1])
+            buy_hit = ~sell_hit & (osc > undervalued_threshold[0]) & (osc < undervalued_threshold[1])
+            for stock in np.flatnonzero(looking & (sell_hit | buy_hit)).tolist():
+                if sell_hit[stock]:
+                    book.sell(day, stock, prices[stock])
+                else:
+                    book.buy(day, stock, prices[stock])
+                next_day[stock] = day + step # skip some days if we bought or sold
+
+        osc = oscillator.update(prices)
+        last = bar
+        subscription.done(bar)
+
+    if last is not None and last[0] < finaldate:
+        book.sell_all(last[0], last[1])
+    await sink.close()
+    return subscription.latency_report()
+
+
+STRATEGIES = {'crossing_averages': crossing_averages, 'momentum': momentum}
+
+
+async def _consume(strategy, subscription, kwargs):
+    # whatever way the strategy ends (an error message, an exception), it stops taking bars
+    try:
+        return await strategy(subscription, **kwargs)
+    finally:
+        subscription.close()
+
+
+async def replay(source, strategy_kwargs, maxsize=1024, policy='drop_oldest'):
+    '''
+    Runs several streaming strategies at once on the bars of source.
+
+    Input:
+        source: async generator of (day, prices), e.g. file_bars() or socket_bars()
+        strategy_kwargs (dict): arguments of each strategy to run, keyed by name
+            ('crossing_averages' or 'momentum')
+        maxsize (int, default 1024): bars each strategy can fall behind by
+        policy (str, default 'drop_oldest'): what to do when a strategy is
+            maxsize bars behind, see Feed
+
+    Output:
+        reports (dict): the latency report of each strategy
+    '''
+    for name in strategy_kwargs:
+        if name not in STRATEGIES:
+            return 'Unknown strategy {}, choose from {}.'.format(name, tuple(STRATEGIES))
+
+    feed = Feed()
+    consumers = [_consume(STRATEGIES[name], feed.subscribe(maxsize, policy), kwargs)
+                 for name, kwargs in strategy_kwargs.items()]
+    results = await asyncio.gather(feed.run(source), *consumers)
+    return dict(zip(strategy_kwargs, results[1:]))
+
+
+def replay_file(data_file, strategy_kwargs=None, finaldate=1824, interval=0, maxsize=1024, policy='drop_oldest'):
+    '''
+    Replays a price file to the streaming strategies, as if the prices came in
+    one day at a time, and returns the latency report of each strategy.
+
+    Example:
+        >>> reports = replay_file('stock_data_5y.txt', {'crossing_averages': {}, 'momentum': {'osc_method': 'RSI'}})
+        >>> reports['momentum']['p99']
+    '''
+    if strategy_kwargs == None:
+        strategy_kwargs = {name: {} for name in STRATEGIES}
+    # copies, so that the caller's dicts are left as they were
+    strategy_kwargs = {name: {'finaldate': finaldate, **kwargs} for name, kwargs in strategy_kwargs.items()}
+    return asyncio.run(replay(file_bars(data_file, finaldate=finaldate, interval=interval),
+                              strategy_kwargs, maxsize, policy))
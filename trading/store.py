@@ -0,0 +1,327 @@
+# Binary file formats for price data and ledgers.
+import os
+import struct
+import numpy as np
+
+
+# Price store layout (little-endian):
+#   header: magic (8 bytes), version (uint32), reserved (uint32), days (int64), stocks (int64)
+#   volatility row: stocks float64
+#   initial price row: stocks float64
+#   body: (days, stocks) float64, column by column so each stock is contiguous
+PRICE_MAGIC = b'TRDPRICE'
+PRICE_VERSION = 1
+PRICE_HEADER = struct.Struct('<8sIIqq')
+
+
+def is_price_store(path):
+    '''
+    Checks whether path is a binary price store (by its magic number).
+    '''
+    with open(path, 'rb') as readfile:
+        return readfile.read(len(PRICE_MAGIC)) == PRICE_MAGIC
+
+
+def write_price_store(path, stock_prices, volatility, initial_price=None):
+    '''
+    Writes stock prices to a binary price store.
+
+    Input:
+        path (str): path of the store to create (overwritten if it exists)
+        stock_prices (ndarray): (days, stocks) price data
+        volatility (list or ndarray): volatility of each stock
+        initial_price (list or ndarray, default None): initial price of each stock,
+            the prices of day 0 if not given
+
+    Output: None
+    '''
+    stock_prices = np.asarray(stock_prices, dtype='<f8')
+    days, num_of_stock = stock_prices.shape
+    if initial_price is None:
+        initial_price = stock_prices[0, :]
+
+    with open(path, 'wb') as writefile:
+        writefile.write(PRICE_HEADER.pack(PRICE_MAGIC, PRICE_VERSION, 0, days, num_of_stock))
+        writefile.write(np.asarray(volatility, dtype='<f8').tobytes())
+        writefile.write(np.asarray(initial_price, dtype='<f8').tobytes())
+        writefile.write(stock_prices.tobytes(order='F'))
+
+
+def open_price_store(path):
+    '''
+    Opens a binary price store without reading the prices into memory.
+
+    Input:
+        path (str): path of the store
+
+    Output:
+        volatility (1darray): volatility of each stock
+        initial_price (1darray): initial price of each stock
+        stock_prices (memmap): read-only (days, stocks) view of the prices on disk.
+            Slicing columns only reads the pages of those stocks.
+    '''
+    with open(path, 'rb') as readfile:
+        magic, version, _, days, num_of_stock = PRICE_HEADER.unpack(readfile.read(PRICE_HEADER.size))
+        if magic != PRICE_MAGIC:
+            raise ValueError('{} is not a price store'.format(path))
+        if version != PRICE_VERSION:
+            raise ValueError('{} has unsupported price store version {}'.format(path, version))
+        volatility = np.frombuffer(readfile.read(8 * num_of_stock), dtype='<f8')
+        initial_price = np.frombuffer(readfile.read(8 * num_of_stock), dtype='<f8')
+
+    offset = PRICE_HEADER.size + 16 * num_of_stock
+    stock_prices = np.memmap(path, dtype='<f8', mode='r', offset=offset, shape=(days, num_of_stock), order='F')
+    return volatility, initial_price, stock_prices
+
+
+def read_price_text(path):
+    '''
+    Reads a text price file (first row volatility, then one row of prices per day,
+    the first of which holds the initial prices).
+
+    Output:
+        volatility (1darray), initial_price (1darray), stock_prices (ndarray): as open_price_store()
+    '''
+    whole_sim_data = np.loadtxt(path, ndmin=2)
+    return whole_sim_data[0, :], whole_sim_data[1, :], whole_sim_data[1:, :]
+
+
+def convert_text_store(text_file, store_file):
+    '''
+    Converts a text price file (like stock_data_5y.txt) to a binary price store.
+
+    Example:
+        >>> convert_text_store('stock_data_5y.txt', 'stock_data_5y.bin')
+        >>> stock_prices = get_data(method='read', data_file='stock_data_5y.bin')
+    '''
+    volatility, initial_price, stock_prices = read_price_text(text_file)
+    write_price_store(store_file, stock_prices, volatility, initial_price)
+
+
+def read_price_header(path):
+    '''
+    Reads the header of a price file (text or binary store) without its prices.
+
+    Output:
+        volatility (1darray): volatility of each stock
+        initial_price (1darray): initial price of each stock
+        days (int): number of days of prices
+    '''
+    if is_price_store(path):
+        volatility, initial_price, stock_prices = open_price_store(path)
+        return np.array(volatility), np.array(initial_price), stock_prices.shape[0]
+
+    with open(path, 'r') as readfile:
+        header = np.loadtxt(readfile, max_rows=2, ndmin=2)
+        # the initial prices are the first day, count it with the rest
+        days = 1 + sum(1 for line in readfile if line.strip())
+    return header[0, :], header[1, :], days
+
+
+def iter_day_blocks(path, block_days=256, finaldate=None):
+    '''
+    Reads a price file (text or binary store) block_days days at a time,
+    so that only one block of days is in memory at once.
+
+    Input:
+        path (str): path to the price file
+        block_days (int, default 256): number of days per block
+        finaldate (int, default None): the last day to read (from 0), default all
+
+    Output:
+        generator of (first_day, block): block is a (days, stocks) array of prices,
+            first_day the day of its first row
+    '''
+    if is_price_store(path):
+        _, _, stock_prices = open_price_store(path)
+        days = stock_prices.shape[0] if finaldate == None else min(finaldate + 1, stock_prices.shape[0])
+        for first_day in range(0, days, block_days):
+            yield first_day, np.array(stock_prices[first_day:min(first_day + block_days, days), :])
+        return
+
+    with open(path, 'r') as readfile:
+        readfile.readline() # volatility row
+        first_day = 0
+        while finaldate == None or first_day <= finaldate:
+            rows = block_days if finaldate == None else min(block_days, finaldate + 1 - first_day)
+            lines = [line for line in (readfile.readline() for _ in range(rows)) if line.strip()]
+            if len(lines) == 0:
+                return
+            yield first_day, np.loadtxt(lines, ndmin=2)
+            first_day += len(lines)
+
+
+def iter_column_blocks(path, block_stocks=1000, finaldate=None, first_stock=0, last_stock=None):
+    '''
+    Reads a price file (text or binary store) block_stocks stocks at a time,
+    with their whole history, so that only one block of stocks is in memory at once.
+
+    A binary store keeps each stock contiguous, so a block is one read. A text
+    file has to be scanned once per block: convert large files with
+    convert_text_store() first.
+
+    Input:
+        path (str): path to the price file
+        block_stocks (int, default 1000): number of stocks per block
+        finaldate (int, default None): the last day to read (from 0), default all
+        first_stock, last_stock (int, default 0 and None): only read stocks
+            first_stock to last_stock - 1 (default up to the last one)
+
+    Output:
+        generator of (first_stock, block): block is a (days, stocks) array of prices,
+            first_stock the column index of its first stock in the file
+
+    Example:
+        >>> for first_stock, block in iter_column_blocks('stock_data_5y.bin', 500):
+        ...     ma = indicators.moving_average(block, n=200)
+    '''
+    binary = is_price_store(path)
+    if binary:
+        _, _, stock_prices = open_price_store(path)
+        days = stock_prices.shape[0] if finaldate == None else finaldate + 1
+        num_of_stock = stock_prices.shape[1]
+    else:
+        volatility, _, _ = read_price_header(path)
+        num_of_stock = volatility.shape[0]
+    if last_stock == None:
+        last_stock = num_of_stock
+
+    for first in range(first_stock, last_stock, block_stocks):
+        last = min(first + block_stocks, last_stock)
+        if binary:
+            yield first, np.array(stock_prices[:days, first:last])
+        else:
+            yield first, np.loadtxt(path, usecols=range(first, last), skiprows=1, ndmin=2,
+                                    max_rows=None if finaldate == None else finaldate + 1)
+
+
+# Ledger layout (little-endian):
+#   header: magic (8 bytes), version (uint32), record size (uint32)
+#   records: side (int8, 1 buy / -1 sell), date, stock, shares (int32),
+#            price (int32) and cashflow (int64) in cents, rounded like the
+#            text ledgers, NAN_CENTS for 'nan'
+LEDGER_MAGIC = b'TRDLEDGR'
+LEDGER_VERSION = 2
+LEDGER_HEADER = struct.Struct('<8sII')
+LEDGER_RECORD = np.dtype([('side', 'i1'), ('date', '<i4'), ('stock', '<i4'), ('shares', '<i4'),
+                          ('price_cents', '<i4'), ('cashflow_cents', '<i8')])
+NAN_CENTS = np.iinfo(np.int32).min
+# version 1 kept price and cashflow as float64, 4 bytes more per record
+_LEDGER_RECORD_V1 = np.dtype([('side', 'i1'), ('date', '<i4'), ('stock', '<i4'),
+                              ('shares', '<i4'), ('price', '<f8'), ('cashflow', '<f8')])
+_LEDGER_RECORDS = {1: _LEDGER_RECORD_V1, 2: LEDGER_RECORD}
+LEDGER_EXTENSION = '.ledger'
+
+
+def is_binary_ledger(path):
+    '''
+    Checks whether path is (or should be written as) a binary ledger:
+    by its extension, or by its magic number if the file already exists.
+    '''
+    if str(path).endswith(LEDGER_EXTENSION):
+        return True
+    try:
+        with open(path, 'rb') as readfile:
+            return readfile.read(len(LEDGER_MAGIC)) == LEDGER_MAGIC
+    except FileNotFoundError:
+        return False
+
+
+def to_cents(amounts):
+    '''
+    Amounts as whole cents, rounded exactly as '%.2f' rounds them in the text
+    ledgers, and NAN_CENTS for 'nan' (or infinite) amounts.
+    '''
+    amounts = np.asarray(amounts, dtype=float)
+    finite = np.isfinite(amounts)
+    scaled = np.where(finite, amounts, 0) * 100
+    cents = np.rint(scaled)
+    # '%.2f' rounds the exact value of the float, which x*100 may not keep
+    # near half a cent: let it decide those few
+    near_half = finite & (np.abs(np.abs(scaled - np.trunc(scaled)) - 0.5) < 1e-6)
+    for k in np.flatnonzero(near_half):
+        cents[k] = round(float('%.2f' % amounts[k]) * 100)
+    return np.where(finite, cents, NAN_CENTS).astype(np.int64)
+
+
+def from_cents(cents):
+    '''
+    Whole cents back to amounts, NAN_CENTS back to 'nan'.
+    '''
+    return np.where(cents == NAN_CENTS, np.nan, cents / 100)
+
+
+def append_ledger(path, records, mode='a'):
+    '''
+    Appends transactions to a binary ledger, creating it if needed.
+    Existing records are never rewritten.
+
+    Input:
+        path (str): path to the binary ledger
+        records (ndarray): structured array with the fields of process.LEDGER_DTYPE
+        mode (str, default 'a'): 'a' to append, 'w' to replace the ledger
+
+    Output:
+        number of bytes written
+    '''
+    packed = np.zeros(records.shape[0], dtype=LEDGER_RECORD)
+    for name in ('side', 'date', 'stock', 'shares'):
+        packed[name] = records[name]
+    packed['price_cents'] = to_cents(records['price'])
+    packed['cashflow_cents'] = to_cents(records['cashflow'])
+
+    if mode == 'a' and os.path.exists(path) and os.path.getsize(path) > 0:
+        with open(path, 'rb') as readfile:
+            magic, version, _ = LEDGER_HEADER.unpack(readfile.read(LEDGER_HEADER.size))
+        if magic != LEDGER_MAGIC or version != LEDGER_VERSION:
+            raise ValueError('cannot append to {}: not a version {} binary ledger'.format(path, LEDGER_VERSION))
+
+    with open(path, mode + 'b') as writefile:
+        written = 0
+        if writefile.tell() == 0:
+            written += writefile.write(LEDGER_HEADER.pack(LEDGER_MAGIC, LEDGER_VERSION, LEDGER_RECORD.itemsize))
+        written += writefile.write(packed.tobytes())
+    return written
+
+
+def map_ledger(path):
+    '''
+    Maps a binary ledger into memory, without parsing or copying it.
+
+    Output:
+        records (memmap): read-only structured array with the fields of LEDGER_RECORD
+            (or of version 1 for older ledgers, with float price and cashflow)
+    '''
+    with open(path, 'rb') as readfile:
+        magic, version, record_size = LEDGER_HEADER.unpack(readfile.read(LEDGER_HEADER.size))
+        readfile.seek(0, 2)
+        size = readfile.tell()
+    if magic != LEDGER_MAGIC:
+        raise ValueError('{} is not a binary ledger'.format(path))
+    if version not in _LEDGER_RECORDS or record_size != _LEDGER_RECORDS[version].itemsize:
+        raise ValueError('{} has unsupported ledger version {}'.format(path, version))
+
+    dtype = _LEDGER_RECORDS[version]
+    num_of_record = (size - LEDGER_HEADER.size) // record_size
+    if num_of_record == 0:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r', offset=LEDGER_HEADER.size, shape=(num_of_record,))
+
+
+def read_ledger(path):
+    '''
+    Reads a binary ledger, with price and cashflow back in money.
+
+    Output:
+        records (ndarray): structured array with the fields side, date, stock,
+            shares (int), price and cashflow (float)
+    '''
+    packed = map_ledger(path)
+    if 'price' in packed.dtype.names: # version 1
+        return np.array(packed)
+    records = np.zeros(packed.shape[0], dtype=_LEDGER_RECORD_V1)
+    for name in ('side', 'date', 'stock', 'shares'):
+        records[name] = packed[name]
+    records['price'] = from_cents(packed['price_cents'])
+    records['cashflow'] = from_cents(packed['cashflow_cents'])
+    return records
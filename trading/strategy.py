@@ -1,10 +1,14 @@
 # Functions to implement our trading strategy.
+import bisect
+import time
 import numpy as np
 from trading import process as proc
 from trading import indicators as indic
-import matplotlib.pyplot as plt
+from trading import profiling
+from trading import store
 
-def random(stock_prices, period=7, amount=5000, fees=20, ledger='ledger_random.txt', finaldate=1824):
+@profiling.profiled
+def random(stock_prices, period=7, amount=5000, fees=20, ledger='ledger_random.txt', finaldate=1824, seed=None, cash=np.inf):
     '''
     Randomly decide, every period, which stocks to purchase,
     do nothing, or sell (with equal probability).
@@ -16,48 +20,236 @@ def random(stock_prices, period=7, amount=5000, fees=20, ledger='ledger_random.t
         amount (float, default 5000): how much we spend on each purchase
             (must cover fees)
         fees (float, default 20): transaction fees
-        ledger (str): path to the ledger file
+        ledger (str or Ledger): path to the ledger file, or a process.Ledger to record into
         finaldate (int, default 1824): the last day of sotck prices (from 0)
+        seed (int, SeedSequence or Generator, default None): seed for default_rng
+        cash (float, default inf): the money we start with, shared by all the stocks
+            (see process.Portfolio). 'inf' for unlimited; with limited cash, the
+            trades are made in date order so that it is spent as the days go by.
+        profile (bool or callable, default None): True to also return the RunStats
+            of the run, or a function to call with them (see trading.profiling)
 
     Output: None
     '''
-    # clean txt file
-    with open(ledger, 'w') as writefile:
-        writefile.truncate()
+    # keep the transactions in memory, the ledger file is replaced when we flush
+    book = ledger if isinstance(ledger, proc.Ledger) else proc.Ledger(ledger, mode='w')
 
     # initialization
     num_of_stock = stock_prices.shape[1]
-    portfolio = proc.create_portfolio([amount]*num_of_stock, stock_prices, fees, ledger)
+    portfolio = proc.create_portfolio([amount]*num_of_stock, stock_prices, fees, book, cash=cash)
+
+    rng = np.random.default_rng(seed) #random generator
+
+    # for each stock loop day i with period until to finaldate, deciding in the
+    # same order as the original loop so that the generator gives the same draws
+    event_stock, event_date, event_side = [], [], []
+    delisting = np.full(num_of_stock, -1)
+    with profiling.stage('strategy.decisions'):
+        for s in range(num_of_stock):
+            # for every stock initialize date: i
+            i = 1
+            while period*i < finaldate:
+                if np.isnan(stock_prices[period*i, s]) == True: # when detect nan value, break and throw all stock go to next stock
+                    delisting[s] = period*i
+                    break
+                elif np.isnan(stock_prices[period*i, s]) == False:
+                    dowhat = rng.choice(['buy','do_nothing','sell'], p = [1/3, 1/3, 1/3])
+                    if dowhat != 'do_nothing':
+                        event_stock.append(s)
+                        event_date.append(period*i)
+                        event_side.append(proc.BUY if dowhat == 'buy' else proc.SELL)
+                i += 1
+    with profiling.stage('strategy.trades'):
+        replay_events(stock_prices, np.array(event_stock, dtype=int), np.array(event_date, dtype=int),
+                      np.array(event_side, dtype=int), delisting, amount, fees, portfolio, book)
 
-    rng = np.random.default_rng() #random generator
+    # when final day, need sell all stock if it's not nan value.
+    with profiling.stage('strategy.sell_all'):
+        for f in range(num_of_stock):
+            if np.isnan(stock_prices[finaldate, s]) == False:
+                proc.sell(finaldate, f, stock_prices, fees, portfolio, book)
+    book.flush()
 
-    # for each stock loop day i with period until to finaldate
-    for s in range(num_of_stock):
-        # for every stock initialize date: i
-        i = 1
-        while period*i < finaldate:
-            if np.isnan(stock_prices[period*i, s]) == True: # when detect nan value, break and throw all stock go to next stock
-                proc.sell(period*i, s, np.zeros((finaldate+1, num_of_stock)), 0, portfolio, ledger)
-                break
-            elif np.isnan(stock_prices[period*i, s]) == False:
-                dowhat = rng.choice(['buy','do_nothing','sell'], p = [1/3, 1/3, 1/3])
-                if dowhat == 'buy':
-                    proc.buy(period*i, s, amount, stock_prices, fees, portfolio, ledger)
-                elif dowhat == 'sell':
-                    proc.sell(period*i, s, stock_prices, fees, portfolio, ledger)
-            i += 1
 
-    # when final day, need sell all stock if it's not nan value.
-    for f in range(num_of_stock):
-        if np.isnan(stock_prices[finaldate, s]) == False:
+
+
+
+
+def align_indicator(indicator, n, days):
+    '''
+    Lines up an indicator with the days it is used on: the strategies decide on
+    day i with the indicator of day i-1, which is row i-n of the output of
+    indicators.moving_average() or indicators.oscillator().
+
+    Input:
+        indicator (ndarray): indicator of one stock (1darray) or of several (2darray)
+        n (int): period of the indicator (in days)
+        days (int): number of days of price data
+
+    Output:
+        aligned (ndarray): (days, stocks) array, row i is used on day i.
+            'nan' before day n and after the first 'nan' price.
+    '''
+    indicator = indicator.reshape(indicator.shape[0], -1)
+    aligned = np.full((days, indicator.shape[1]), np.nan)
+    rows = max(min(indicator.shape[0], days - n), 0)
+    aligned[n:n+rows, :] = indicator[:rows, :]
+    return aligned
+
+
+def replay_events(stock_prices, event_stock, event_date, event_side, delisting, amount, fees, portfolio, ledger):
+    '''
+    Buys and sells at the given events, stock by stock and in date order,
+    the same way the day-by-day loops of the strategies do. With limited cash,
+    the events of all the stocks are made in date order instead (then by stock),
+    so that the cash is spent as the days go by.
+
+    Input:
+        stock_prices (ndarray): the stock price data
+        event_stock, event_date, event_side (1darray): the events, sorted by stock
+            then date. event_side is process.BUY or process.SELL.
+        delisting (1darray): for each stock, the day we find it has no price
+            and throw its shares away, or -1 if we never do
+        amount (float): how much we spend on each purchase
+        fees (float): transaction fees
+        portfolio (Portfolio): our current portfolio
+        ledger (str or Ledger): where to record the transactions
+
+    Output: None
+    '''
+    if portfolio.cash != np.inf:
+        replay_by_date(stock_prices, event_stock, event_date, event_side, delisting, amount, fees, portfolio, ledger)
+        return
+    bounds = np.searchsorted(event_stock, np.arange(stock_prices.shape[1] + 1))
+    event_date = event_date.tolist()
+    event_side = event_side.tolist()
+    stats = profiling.active
+    for s in range(stock_prices.shape[1]):
+        if stats is not None:
+            started = time.perf_counter()
+        for k in range(bounds[s], bounds[s+1]):
+            if event_side[k] == proc.BUY:
+                proc.buy(event_date[k], s, amount, stock_prices, fees, portfolio, ledger)
+            else:
+                proc.sell(event_date[k], s, stock_prices, fees, portfolio, ledger)
+        if delisting[s] >= 0 and portfolio[s] != 0: # throw it away, for a price of 0 and no fees
+            proc.log_transaction('sell', int(delisting[s]), s, portfolio[s], 0, 0, ledger)
+            portfolio[s] = 0
+        if stats is not None:
+            stats.add_stock_time(s, time.perf_counter() - started)
+
+
+def replay_by_date(stock_prices, event_stock, event_date, event_side, delisting, amount, fees, portfolio, ledger):
+    '''
+    Same as replay_events(), but with the events of all the stocks in date order.
+    '''
+    delisted = np.flatnonzero(delisting >= 0)
+    stocks = np.concatenate([event_stock, delisted])
+    dates = np.concatenate([event_date, delisting[delisted]])
+    sides = np.concatenate([event_side, np.zeros(delisted.shape[0], dtype=int)]) # 0: throw it away
+    order = np.lexsort((stocks, dates))
+    stats = profiling.active
+    for s, date, side in zip(stocks[order].tolist(), dates[order].tolist(), sides[order].tolist()):
+        if stats is not None:
+            started = time.perf_counter()
+        if side == proc.BUY:
+            proc.buy(date, s, amount, stock_prices, fees, portfolio, ledger)
+        elif side == proc.SELL:
+            proc.sell(date, s, stock_prices, fees, portfolio, ledger)
+        elif portfolio[s] != 0: # throw it away, for a price of 0 and no fees
+            proc.log_transaction('sell', date, s, portfolio[s], 0, 0, ledger)
+            portfolio[s] = 0
+        if stats is not None:
+            stats.add_stock_time(s, time.perf_counter() - started)
+
+
+def sell_all(stock_prices, finaldate, fees, portfolio, ledger):
+    '''
+    When final day, sell all stock if it's not nan value.
+    As in the original loops, the sell-off is skipped entirely when the
+    last stock has no price on the final day.
+    '''
+    if np.isnan(stock_prices[finaldate, -1]) == False:
+        for f in range(stock_prices.shape[1]):
             proc.sell(finaldate, f, stock_prices, fees, portfolio, ledger)
 
 
+def first_nan_day(stock_prices, start, finaldate):
+    '''
+    For each stock, the first day from start to finaldate-1 without a price,
+    or finaldate if there is none.
+    '''
+    is_nan = np.isnan(stock_prices[start:max(finaldate, start), :])
+    if is_nan.shape[0] == 0:
+        return np.full(stock_prices.shape[1], finaldate)
+    return np.where(is_nan.any(axis=0), np.argmax(is_nan, axis=0) + start, finaldate)
+
+
+def crossing_events(stock_prices, SMA, FMA, start, finaldate):
+    '''
+    Finds the days where SMA and FMA cross, for all the stocks at once.
+
+    Input:
+        stock_prices (ndarray): the stock price data
+        SMA, FMA (ndarray): (days, stocks) moving averages lined up with
+            align_indicator(), so row i is the one we decide with on day i
+        start (int): first day we compare the averages (we can trade from the next one)
+        finaldate (int): the last day of sotck prices (from 0), we trade before it
+
+    Output:
+        event_stock, event_date, event_side (1darray): the crossings, sorted by stock
+            then date: buy when the FMA goes above the SMA, sell when it goes below
+        delisting (1darray): for each stock, the first day without a price, or -1
+    '''
+    nan_day = first_nan_day(stock_prices, start, finaldate)
+
+    # position of SMA and FMA [>, =, <]:[-1,0,1] for every day and stock
+    sign = ((SMA[start:finaldate, :] < FMA[start:finaldate, :]).astype(np.int8)
+            - (SMA[start:finaldate, :] > FMA[start:finaldate, :]).astype(np.int8))
+    change = np.diff(sign, axis=0) # row k is the change on day start+k+1
+    day = np.arange(start + 1, max(finaldate, start + 1))[:, None]
+    change[day >= nan_day] = 0
+
+    # stock-major order, so that events come sorted by stock then date
+    event_stock, row = np.nonzero(change.T)
+    event_side = np.where(change[row, event_stock] > 0, proc.BUY, proc.SELL)
+    delisting = np.where(nan_day < finaldate, nan_day, -1)
+    return event_stock, row + start + 1, event_side, delisting
 
 
+def window_average(stock_prices, stock, day, n, weights=[]):
+    '''
+    (Weighted) average of the n days up to day of one stock, summed over the window
+    like the original loop did, so that it is rounded the same way.
+    '''
+    window = stock_prices[day-n+1:day+1, stock]
+    if len(weights) == 0:
+        return np.sum(window) / n
+    return np.dot(np.array(weights), window)
 
 
-def crossing_averages(stock_prices, SMAperiod=200, FMAperiod=50, SMAweights=[], FMAweights=[], amount=5000, fees=20, ledger='ledger_crossing_averages.txt', graph=True, finaldate=1824):
+def settle_ties(stock_prices, SMA, FMA, SMAperiod, FMAperiod, SMAweights, FMAweights, start, finaldate, first_day=0):
+    '''
+    The rolling sums of indicators.moving_average() are not rounded like a sum over
+    each window, which only matters where the SMA and FMA are (nearly) equal.
+    Recomputes those few averages window by window, in place, so that we find
+    exactly the crossings of the original loop.
+    When the averages start on first_day, stock_prices is still the whole history,
+    so that the windows can reach back before first_day.
+    '''
+    window = slice(start, max(finaldate, start))
+    near = np.abs(SMA[window] - FMA[window]) <= 1e-9 * np.maximum(np.abs(SMA[window]), np.abs(FMA[window]))
+    for row, s in zip(*np.nonzero(near)):
+        i = start + row # on day first_day+i we use the averages up to the day before
+        day = first_day + i
+        if day < max(SMAperiod, FMAperiod): # the windows start before the first price we have
+            continue
+        SMA[i, s] = window_average(stock_prices, s, day - 1, SMAperiod, SMAweights)
+        FMA[i, s] = window_average(stock_prices, s, day - 1, FMAperiod, FMAweights)
+
+
+@profiling.profiled
+def crossing_averages(stock_prices, SMAperiod=200, FMAperiod=50, SMAweights=[], FMAweights=[], amount=5000, fees=20, ledger='ledger_crossing_averages.txt', graph=True, finaldate=1824, cache=indic.default_cache, cash=np.inf):
     '''
     finds the crossing points between SMA and FMA to make buying or selling decisions.
     Spend a maximum of amount on every purchase.
@@ -72,59 +264,152 @@ def crossing_averages(stock_prices, SMAperiod=200, FMAperiod=50, SMAweights=[],
             weighted average.
         amount (float, default 5000): how much we spend on each purchase
         fees (float, default 20): transaction fees
-        ledger (str): path to the ledger file
+        ledger (str or Ledger): path to the ledger file, or a process.Ledger to record into
+        cache (IndicatorCache, default indicators.default_cache): where to look up
+            the moving averages before computing them. None to always compute them.
+            The cache has the same functions as the indicators module, so the
+            strategies call whichever of the two they are given.
+        cash (float, default inf): the money we start with, shared by all the stocks
+            (see process.Portfolio). 'inf' for unlimited; with limited cash, the
+            trades are made in date order so that it is spent as the days go by.
+        profile (bool or callable, default None): True to also return the RunStats
+            of the run, or a function to call with them (see trading.profiling)
 
     Output: print error
     '''
-    # clean txt file
-    with open(ledger, 'w') as writefile:
-        writefile.truncate()
+    # keep the transactions in memory, the ledger file is replaced when we flush
+    book = ledger if isinstance(ledger, proc.Ledger) else proc.Ledger(ledger, mode='w')
 
     # initialization
     num_of_stock = stock_prices.shape[1]
-    portfolio = proc.create_portfolio([amount]*num_of_stock, stock_prices, fees, ledger)
+    portfolio = proc.create_portfolio([amount]*num_of_stock, stock_prices, fees, book, cash=cash)
 
     if SMAperiod < FMAperiod:
+        book.flush()
         return 'Error with periods (SMAperiod < FMAperiod)'
 
-    for s in range(num_of_stock):
-        s_SMA = indic.moving_average(stock_prices[:,s:s+1], n=SMAperiod, weights=SMAweights)
-        s_FMA = indic.moving_average(stock_prices[:,s:s+1], n=FMAperiod, weights=FMAweights)[SMAperiod-FMAperiod:]
-        # now, s_SMA and s_FMA both start from day 'SMAperiod' and we can start compare
+    indicator = indic if cache is None else cache
+
+    # averages of all the stocks at once, lined up so that row i is used on day i
+    days = stock_prices.shape[0]
+    with profiling.stage('strategy.indicators'):
+        SMA = align_indicator(indicator.moving_average(stock_prices, n=SMAperiod, weights=SMAweights), SMAperiod, days)
+        FMA = align_indicator(indicator.moving_average(stock_prices, n=FMAperiod, weights=FMAweights), FMAperiod, days)
+
+    # trade only on the days the averages cross, then throw away delisted stocks
+    with profiling.stage('strategy.decisions'):
+        settle_ties(stock_prices, SMA, FMA, SMAperiod, FMAperiod, SMAweights, FMAweights, SMAperiod, finaldate)
+        events = crossing_events(stock_prices, SMA, FMA, SMAperiod, finaldate)
+    with profiling.stage('strategy.trades'):
+        replay_events(stock_prices, *events, amount, fees, portfolio, book)
+
+    with profiling.stage('strategy.sell_all'):
+        sell_all(stock_prices, finaldate, fees, portfolio, book)
+    book.flush()
+
+
 
-        i = SMAperiod
-        sign = [] # a list to record the position of SMA and FMA [>, =, <]:[-1,0,1]
 
-        while i < finaldate:
-            if np.isnan(stock_prices[i, s]) == True: # similar with random()
-                proc.sell(i, s, np.zeros((finaldate+1,num_of_stock)), 0, portfolio, ledger) # throw it away
+def momentum_events(stock_prices, osc, start, finaldate, minimum_cool_down_period, overvalued_threshold, undervalued_threshold):
+    '''
+    Finds the days momentum() trades on, for all the stocks at once, with the
+    same cool down rule: after a trade, no decision for minimum_cool_down_period days.
+
+    The threshold hits are found for the whole oscillator matrix, then for each
+    stock we jump from one hit to the next one that is out of the cool down
+    (a cool down shorter than 1 day counts as 1 day), so the cost grows with the
+    number of hits rather than the number of days.
+
+    Input:
+        stock_prices (ndarray): the stock price data
+        osc (ndarray): (days, stocks) oscillator lined up with align_indicator(),
+            so row i is the one we decide with on day i
+        start (int): first day we can trade
+        finaldate (int): the last day of sotck prices (from 0), we trade before it
+        minimum_cool_down_period, overvalued_threshold, undervalued_threshold: as in momentum()
+
+    Output:
+        event_stock, event_date, event_side (1darray): the trades, sorted by stock then date
+        delisting (1darray): for each stock, the day we find it has no price, or -1
+    '''
+    num_of_stock = stock_prices.shape[1]
+    window = osc[start:max(finaldate, start), :]
+    sell_hit = (window > overvalued_threshold[0]) & (window < overvalued_threshold[1])
+    buy_hit = ~sell_hit & (window > undervalued_threshold[0]) & (window < undervalued_threshold[1])
+
+    # hits and missing prices of each stock, as sorted lists of days
+    hit_stock, hit_row = np.nonzero((sell_hit | buy_hit).T)
+    hit_bounds = np.searchsorted(hit_stock, np.arange(num_of_stock + 1))
+    hit_days = (hit_row + start).tolist()
+    hit_sides = np.where(sell_hit[hit_row, hit_stock], proc.SELL, proc.BUY).tolist()
+    nan_stock, nan_row = np.nonzero(np.isnan(stock_prices[start:max(finaldate, start), :]).T)
+    nan_bounds = np.searchsorted(nan_stock, np.arange(num_of_stock + 1))
+    nan_days = (nan_row + start).tolist()
+
+    step = max(minimum_cool_down_period, 1)
+    event_stock, event_date, event_side = [], [], []
+    delisting = np.full(num_of_stock, -1)
+    for s in range(num_of_stock):
+        first_hit, last_hit = hit_bounds[s], hit_bounds[s+1]
+        first_nan, last_nan = nan_bounds[s], nan_bounds[s+1]
+        day = start # next day we look at
+        while True:
+            k = bisect.bisect_left(hit_days, day, first_hit, last_hit)
+            j = bisect.bisect_left(nan_days, day, first_nan, last_nan)
+            next_nan = nan_days[j] if j < last_nan else finaldate
+            if k == last_hit or hit_days[k] >= next_nan:
+                # no more trades: the stock runs out of hits or we find it has no price
+                if next_nan < finaldate:
+                    delisting[s] = next_nan
                 break
-            elif np.isnan(stock_prices[i, s]) == False:
-                if s_SMA[i-SMAperiod] < s_FMA[i-SMAperiod]:
-                    #SMA < FMA Note +1
-                    sign.append(1)
-                elif s_SMA[i-SMAperiod] > s_FMA[i-SMAperiod]:
-                    sign.append(-1)
-                else:
-                    sign.append(0)
-
-            if i > SMAperiod: # avoid only one element in list s.t. can't find sign[-2]
-                if sign[-1] - sign[-2] > 0:
-                    proc.buy(i, s, amount, stock_prices, fees, portfolio, ledger)
-                elif sign[-1] - sign[-2] < 0:
-                    proc.sell(i, s, stock_prices, fees, portfolio, ledger)
-
-            i += 1
+            event_stock.append(s)
+            event_date.append(hit_days[k])
+            event_side.append(hit_sides[k])
+            day = hit_days[k] + step # skip some days if we bought or sold
 
-    # when final day, need sell all stock if it's not nan value.
-    for f in range(num_of_stock):
-        if np.isnan(stock_prices[finaldate, s]) == False:
-            proc.sell(finaldate, f, stock_prices, fees, portfolio, ledger)
+    return (np.array(event_stock, dtype=int), np.array(event_date, dtype=int),
+            np.array(event_side, dtype=int), delisting)
 
-            
+
+def window_rsi(stock_prices, stock, day, n):
+    '''
+    RSI of the n days up to day of one stock, with the daily differences summed
+    from the most recent one like the original loop did, so that it is rounded the same way.
+    '''
+    window = stock_prices[day-n+1:day+1, stock]
+    days_diff = (window[1:] - window[:-1])[::-1].tolist()
+    days_diff_pos = [diff for diff in days_diff if diff > 0]
+    days_diff_neg = [diff for diff in days_diff if diff < 0]
+    if len(days_diff_neg) == 0:
+        return 1
+    if len(days_diff_pos) == 0:
+        return 0
+    RS = (sum(days_diff_pos) / len(days_diff_pos)) / abs(sum(days_diff_neg) / len(days_diff_neg))
+    return 1 - (1 / (1 + RS))
+
+
+def settle_rsi(stock_prices, osc, period, thresholds, start, finaldate, first_day=0):
+    '''
+    The rolling sums of indicators.oscillator() are not rounded like a sum over
+    each window, which only matters where the RSI is (nearly) on a threshold.
+    Recomputes those few values window by window, in place, so that we find
+    exactly the threshold hits of the original loop.
+    As in settle_ties(), stock_prices is the whole history when osc starts on first_day.
+    '''
+    window = osc[start:max(finaldate, start)]
+    near = np.zeros(window.shape, dtype=bool)
+    for threshold in thresholds:
+        near |= np.abs(window - threshold) <= 1e-9
+    for row, s in zip(*np.nonzero(near)):
+        i = start + row # on day first_day+i we use the RSI up to the day before
+        day = first_day + i
+        if day < period: # the window starts before the first price we have
+            continue
+        osc[i, s] = window_rsi(stock_prices, s, day - 1, period)
 
 
-def momentum(stock_prices, period=200, minimum_cool_down_period=10, overvalued_threshold=[0.7, 0.8], undervalued_threshold=[0.2, 0.3], osc_method='stochastic', amount=5000, fees=20, ledger='ledger_momentum.txt', finaldate=1824):
+@profiling.profiled
+def momentum(stock_prices, period=200, minimum_cool_down_period=10, overvalued_threshold=[0.7, 0.8], undervalued_threshold=[0.2, 0.3], osc_method='stochastic', amount=5000, fees=20, ledger='ledger_momentum.txt', finaldate=1824, cache=indic.default_cache, cash=np.inf):
 
     '''
     uses a given oscillator (stochastic or RSI) to make buying or selling decisions,
@@ -139,38 +424,257 @@ def momentum(stock_prices, period=200, minimum_cool_down_period=10, overvalued_t
         undervalued_threshold (list default=[0.2, 0.3]): when the oscillator is in this threshold, it's good time to buy.
         amount (float, default 5000): how much we spend on each purchase
         fees (float, default 20): transaction fees
-        ledger (str): path to the ledger file
+        ledger (str or Ledger): path to the ledger file, or a process.Ledger to record into
+        cache (IndicatorCache, default indicators.default_cache): where to look up
+            the oscillators before computing them. None to always compute them.
+        cash (float, default inf): the money we start with, shared by all the stocks
+            (see process.Portfolio). 'inf' for unlimited; with limited cash, the
+            trades are made in date order so that it is spent as the days go by.
+        profile (bool or callable, default None): True to also return the RunStats
+            of the run, or a function to call with them (see trading.profiling)
 
     Output: None
     '''
 
-    # clean txt file
-    with open(ledger, 'w') as writefile:
-        writefile.truncate()
+    # keep the transactions in memory, the ledger file is replaced when we flush
+    book = ledger if isinstance(ledger, proc.Ledger) else proc.Ledger(ledger, mode='w')
 
     # initialization
     num_of_stock = stock_prices.shape[1]
-    portfolio = proc.create_portfolio([amount]*num_of_stock, stock_prices, fees, ledger)
+    portfolio = proc.create_portfolio([amount]*num_of_stock, stock_prices, fees, book, cash=cash)
 
-    for s in range(num_of_stock):
-        # initialize
-        i = period
-        s_osc = indic.oscillator(stock_prices[:, s:s+1], n = period, osc_type = osc_method)
-        while i < finaldate:
-            if np.isnan(stock_prices[i, s]) == True: # similar with random()
-                proc.sell(i, s, np.zeros((finaldate+1,num_of_stock)), 0, portfolio, ledger)
-                break
+    indicator = indic if cache is None else cache
 
-            if s_osc[i-period] > overvalued_threshold[0] and s_osc[i-period] < overvalued_threshold[1]:
-                proc.sell(i, s, stock_prices, fees, portfolio, ledger)
-                i = i + minimum_cool_down_period - 1 # skip some days if we bought or sold
-            elif s_osc[i-period] > undervalued_threshold[0] and s_osc[i-period] < undervalued_threshold[1]:
-                proc.buy(i, s, amount, stock_prices, fees, portfolio, ledger)
-                i = i + minimum_cool_down_period - 1 # skip some days if we bought or sold
+    # oscillators of all the stocks at once, lined up so that row i is used on day i
+    with profiling.stage('strategy.indicators'):
+        osc = align_indicator(indicator.oscillator(stock_prices, n = period, osc_type = osc_method),
+                              period, stock_prices.shape[0])
 
-            i += 1
+    # trade only on the threshold hits out of the cool down, then throw away delisted stocks
+    with profiling.stage('strategy.decisions'):
+        if osc_method == 'RSI':
+            settle_rsi(stock_prices, osc, period, [*overvalued_threshold, *undervalued_threshold], period, finaldate)
+        events = momentum_events(stock_prices, osc, period, finaldate, minimum_cool_down_period,
+                                 overvalued_threshold, undervalued_threshold)
+    with profiling.stage('strategy.trades'):
+        replay_events(stock_prices, *events, amount, fees, portfolio, book)
 
-    # when final day, need sell all stock if it's not nan value.
-    for f in range(num_of_stock):
-        if np.isnan(stock_prices[finaldate, s]) == False:
-            proc.sell(finaldate, f, stock_prices, fees, portfolio, ledger)
+    with profiling.stage('strategy.sell_all'):
+        sell_all(stock_prices, finaldate, fees, portfolio, book)
+    book.flush()
+
+
+
+
+def band_events(stock_prices, price, lower, upper, start, finaldate):
+    '''
+    Finds the days where the price leaves the bands, for all the stocks at once.
+
+    Input:
+        stock_prices (ndarray): the stock price data
+        price, lower, upper (ndarray): (days, stocks) price and bands lined up with
+            align_indicator(), so row i is the one we decide with on day i
+        start (int): first day we compare the price to the bands (we can trade from the next one)
+        finaldate (int): the last day of sotck prices (from 0), we trade before it
+
+    Output:
+        event_stock, event_date, event_side (1darray): the trades, sorted by stock
+            then date: buy when the price goes below the lower band, sell when it
+            goes above the upper band
+        delisting (1darray): for each stock, the first day without a price, or -1
+    '''
+    nan_day = first_nan_day(stock_prices, start, finaldate)
+
+    # position of the price [above, inside, below] the bands:[1,0,-1] for every day and stock
+    window = price[start:finaldate, :]
+    position = ((window > upper[start:finaldate, :]).astype(np.int8)
+                - (window < lower[start:finaldate, :]).astype(np.int8))
+    change = np.diff(position, axis=0) # row k is the change on day start+k+1
+    change[position[1:, :] == 0] = 0 # going back inside the bands is not a trade
+    day = np.arange(start + 1, max(finaldate, start + 1))[:, None]
+    change[day >= nan_day] = 0
+
+    # stock-major order, so that events come sorted by stock then date
+    event_stock, row = np.nonzero(change.T)
+    event_side = np.where(position[row + 1, event_stock] < 0, proc.BUY, proc.SELL)
+    delisting = np.where(nan_day < finaldate, nan_day, -1)
+    return event_stock, row + start + 1, event_side, delisting
+
+
+@profiling.profiled
+def bollinger(stock_prices, period=20, num_std=2, amount=5000, fees=20, ledger='ledger_bollinger.txt', finaldate=1824, cache=indic.default_cache, cash=np.inf):
+    '''
+    uses the Bollinger bands to make buying or selling decisions: buy when the
+    price falls below the lower band, sell when it rises above the upper band.
+    Decisions of day i use the price and bands of day i-1.
+    Spend a maximum of amount on every purchase.
+
+    Input:
+        stock_prices (ndarray): the stock price data
+        period (int, default 20): period of the bands (in days)
+        num_std (float, default 2): width of the bands, in standard deviations
+        amount (float, default 5000): how much we spend on each purchase
+        fees (float, default 20): transaction fees
+        ledger (str or Ledger): path to the ledger file, or a process.Ledger to record into
+        cache (IndicatorCache, default indicators.default_cache): where to look up
+            the bands before computing them. None to always compute them.
+        cash (float, default inf): the money we start with, shared by all the stocks
+            (see process.Portfolio). 'inf' for unlimited; with limited cash, the
+            trades are made in date order so that it is spent as the days go by.
+        profile (bool or callable, default None): True to also return the RunStats
+            of the run, or a function to call with them (see trading.profiling)
+
+    Output: None
+    '''
+    # keep the transactions in memory, the ledger file is replaced when we flush
+    book = ledger if isinstance(ledger, proc.Ledger) else proc.Ledger(ledger, mode='w')
+
+    # initialization
+    num_of_stock = stock_prices.shape[1]
+    portfolio = proc.create_portfolio([amount]*num_of_stock, stock_prices, fees, book, cash=cash)
+
+    indicator = indic if cache is None else cache
+
+    # bands of all the stocks at once, lined up so that row i is used on day i
+    days = stock_prices.shape[0]
+    with profiling.stage('strategy.indicators'):
+        _, upper, lower = indicator.bollinger_bands(stock_prices, n=period, k=num_std)
+        upper = align_indicator(upper, period, days)
+        lower = align_indicator(lower, period, days)
+        price = np.full(stock_prices.shape, np.nan)
+        price[1:, :] = stock_prices[:-1, :] # price of the day before
+
+    # trade only on the days the price leaves the bands, then throw away delisted stocks
+    with profiling.stage('strategy.decisions'):
+        events = band_events(stock_prices, price, lower, upper, period, finaldate)
+    with profiling.stage('strategy.trades'):
+        replay_events(stock_prices, *events, amount, fees, portfolio, book)
+
+    with profiling.stage('strategy.sell_all'):
+        sell_all(stock_prices, finaldate, fees, portfolio, book)
+    book.flush()
+
+
+@profiling.profiled
+def macd(stock_prices, fast_period=12, slow_period=26, signal_period=9, amount=5000, fees=20, ledger='ledger_macd.txt', finaldate=1824, cache=indic.default_cache, cash=np.inf):
+    '''
+    finds the crossing points between the MACD line and its signal line to make
+    buying or selling decisions: buy when the MACD line goes above the signal
+    line, sell when it goes below.
+    Spend a maximum of amount on every purchase.
+
+    Input:
+        stock_prices (ndarray): the stock price data
+        fast_period (int, default 12): period of the fast EMA (in days)
+        slow_period (int, default 26): period of the slow EMA (in days)
+        signal_period (int, default 9): period of the EMA of the MACD line (in days)
+        amount (float, default 5000): how much we spend on each purchase
+        fees (float, default 20): transaction fees
+        ledger (str or Ledger): path to the ledger file, or a process.Ledger to record into
+        cache (IndicatorCache, default indicators.default_cache): where to look up
+            the MACD before computing it. None to always compute it.
+        cash (float, default inf): the money we start with, shared by all the stocks
+            (see process.Portfolio). 'inf' for unlimited; with limited cash, the
+            trades are made in date order so that it is spent as the days go by.
+        profile (bool or callable, default None): True to also return the RunStats
+            of the run, or a function to call with them (see trading.profiling)
+
+    Output: print error
+    '''
+    # check first, invalid periods don't buy anything or touch the ledger
+    if slow_period <= fast_period:
+        return 'Error with periods (slow_period <= fast_period)'
+
+    # keep the transactions in memory, the ledger file is replaced when we flush
+    book = ledger if isinstance(ledger, proc.Ledger) else proc.Ledger(ledger, mode='w')
+
+    # initialization
+    num_of_stock = stock_prices.shape[1]
+    portfolio = proc.create_portfolio([amount]*num_of_stock, stock_prices, fees, book, cash=cash)
+
+    indicator = indic if cache is None else cache
+
+    # MACD and signal lines of all the stocks at once, lined up so that row i is used on day i
+    days = stock_prices.shape[0]
+    period = indic.macd_period(fast_period, slow_period, signal_period)
+    with profiling.stage('strategy.indicators'):
+        line, signal_line, _ = indicator.macd(stock_prices, fast=fast_period, slow=slow_period, signal=signal_period)
+        line = align_indicator(line, period, days)
+        signal_line = align_indicator(signal_line, period, days)
+
+    # trade only on the days the lines cross, then throw away delisted stocks
+    with profiling.stage('strategy.decisions'):
+        events = crossing_events(stock_prices, signal_line, line, period, finaldate)
+    with profiling.stage('strategy.trades'):
+        replay_events(stock_prices, *events, amount, fees, portfolio, book)
+
+    with profiling.stage('strategy.sell_all'):
+        sell_all(stock_prices, finaldate, fees, portfolio, book)
+    book.flush()
+
+
+
+
+def run_chunked(strategy_name, data_file, chunk_size=1000, ledger=None, finaldate=1824, **kwargs):
+    '''
+    Runs a strategy on a price file chunk_size stocks at a time, so that memory
+    depends on chunk_size and not on the number of stocks in the file.
+    The stocks keep their column index of the file in the ledger.
+
+    The strategies treat each stock on its own, so the ledger has the same
+    transactions as a run on the whole file, grouped by chunk, except with
+    'random', which draws from one generator per chunk. The final sell-off depends on the last stock of the file (see
+    sell_all()), so it is added to every chunk and its own trades dropped.
+
+    Input:
+        strategy_name (str): 'crossing_averages', 'momentum', 'bollinger', 'macd' or 'random'
+        data_file (str): path to the price file, text or binary price store
+            (see trading.store; a store reads each chunk in one go)
+        chunk_size (int, default 1000): number of stocks in memory at once
+        ledger (str, default None): path to the ledger file, default
+            'ledger_<strategy_name>.txt'
+        finaldate (int, default 1824): the last day of sotck prices (from 0)
+        kwargs: other arguments of the strategy. The indicator cache is off
+            unless a cache is given, so it doesn't keep every chunk in memory.
+            Cash must be unlimited, as the chunks can't share it.
+
+    Output: None, or the error of the strategy
+
+    Example:
+        >>> run_chunked('momentum', 'prices_100k.bin', chunk_size=2000, osc_method='RSI')
+    '''
+    strategies = ('crossing_averages', 'momentum', 'bollinger', 'macd', 'random')
+    if strategy_name not in strategies:
+        return 'Unknown strategy {}, choose from {}.'.format(strategy_name, strategies)
+    if kwargs.get('cash', np.inf) != np.inf:
+        return 'Error with cash (run_chunked needs unlimited cash)'
+    if ledger == None:
+        ledger = 'ledger_{}.txt'.format(strategy_name)
+    run = globals()[strategy_name]
+
+    volatility, _, _ = store.read_price_header(data_file)
+    num_of_stock = volatility.shape[0]
+    if strategy_name == 'random':
+        seeds = iter(np.random.SeedSequence(kwargs.pop('seed', None)).spawn(-(-num_of_stock // chunk_size)))
+    else:
+        kwargs.setdefault('cache', None)
+    _, last_column = next(store.iter_column_blocks(data_file, 1, finaldate, first_stock=num_of_stock - 1))
+
+    mode = 'w'
+    for first_stock, block in store.iter_column_blocks(data_file, chunk_size, finaldate):
+        width = block.shape[1]
+        if first_stock + width < num_of_stock:
+            block = np.hstack((block, last_column))
+        if strategy_name == 'random':
+            kwargs['seed'] = next(seeds)
+
+        book = proc.Ledger()
+        error = run(block, ledger=book, finaldate=finaldate, **kwargs)
+        if error != None:
+            return error
+
+        records = book.records[book.records['stock'] < width]
+        records['stock'] += first_stock
+        with proc.Ledger(ledger, mode=mode, capacity=max(records.shape[0], 1)) as writer:
+            writer.extend(records)
+        mode = 'a'
@@ -0,0 +1,210 @@
+# Incremental indicators, updated one day at a time.
+import numpy as np
+
+
+class _StreamingIndicator:
+    '''
+    Common parts of the streaming indicators: delisting and checkpoints.
+
+    Each indicator is fed one price per stock per day with update(), and returns
+    the value of the indicator for that day, like the batch functions in
+    trading.indicators would on the whole history. Values are 'nan' until n days
+    have been seen, and from the first 'nan' price of a stock on (delisting).
+
+    The whole state is a few arrays: state_dict()/save() give a checkpoint,
+    and from_state()/load() rebuild the indicator to carry on from there.
+    '''
+    _scalars = ('n', 'num_of_stock', 'count')
+    _arrays = ('delisted',)
+
+    def __init__(self, num_of_stock, n):
+        self.n = int(n)
+        self.num_of_stock = int(num_of_stock)
+        self.count = 0 # number of days seen so far
+        self.delisted = np.zeros(self.num_of_stock, dtype=bool)
+
+    def update(self, prices):
+        '''
+        Adds one day of prices and returns the indicator for that day.
+
+        Input:
+            prices (1darray): today's price of each stock ('nan' once delisted)
+
+        Output:
+            values (1darray): today's value of the indicator for each stock
+        '''
+        prices = np.asarray(prices, dtype=float).reshape(self.num_of_stock)
+        self.delisted |= np.isnan(prices)
+        values = self._update(prices)
+        self.count += 1
+        if self.count < self.n:
+            values[:] = np.nan
+        values[self.delisted] = np.nan
+        return values
+
+    def state_dict(self):
+        '''
+        Returns the state of the indicator as a dict of arrays.
+        '''
+        state = {name: np.copy(getattr(self, name)) for name in self._scalars + self._arrays}
+        state['kind'] = np.array(type(self).__name__)
+        return state
+
+    @classmethod
+    def from_state(cls, state):
+        '''
+        Rebuilds an indicator from state_dict().
+        '''
+        indicator = cls.__new__(cls)
+        for name in cls._scalars:
+            setattr(indicator, name, int(state[name]))
+        for name in cls._arrays:
+            setattr(indicator, name, np.array(state[name]))
+        return indicator
+
+    def save(self, path):
+        '''
+        Writes a checkpoint of the indicator to path (.npz).
+        '''
+        np.savez(path, **self.state_dict())
+
+
+def load(path):
+    '''
+    Reads an indicator checkpoint written by save().
+
+    Example:
+        >>> ma = MovingAverage(20, n=200)
+        >>> for day in range(1000): ma.update(stock_prices[day, :])
+        >>> ma.save('ma.npz')
+        >>> ma = load('ma.npz') # in a new process, carry on from day 1000
+    '''
+    with np.load(path) as state:
+        kind = str(state['kind'])
+        for cls in (MovingAverage, Stochastic, RSI):
+            if cls.__name__ == kind:
+                return cls.from_state(state)
+    raise ValueError('{} is not an indicator checkpoint'.format(path))
+
+
+class MovingAverage(_StreamingIndicator):
+    '''
+    n-day (possibly weighted) moving average, as indicators.moving_average().
+
+    Input:
+        num_of_stock (int): number of stocks
+        n (int, default 7): period of the moving average (in days)
+        weights (list, default []): must be of length n if specified. If empty,
+            non-weighted average, updated in O(1) per stock with a running sum.
+            A weighted average costs O(n) per stock, since the weights are arbitrary.
+    '''
+    _arrays = _StreamingIndicator._arrays + ('weights', 'window', 'total')
+
+    def __init__(self, num_of_stock, n=7, weights=[]):
+        super().__init__(num_of_stock, n)
+        self.weights = np.array(weights, dtype=float)
+        self.window = np.zeros((self.n, self.num_of_stock)) # last n prices, as a ring
+        self.total = np.zeros(self.num_of_stock) # running sum of the window
+
+    def _update(self, prices):
+        position = self.count % self.n
+        self.total += prices - self.window[position, :]
+        self.window[position, :] = prices
+        if position == self.n - 1:
+            # re-add the window once per period so rounding errors don't pile up
+            self.total = self.window.sum(axis=0)
+
+        if len(self.weights) == 0:
+            return self.total / self.n
+        # oldest price of the window is the one after today's in the ring
+        return np.roll(self.weights, position + 1) @ self.window
+
+
+class Stochastic(_StreamingIndicator):
+    '''
+    n-day stochastic oscillator, as indicators.oscillator(osc_type='stochastic').
+
+    The window minimum and maximum come from the van Herk/Gil-Werman scheme:
+    running extremes of the current block of n days, and the backward running
+    extremes of the previous block, computed once per block. That is O(1)
+    amortized per stock and per day.
+    '''
+    _arrays = _StreamingIndicator._arrays + ('block', 'prefix_min', 'prefix_max', 'suffix_min', 'suffix_max')
+
+    def __init__(self, num_of_stock, n=7):
+        super().__init__(num_of_stock, n)
+        self.block = np.zeros((self.n, self.num_of_stock))
+        self.prefix_min = np.zeros(self.num_of_stock)
+        self.prefix_max = np.zeros(self.num_of_stock)
+        # one extra row so that a window ending on a block's last day needs no special case
+        self.suffix_min = np.full((self.n + 1, self.num_of_stock), np.inf)
+        self.suffix_max = np.full((self.n + 1, self.num_of_stock), -np.inf)
+
+    def _update(self, prices):
+        position = self.count % self.n
+        self.block[position, :] = prices
+        if position == 0:
+            self.prefix_min = prices.copy()
+            self.prefix_max = prices.copy()
+        else:
+            np.minimum(self.prefix_min, prices, out=self.prefix_min)
+            np.maximum(self.prefix_max, prices, out=self.prefix_max)
+
+        lowest = np.minimum(self.suffix_min[position + 1, :], self.prefix_min)
+        highest = np.maximum(self.suffix_max[position + 1, :], self.prefix_max)
+
+        if position == self.n - 1:
+            # block is complete: its backward extremes serve the windows of the next block
+            self.suffix_min[:self.n, :] = np.minimum.accumulate(self.block[::-1, :], axis=0)[::-1, :]
+            self.suffix_max[:self.n, :] = np.maximum.accumulate(self.block[::-1, :], axis=0)[::-1, :]
+
+        delta = np.abs(prices - lowest)
+        delta_max = np.abs(highest - lowest)
+        # a flat window gives 1 (by limitation)
+        values = np.ones(self.num_of_stock)
+        np.divide(delta, delta_max, out=values, where=delta_max != 0)
+        return values
+
+
+class RSI(_StreamingIndicator):
+    '''
+    n-day RSI oscillator, as indicators.oscillator(osc_type='RSI').
+
+    Keeps the last n-1 daily differences in a ring, with running sums and
+    counts of the gains and losses, so each update is O(1) per stock.
+    '''
+    _arrays = _StreamingIndicator._arrays + ('last_price', 'diffs', 'pos_sum', 'neg_sum', 'pos_count', 'neg_count')
+
+    def __init__(self, num_of_stock, n=7):
+        super().__init__(num_of_stock, n)
+        self.last_price = np.zeros(self.num_of_stock)
+        self.diffs = np.zeros((max(self.n - 1, 1), self.num_of_stock)) # last n-1 differences, as a ring
+        self.pos_sum = np.zeros(self.num_of_stock)
+        self.neg_sum = np.zeros(self.num_of_stock)
+        self.pos_count = np.zeros(self.num_of_stock, dtype=int)
+        self.neg_count = np.zeros(self.num_of_stock, dtype=int)
+
+    def _update(self, prices):
+        if self.count > 0 and self.n > 1:
+            position = (self.count - 1) % (self.n - 1)
+            old = self.diffs[position, :]
+            new = prices - self.last_price
+            self.pos_sum += np.where(new > 0, new, 0) - np.where(old > 0, old, 0)
+            self.neg_sum += np.where(new < 0, new, 0) - np.where(old < 0, old, 0)
+            self.pos_count += (new > 0).astype(int) - (old > 0)
+            self.neg_count += (new < 0).astype(int) - (old < 0)
+            self.diffs[position, :] = new
+            if position == self.n - 2:
+                # re-add the differences once per period so rounding errors don't pile up
+                self.pos_sum = np.where(self.diffs > 0, self.diffs, 0).sum(axis=0)
+                self.neg_sum = np.where(self.diffs < 0, self.diffs, 0).sum(axis=0)
+        self.last_price = prices
+
+        # no losses gives 1, no gains gives 0 (by limitation)
+        values = np.ones(self.num_of_stock)
+        values[(self.neg_count > 0) & (self.pos_count == 0)] = 0
+        both = (self.pos_count > 0) & (self.neg_count > 0)
+        pos_aver = self.pos_sum[both] / self.pos_count[both]
+        neg_aver = np.abs(self.neg_sum[both] / self.neg_count[both])
+        values[both] = 1 - (1 / (1 + pos_aver / neg_aver))
+        return values